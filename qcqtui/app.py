@@ -1,39 +1,48 @@
+import argparse
+import functools
+import json
+import logging
 import sys
 import os
+import sqlite3
+import time
 
-# Matplotlib
-import matplotlib
-# Make sure that we are using QT5
-matplotlib.use('Qt5Agg')
-from matplotlib.figure import Figure
-
-# qcodes
-from qcodes.data.data_set import load_data
-from qcodes.data.data_array import DataArray
+# reference of the reported startup times
+_startTime = time.perf_counter()
 
 # PyQt
 from PyQt5 import QtCore, QtWidgets
-from PyQt5.QtWidgets import QMainWindow, QTextEdit, QAction, QApplication, QListWidget, QDockWidget, QFileDialog, QWidget
+from PyQt5.QtWidgets import QMainWindow, QTextEdit, QAction, QApplication, QListWidget, QDockWidget, QFileDialog, QWidget, QProgressBar, QPushButton, QInputDialog, QLabel
 from PyQt5.QtGui import QIcon, QPixmap, QColor, QPainter, QFont
-from PyQt5.QtCore import QSize, QRect, Qt, pyqtSignal
+from PyQt5.QtCore import QSize, QRect, Qt, QTimer, pyqtSignal
 
-from .widgets.xsection import CrossSectionWidget
+# matplotlib, qcodes and the modules using them take most of the startup
+# time, they are imported once the window is shown or when they are needed
 from .widgets.DataArrayListWidget import DataArrayListWidget
+from .worker import TaskExecutor
+
+# time the imports of this module took
+_importTime = time.perf_counter() - _startTime
+
+log = logging.getLogger(__name__)
 
 def getImageResourcePath(resource):
     return os.path.join(os.path.dirname(os.path.realpath(__file__)), '../data/', resource)
 
-def getIconFromLetter(letter, color):
-    pixmap = QPixmap(256,256)
+# icons are painted once per letter and color, at a size that is still
+# sharp in toolbars of high dpi screens
+@functools.lru_cache(maxsize=None)
+def getIconFromLetter(letter, color, size=64):
+    pixmap = QPixmap(size,size)
     # transparent background
     pixmap.fill(QColor('#00000000'))
     painter = QPainter(pixmap)
     painter.setPen(QColor(color));
     font = QFont()
-    font.setPixelSize(256)
+    font.setPixelSize(size)
     # painter.setFont(QFont("Decorative", 10));
     painter.setFont(font);
-    painter.drawText(QRect(0,0, 256,256), Qt.AlignCenter, letter);
+    painter.drawText(QRect(0,0, size,size), Qt.AlignCenter, letter);
     painter.end()
     icon = QIcon(pixmap)
     return icon
@@ -41,9 +50,13 @@ def getIconFromLetter(letter, color):
 
 class ApplicationWindow(QMainWindow):
     # http://pyqt.sourceforge.net/Docs/PyQt5/signals_slots.html
-    dataArrayChanged = pyqtSignal(DataArray, name='OnDataSetChanged')
+    # emits the DataArray to show
+    dataArrayChanged = pyqtSignal(object, name='OnDataSetChanged')
+    # the window and the data set it was opened with are shown, with the
+    # startup times in seconds
+    startupFinished = pyqtSignal(dict)
 
-    def __init__(self, dataset, rotateCrossSection=False):
+    def __init__(self, dataset=None, rotateCrossSection=False):
         # TODO: make a better solution for rotateCrossSection, so
         # it does not have to be passed on to the widget
         QtWidgets.QMainWindow.__init__(self)
@@ -65,6 +78,47 @@ class ApplicationWindow(QMainWindow):
         file_open_action.setShortcut('Ctrl+o')
         file_open_action.triggered.connect(self.onOpenFile)
 
+        follow_action = QAction('Follow measurement', self)
+        follow_action.setStatusTip('Open a data file that is still being written '+
+                                   'and update the plots as data is added')
+        follow_action.triggered.connect(self.onFollowFile)
+
+        open_run_action = QAction('Open run from database', self)
+        open_run_action.setStatusTip('Open a run of a QCoDeS database, '+
+                                     'and follow it while it is being written')
+        open_run_action.triggered.connect(self.onOpenRun)
+
+        subscribe_action = QAction('Subscribe to measurement', self)
+        subscribe_action.setStatusTip('Show a measurement that is published to shared memory '+
+                                      'by a running measurement script')
+        subscribe_action.triggered.connect(self.onSubscribe)
+
+        stop_follow_action = QAction('Stop following', self)
+        stop_follow_action.triggered.connect(self.onStopFollowing)
+
+        clear_cache_action = QAction('Clear cache', self)
+        clear_cache_action.setStatusTip('Remove the binary copies of opened data sets')
+        clear_cache_action.triggered.connect(self.onClearCache)
+
+        frame_times_action = QAction('Show frame times', self, checkable=True)
+        frame_times_action.setStatusTip('Show the frame rate and the latency of the '+
+                                        'mouse events in the status bar')
+        frame_times_action.toggled.connect(self.onShowFrameTimes)
+
+        save_latency_action = QAction('Save latency statistics', self)
+        save_latency_action.setStatusTip('Save the recorded timings of the event '+
+                                         'handlers and redraws to a file')
+        save_latency_action.triggered.connect(self.onSaveLatency)
+
+        profile_action = QAction('Profile next events', self)
+        profile_action.setStatusTip('Profile the handling of the next events with cProfile')
+        profile_action.triggered.connect(self.onProfileEvents)
+
+        compare_action = QAction('Compare arrays', self)
+        compare_action.setStatusTip('Show the selected arrays, or all arrays measured at '+
+                                    'the same setpoints, with linked cursors and zoom')
+        compare_action.triggered.connect(self.onCompareArrays)
+
         about_action = QAction(QIcon(getImageResourcePath('about.png')), 'About' , self)
         about_action.triggered.connect(self.onAbout)
 
@@ -73,6 +127,11 @@ class ApplicationWindow(QMainWindow):
         self.file_menu = QtWidgets.QMenu('&File', self)
         self.menuBar().addMenu(self.file_menu)
         self.file_menu.addAction(file_open_action)
+        self.file_menu.addAction(open_run_action)
+        self.file_menu.addAction(follow_action)
+        self.file_menu.addAction(subscribe_action)
+        self.file_menu.addAction(stop_follow_action)
+        self.file_menu.addAction(clear_cache_action)
         self.file_menu.addSeparator()
         self.file_menu.addAction(quit_action)
 
@@ -82,6 +141,12 @@ class ApplicationWindow(QMainWindow):
 
         view_menu = QtWidgets.QMenu('&View', self)
         self.menuBar().addMenu(view_menu)
+        view_menu.addAction(compare_action)
+        view_menu.addSeparator()
+        view_menu.addAction(frame_times_action)
+        view_menu.addAction(save_latency_action)
+        view_menu.addAction(profile_action)
+        view_menu.addSeparator()
 
         # help
         self.help_menu = QtWidgets.QMenu('&Help', self)
@@ -138,6 +203,29 @@ class ApplicationWindow(QMainWindow):
         addTool('restore', 'restore', 'Ctrl+r',
                 'restore data',
                 icon=QIcon(getImageResourcePath('restore.png')))
+        addTool('polynomialFit', 'Polynomial background', '',
+                'Substract a polynomial background fitted to the selected region')
+        addTool('lineFit', 'Line fit', '',
+                'Substract a polynomial fitted to every line, within the '+
+                'selected region if there is one')
+        addTool('crop', 'Crop', '',
+                'Only show the selected region')
+        addTool('levelRows', 'Level rows', '',
+                'Substract the median of every row')
+        addTool('levelColumns', 'Level columns', '',
+                'Substract the median of every column')
+        addTool('derivativeX', 'Derivative x', '',
+                'Differentiate the data along the x axis')
+        addTool('derivativeY', 'Derivative y', '',
+                'Differentiate the data along the y axis')
+        addTool('smooth', 'Smooth', '',
+                'Smooth the data with a gaussian filter')
+        addTool('offsetScale', 'Offset and scale', '',
+                'Scale the data and add an offset')
+        addTool('undo', 'Undo', 'Ctrl+z',
+                'Undo the last processing step')
+        addTool('redo', 'Redo', 'Ctrl+y',
+                'Redo the last undone processing step')
         addTool('SavePlotsPDF', 'Save all plots as pdf', 'Ctrl+s',
                 ''+
                 '',
@@ -146,6 +234,10 @@ class ApplicationWindow(QMainWindow):
                 ''+
                 '',
                 icon=QIcon(getImageResourcePath('savePng.png')))
+        addTool('SavePlotsMultipage', 'Save all plots as one pdf', '',
+                'Save all plots to a single pdf with one page per plot')
+        addTool('SaveXSectionData', 'Save cross section data', '',
+                'Save the data of the cross sections as arrays to a .npz file')
         # Widgets
 
         # Data array dock
@@ -167,16 +259,53 @@ class ApplicationWindow(QMainWindow):
                                     QtWidgets.QSizePolicy.Expanding)
         l.addWidget(qt_toolbar)
 
-
-        self.cross_section_widget = CrossSectionWidget(self.dataArrayChanged,
-                                                       qt_toolbar, tools=tools,
-                                                       rotateCrossSection = rotateCrossSection)
-        l.addWidget(cw)
+        # the cross section widget and the processing dock are created by
+        # createPlotWidgets once the window is shown
+        self.cross_section_widget = None
+        self.pipeline_widget = None
+        self._plotWidgetArgs = (l, qt_toolbar, tools, rotateCrossSection)
 
         self.main_widget.setFocus()
 
+        # loading of data sets, with progress and cancel button in the
+        # status bar while a data set is loading
+        self.loader = TaskExecutor(self)
+        # binary copies of parsed data sets for reopening them quickly,
+        # created when a data set is opened first
+        self._cache = None
+        # polls the data file or the shared memory of a running measurement
+        self.follower = None
+        self.loader.progress.connect(lambda name, percent: self.progress_bar.setValue(percent))
+        self.loader.finished.connect(self.onLoadingDone)
+        self.loader.failed.connect(self.onLoadingFailed)
+        self.progress_bar = QProgressBar()
+        self.progress_bar.setMaximumWidth(200)
+        self.progress_bar.setRange(0, 100)
+        self.cancel_button = QPushButton('Cancel')
+        self.cancel_button.clicked.connect(self.onCancelLoading)
+        self.statusBar().addPermanentWidget(self.progress_bar)
+        self.statusBar().addPermanentWidget(self.cancel_button)
+        self.progress_bar.hide()
+        self.cancel_button.hide()
+
+        # frame rate and latency overlay, updated while shown
+        self.frame_times_label = QLabel()
+        self.statusBar().addPermanentWidget(self.frame_times_label)
+        self.frame_times_label.hide()
+        self.frame_times_timer = QTimer(self)
+        self.frame_times_timer.setInterval(500)
+        self.frame_times_timer.timeout.connect(self.onUpdateFrameTimes)
+
         self.statusBar().showMessage("Starting", 2000)
-        self.data_array_widget.loadDataSet(dataset)
+        # the data set is shown once the window is on screen, so that the
+        # window does not wait for plotting it
+        self._initialDataSet = dataset
+        # times since the import of this module until the window and the
+        # first data array are shown
+        self.startupTimes = {'imports': _importTime}
+        self._startupDataPending = dataset is not None
+        self._startupReported = False
+        self.dataArrayChanged.connect(self._onFirstDataArray)
 
         # Cross Section Widget
         # # find first meassured dataset
@@ -185,17 +314,262 @@ class ApplicationWindow(QMainWindow):
         #         first_data_array = data_array
         #         break
 
+    # startup
+    def showEvent(self, event):
+        QMainWindow.showEvent(self, event)
+        if 'window' not in self.startupTimes:
+            self.startupTimes['window'] = time.perf_counter() - _startTime
+            # after the window has been painted
+            QTimer.singleShot(0, self._onShown)
+
+    def _onShown(self):
+        self.createPlotWidgets()
+        dataset, self._initialDataSet = self._initialDataSet, None
+        if dataset is not None:
+            self.data_array_widget.loadDataSet(dataset)
+        self._checkStartup()
+
+    def createPlotWidgets(self):
+        """Create the cross section widget and the processing dock, if they
+        do not exist yet."""
+        if self.cross_section_widget is not None:
+            return
+        from .widgets.xsection import CrossSectionWidget
+        from .widgets.PipelineWidget import PipelineWidget
+        l, qt_toolbar, tools, rotateCrossSection = self._plotWidgetArgs
+        self.cross_section_widget = CrossSectionWidget(self.dataArrayChanged,
+                                                       qt_toolbar, tools=tools,
+                                                       rotateCrossSection = rotateCrossSection)
+        self.cross_section_widget.statusMessage.connect(self.statusBar().showMessage)
+
+        # Processing dock, listing the stages applied to the data
+        self.pipeline_widget = PipelineWidget(self.cross_section_widget)
+        pipeline_dock = QDockWidget("Processing", self)
+        pipeline_dock.setWidget(self.pipeline_widget)
+        pipeline_dock.setFloating(False)
+        self.addDockWidget(Qt.LeftDockWidgetArea, pipeline_dock)
+        l.addWidget(self.cross_section_widget)
+        self.startupTimes['plot'] = time.perf_counter() - _startTime
+
+    @property
+    def cache(self):
+        if self._cache is None:
+            from .datacache import DataSetCache
+            self._cache = DataSetCache()
+        return self._cache
+
+    def _loadDataSet(self, dataset):
+        # a data set may be loaded before the window has been shown
+        self.createPlotWidgets()
+        self.data_array_widget.loadDataSet(dataset)
+
+    def _onFirstDataArray(self, dataArray):
+        self.dataArrayChanged.disconnect(self._onFirstDataArray)
+        self.startupTimes['data'] = time.perf_counter() - _startTime
+        self._startupDataPending = False
+        self._checkStartup()
+
+    def _checkStartup(self):
+        if (self._startupReported or self._startupDataPending or
+                'plot' not in self.startupTimes):
+            return
+        self._startupReported = True
+        self.statusBar().showMessage("Started in {:.2f} s".format(
+            max(self.startupTimes.values())), 5000)
+        self.startupFinished.emit(dict(self.startupTimes))
+
     # events
     def onOpenFile(self):
         options = QFileDialog.Options()
         # options |= QFileDialog.DontUseNativeDialog
         fileName, _ = QFileDialog.getOpenFileName(self,"QFileDialog.getOpenFileName()", "","All Files (*);;Dataset Files (*.dat)", options=options)
         if fileName:
-            dataset = load_data(location=fileName)
-            self.data_array_widget.loadDataSet(dataset)
+            self.openFile(fileName)
+
+    def openFile(self, fileName):
+        """Load a data set in the background and show it."""
+        if not self._startupReported:
+            self._startupDataPending = True
+        self.onStopFollowing()
+        self.statusBar().showMessage("Loading {}".format(fileName))
+        self.progress_bar.setValue(0)
+        self.progress_bar.show()
+        self.cancel_button.show()
+        from .loader import loadDataSet
+        # the list is filled as soon as the arrays are known and
+        # updated once all values have been read
+        self.loader.submit('load', loadDataSet, fileName, cache=self.cache,
+                           onPartial=self.data_array_widget.loadMetadata,
+                           onResult=self._loadDataSet)
+
+    def onFollowFile(self):
+        fileName, _ = QFileDialog.getOpenFileName(self, "Follow measurement", "", "Dataset Files (*.dat);;All Files (*)")
+        if fileName:
+            from .follow import DataSetFollower
+            self.onStopFollowing()
+            self.loader.cancel('load')
+            self.follower = DataSetFollower(fileName, parent=self)
+            self.follower.started.connect(self._loadDataSet)
+            self.follower.updated.connect(
+                lambda start, stop: self.cross_section_widget.refreshData((start, stop)))
+            self.follower.start()
+            self.statusBar().showMessage("Following {}".format(fileName))
+
+    def onOpenRun(self):
+        fileName, _ = QFileDialog.getOpenFileName(self, "Open run from database", "", "Database Files (*.db);;All Files (*)")
+        if not fileName:
+            return
+        runId, ok = QInputDialog.getInt(self, "Open run from database", "Run ID:", 1, 1)
+        if not ok:
+            return
+        from .database import RunFollower
+        try:
+            follower = RunFollower(fileName, runId, parent=self)
+        except (ValueError, sqlite3.Error) as e:
+            self.statusBar().showMessage("Could not open run {}: {}".format(runId, e), 5000)
+            return
+        self.onStopFollowing()
+        self.loader.cancel('load')
+        self.follower = follower
+        self.follower.started.connect(self._loadDataSet)
+        self.follower.updated.connect(
+            lambda start, stop: self.cross_section_widget.refreshData((start, stop)))
+        self.follower.finished.connect(
+            lambda: self.statusBar().showMessage("Run {} loaded".format(runId), 5000))
+        self.follower.start()
+        self.statusBar().showMessage("Loading run {} of {}".format(runId, fileName))
+
+    def onSubscribe(self):
+        name, ok = QInputDialog.getText(self, "Subscribe to measurement", "Name of the publisher:")
+        if ok and name:
+            from .sharedmem import SharedDataSubscriber
+            try:
+                subscriber = SharedDataSubscriber(name, parent=self)
+            except FileNotFoundError:
+                self.statusBar().showMessage("No measurement published as {}".format(name), 5000)
+                return
+            self.onStopFollowing()
+            self.loader.cancel('load')
+            self.follower = subscriber
+            self.follower.started.connect(self._loadDataSet)
+            self.follower.updated.connect(
+                lambda start, stop: self.cross_section_widget.refreshData((start, stop)))
+            self.follower.closed.connect(
+                lambda: self.statusBar().showMessage("Measurement {} finished".format(name), 5000))
+            self.follower.start()
+            self.statusBar().showMessage("Following {}".format(name))
+
+    def onStopFollowing(self):
+        if self.follower is not None:
+            self.follower.stop()
+            self.follower.deleteLater()
+            self.follower = None
+            self.statusBar().showMessage("Stopped following", 2000)
+
+    def onClearCache(self):
+        self.cache.clear()
+        self.statusBar().showMessage("Cache cleared", 2000)
+
+    def onCompareArrays(self):
+        from matplotlib.backends.backend_qt5 import NavigationToolbar2QT as NavigationToolbar
+        from .widgets.multiview import MultiArrayWidget, sharedSetpointArrays
+        arrays = self.data_array_widget.selectedDataArrays()
+        if len(arrays) < 2:
+            arrays = sharedSetpointArrays(self.data_array_widget.dataArrays.values())
+        if not arrays:
+            self.statusBar().showMessage("No arrays to compare", 2000)
+            return
+        window = QWidget(self, Qt.Window)
+        window.setAttribute(Qt.WA_DeleteOnClose)
+        window.setWindowTitle("Compare " + ", ".join(a.name for a in arrays))
+        try:
+            widget = MultiArrayWidget(arrays, window)
+        except ValueError as e:
+            window.close()
+            self.statusBar().showMessage(str(e), 5000)
+            return
+        l = QtWidgets.QVBoxLayout(window)
+        l.addWidget(NavigationToolbar(widget, window))
+        l.addWidget(widget)
+        window.resize(1000, min(250 * len(arrays), 1000))
+        window.show()
+
+    def onShowFrameTimes(self, show):
+        self.frame_times_label.setVisible(show)
+        if show:
+            self.onUpdateFrameTimes()
+            self.frame_times_timer.start()
+        else:
+            self.frame_times_timer.stop()
+
+    def _latency(self):
+        # the LatencyRecorder of the plot widgets, which are created once
+        # the window is shown
+        if self.cross_section_widget is None:
+            self.statusBar().showMessage("No plot yet", 2000)
+            return None
+        return self.cross_section_widget.latency
+
+    def onUpdateFrameTimes(self):
+        if self.cross_section_widget is None:
+            self.frame_times_label.setText("no plot yet")
+            return
+        latency = self.cross_section_widget.latency
+        fps, frameTime, draws, drawTime = latency.frameStats()
+        mouseMove = latency.latest('mouse move')
+        text = "{:.0f} fps, frame {:.1f} ms, {:.0f} redraws/s, redraw {:.1f} ms".format(
+            fps, frameTime * 1e3, draws, drawTime * 1e3)
+        if mouseMove is not None:
+            text += ", mouse move {:.1f} ms".format(mouseMove * 1e3)
+        if latency.isProfiling():
+            text += ", profiling"
+        self.frame_times_label.setText(text)
+
+    def onSaveLatency(self):
+        latency = self._latency()
+        if latency is None:
+            return
+        fileName, _ = QFileDialog.getSaveFileName(self, "Save latency statistics", "latency.json", "JSON Files (*.json);;All Files (*)")
+        if fileName:
+            latency.dump(fileName)
+            self.statusBar().showMessage("Saved {}".format(fileName), 2000)
+
+    def onProfileEvents(self):
+        latency = self._latency()
+        if latency is None:
+            return
+        n, ok = QInputDialog.getInt(self, "Profile next events", "Number of events:", 100, 1)
+        if not ok:
+            return
+        fileName, _ = QFileDialog.getSaveFileName(self, "Save profile", "events.prof", "Profiles (*.prof);;All Files (*)")
+        if fileName:
+            latency.profileNext(n, fileName)
+            self.statusBar().showMessage("Profiling the next {} events".format(n), 2000)
+
+    def onCancelLoading(self):
+        self.loader.cancel('load')
+        self.data_array_widget.cancelLoading()
+        self.onLoadingDone('load')
+        self.statusBar().showMessage("Loading cancelled", 2000)
+
+    def onLoadingDone(self, name):
+        self.progress_bar.hide()
+        self.cancel_button.hide()
+        self.statusBar().clearMessage()
+        # a data set given at startup may fail to load
+        self._startupDataPending = False
+        self._checkStartup()
+
+    def onLoadingFailed(self, name, message):
+        log.error('loading failed\n{}'.format(message))
+        self.data_array_widget.cancelLoading()
+        self.onLoadingDone(name)
+        self.statusBar().showMessage("Loading failed", 5000)
 
 
     def onQuit(self):
+        self.loader.cancelAll()
+        self.onStopFollowing()
         self.close()
 
     def closeEvent(self, ce):
@@ -204,3 +578,31 @@ class ApplicationWindow(QMainWindow):
     def onAbout(self):
         QtWidgets.QMessageBox.about(self, "About", "QCoDeS Qt Ui v0.2" )
 
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Interactive plots of QCoDeS data sets.')
+    parser.add_argument('location', nargs='?', default=None,
+                        help='data set to open')
+    parser.add_argument('--rotate', action='store_true',
+                        help='show the cross section along y rotated')
+    parser.add_argument('--report-startup', action='store_true',
+                        help='print the startup times in seconds as JSON and '
+                             'quit once the window and the data set are shown')
+    args = parser.parse_args(argv)
+
+    app = QApplication.instance() or QApplication(sys.argv[:1])
+    window = ApplicationWindow(rotateCrossSection=args.rotate)
+    if args.report_startup:
+        def report(times):
+            print(json.dumps(times))
+            QTimer.singleShot(0, app.quit)
+        window.startupFinished.connect(report)
+    window.show()
+    if args.location:
+        window.openFile(args.location)
+    return app.exec_()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
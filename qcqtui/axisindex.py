@@ -0,0 +1,111 @@
+import numpy as np
+
+
+class AxisIndex:
+    """Maps values to the index of the nearest setpoint of an axis.
+
+    The lookup strategy is chosen once when the index is built:
+    uniformly spaced axes use closed form arithmetic, monotonic axes a
+    binary search and any other axis, e.g. of a back and forth sweep, a
+    binary search on a sorted permutation. For non uniform axes setpoints
+    that are not finite, e.g. of an interrupted sweep, are never returned.
+
+    The setpoints of a sweep that is still running are NaN after the
+    ones reached so far. If the reached ones are uniformly spaced, the
+    axis is treated as uniform and the remaining setpoints are
+    extrapolated, so that indices of setpoints that are not reached yet
+    are returned as well.
+
+    Args:
+        axis: 1D array of setpoints
+    """
+    def __init__(self, axis):
+        self.axis = np.asarray(axis, dtype=float)
+        self.values = self.axis
+        self._order = None
+        self._start = None
+        self._step = None
+        finite = np.isfinite(self.axis)
+        numFinite = len(self.axis) if finite.all() else int(np.argmin(finite))
+        # only the first numFinite setpoints are known
+        partial = numFinite < len(self.axis) and not finite[numFinite:].any()
+        prefix = self.axis[:numFinite]
+        diff = np.diff(prefix)
+        if numFinite < 2 and (partial or numFinite == len(self.axis)):
+            self.kind = 'uniform'
+            self._start = prefix[0] if numFinite else 0.0
+            self._step = 0.0
+        elif ((partial or numFinite == len(self.axis)) and
+              (np.all(diff > 0) or np.all(diff < 0))):
+            step = (prefix[-1] - prefix[0]) / (numFinite - 1)
+            if np.allclose(diff, step, rtol=1e-6, atol=0):
+                self.kind = 'uniform'
+                self._start = prefix[0]
+                self._step = step
+            elif partial:
+                self._setUnsorted(finite)
+            else:
+                self.kind = 'monotonic'
+                # searchsorted needs an increasing axis
+                self._order = np.arange(len(self.axis))
+                if diff[0] < 0:
+                    self._order = self._order[::-1]
+                self._sorted = self.axis[self._order]
+        else:
+            self._setUnsorted(finite)
+        if self.kind == 'uniform' and partial:
+            self.values = self._start + self._step * np.arange(len(self.axis))
+
+    def _setUnsorted(self, finite):
+        self.kind = 'unsorted'
+        indices = np.flatnonzero(finite)
+        self._order = indices[np.argsort(self.axis[indices], kind='mergesort')]
+        self._sorted = self.axis[self._order]
+
+    def __len__(self):
+        return len(self.axis)
+
+    def index(self, value):
+        """Index of the setpoint nearest to value. Accepts scalars and
+        arrays."""
+        value = np.asarray(value, dtype=float)
+        if self.kind == 'uniform':
+            if self._step == 0:
+                index = np.zeros(value.shape, dtype=int)
+            else:
+                # round half down, which matches the first minimum of argmin
+                index = np.ceil((value - self._start) / self._step - 0.5)
+                index = np.clip(index, 0, len(self.axis) - 1).astype(int)
+        else:
+            if len(self._sorted) == 0:
+                index = np.zeros(value.shape, dtype=int)
+            else:
+                right = np.searchsorted(self._sorted, value)
+                right = np.clip(right, 0, len(self._sorted) - 1)
+                left = np.maximum(right - 1, 0)
+                useRight = (np.abs(self._sorted[right] - value) <
+                            np.abs(self._sorted[left] - value))
+                index = self._order[np.where(useRight, right, left)]
+        if index.ndim == 0:
+            return int(index)
+        return index
+
+    def sameGrid(self, other):
+        """Whether other maps to the same setpoints. The extrapolated
+        setpoints of a running sweep change by rounding with every new
+        setpoint, uniform axes are compared by their start and step
+        relative to the step."""
+        if self.kind != other.kind or len(self) != len(other):
+            return False
+        if self.kind != 'uniform':
+            return np.array_equal(self.values, other.values, equal_nan=True)
+        if self._step == 0 or other._step == 0:
+            return self._step == other._step and self._start == other._start
+        return bool(np.isclose(self._step, other._step, rtol=1e-6, atol=0) and
+                    np.isclose(self._start, other._start, rtol=0,
+                               atol=1e-6 * abs(self._step)))
+
+    def value(self, index):
+        """Setpoint at index, extrapolated if it has not been reached yet by
+        a running sweep."""
+        return self.values[index]
@@ -0,0 +1,243 @@
+"""Render overview plots of all data sets in a directory without a window.
+
+For every measured 2D array of every data set the main map, orthogonal
+cross sections at the given positions and the summed projections are
+saved, using the plotting of the CrossSectionWidget on an offscreen canvas.
+The data sets are rendered in parallel by a pool of processes. Runs whose
+outputs are newer than their data and were rendered with the same options
+are skipped.
+
+Usage:
+    python -m qcqtui.batch DATADIR OUTDIR [--x X ...] [--y Y ...]
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+# name of the file in the output directory of a run recording what it was
+# rendered from
+stampName = '.batch.json'
+
+# size of the rendered figure in inches, the main map and the cross
+# sections each take a quarter of it
+figureSize = (12, 9)
+
+# the widget and the signal it receives data arrays from, one per process
+_widget = None
+_signals = None
+
+
+def findRuns(directory, exclude=None):
+    """Directories below directory that contain data files of the
+    GNUPlot format, sorted by path.
+
+    Args:
+        directory: the directory to search
+        exclude: directory that is not searched, like the output directory
+    """
+    exclude = None if exclude is None else os.path.abspath(exclude)
+    runs = []
+    for path, dirnames, filenames in os.walk(directory):
+        dirnames[:] = sorted(d for d in dirnames
+                             if os.path.abspath(os.path.join(path, d)) != exclude)
+        if any(f.endswith('.dat') for f in filenames):
+            runs.append(path)
+    return runs
+
+
+def _sourceTime(location):
+    # modification time of the newest file of a run
+    times = [os.path.getmtime(os.path.join(location, f))
+             for f in os.listdir(location)
+             if os.path.isfile(os.path.join(location, f))]
+    return max(times, default=0)
+
+
+def _readStamp(outdir):
+    try:
+        with open(os.path.join(outdir, stampName)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def isUpToDate(location, outdir, options):
+    """Whether the outputs of a run exist, were rendered with the same
+    options and are not older than its data."""
+    stamp = _readStamp(outdir)
+    if stamp is None or stamp.get('options') != options:
+        return False
+    if _sourceTime(location) > stamp.get('sourceTime', 0):
+        return False
+    return all(os.path.exists(os.path.join(outdir, f))
+               for f in stamp.get('files', []))
+
+
+def _initWorker():
+    # every process of the pool renders with its own application and
+    # widget on an offscreen canvas
+    global _widget, _signals
+    os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    from PyQt5.QtCore import QObject, pyqtSignal
+    from PyQt5.QtWidgets import QApplication
+    from .widgets.xsection import CrossSectionWidget
+
+    class Signals(QObject):
+        dataArrayChanged = pyqtSignal(object)
+
+    if QApplication.instance() is None:
+        # kept alive as attribute of the module
+        _initWorker.app = QApplication([])
+    _signals = Signals()
+    # without an event loop the tasks have to run in the calling thread
+    # and there is nothing to blit onto
+    _widget = CrossSectionWidget(_signals.dataArrayChanged, None,
+                                 useBlit=False, synchronous=True)
+    _widget.fig.set_size_inches(*figureSize)
+
+
+def _measuredArrays(dataSet, names=None):
+    # the measured 2D arrays as (name, array), optionally only those whose
+    # name or array id is listed
+    for arrayId, array in dataSet.arrays.items():
+        if array.is_setpoint or array.ndarray is None or array.ndarray.ndim != 2:
+            continue
+        if names and arrayId not in names and array.name not in names:
+            continue
+        yield arrayId, array
+
+
+def _export(axes, saveformat):
+    from .export import FigureExporter
+    return FigureExporter(_widget.fig, axes).save(saveformat)
+
+
+def _renderArray(dataArray, prefix, options):
+    widget = _widget
+    widget.onDataArrayChange(dataArray)
+    widget.onToolChange('OrthoXSection')
+    config = widget.traces[0]['config']
+    xindex, yindex = config['xindex'], config['yindex']
+    center = [len(config['xaxis']) // 2, len(config['yaxis']) // 2]
+    xs, ys = options['x'], options['y']
+    if not xs and not ys:
+        xs = [xindex.value(center[0])]
+        ys = [yindex.value(center[1])]
+
+    filenames = []
+    # cuts along y at the given x values are shown in the right plot,
+    # cuts along x at the given y values in the lower one
+    cuts = ([('y', 'x', xindex.index(x), 0) for x in xs] +
+            [('x', 'y', yindex.index(y), 1) for y in ys])
+    for i, (key, axis, index, coordinate) in enumerate(cuts):
+        pos = list(center)
+        pos[coordinate] = index
+        widget.orhtoXSectionPos = pos
+        widget._updateXSections()
+        value = config[axis + 'index'].value(index)
+        axes = [(widget.axes[key], '{}_cut_{}={:g}'.format(prefix, axis, value))]
+        if i == 0:
+            # the main map is cut out of the same rendering
+            axes.append((widget.axes['main'], prefix + '_main'))
+        filenames += _export(axes, options['format'])
+
+    widget.onToolChange('sumXSection')
+    filenames += _export([(widget.axes['x'], prefix + '_sum_x'),
+                          (widget.axes['y'], prefix + '_sum_y')],
+                         options['format'])
+    return filenames
+
+
+def renderRun(location, outdir, options):
+    """Render all measured 2D arrays of a data set and record the outputs
+    in the stamp file of outdir.
+
+    Returns:
+        list of the saved file names
+    """
+    from .loader import loadDataSet
+    if _widget is None:
+        _initWorker()
+    sourceTime = _sourceTime(location)
+    dataSet = loadDataSet(location)
+    os.makedirs(outdir, exist_ok=True)
+    filenames = []
+    for name, dataArray in _measuredArrays(dataSet, options['arrays']):
+        filenames += _renderArray(dataArray, os.path.join(outdir, name), options)
+    with open(os.path.join(outdir, stampName), 'w') as f:
+        json.dump({'options': options, 'sourceTime': sourceTime,
+                   'files': [os.path.relpath(f, outdir) for f in filenames]}, f)
+    return filenames
+
+
+def renderDirectory(datadir, outdir, options, jobs=None, force=False):
+    """Render all runs below datadir to the same relative paths below
+    outdir, by a pool of jobs processes.
+
+    Returns:
+        dict of the runs that failed with their error messages
+    """
+    runs = []
+    for location in findRuns(datadir, exclude=outdir):
+        target = os.path.join(outdir, os.path.relpath(location, datadir))
+        if not force and isUpToDate(location, target, options):
+            print('up to date: {}'.format(location))
+            continue
+        runs.append((location, target))
+    if not runs:
+        return {}
+
+    failed = dict()
+    # spawned processes do not inherit the state of Qt from this one
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=jobs, mp_context=context,
+                             initializer=_initWorker) as pool:
+        futures = {pool.submit(renderRun, location, target, options): location
+                   for location, target in runs}
+        for future in as_completed(futures):
+            location = futures[future]
+            try:
+                filenames = future.result()
+            except Exception:
+                failed[location] = traceback.format_exc()
+                print('failed: {}\n{}'.format(location, failed[location]))
+            else:
+                print('rendered: {} ({} files)'.format(location, len(filenames)))
+    return failed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Render the maps, cross sections and projections of all '
+                    'data sets in a directory.')
+    parser.add_argument('datadir', help='directory containing the data sets')
+    parser.add_argument('outdir', help='directory the plots are saved to')
+    parser.add_argument('--x', type=float, action='append', default=[],
+                        help='x value of a cross section along y, may be '
+                             'given several times')
+    parser.add_argument('--y', type=float, action='append', default=[],
+                        help='y value of a cross section along x, may be '
+                             'given several times')
+    parser.add_argument('--format', default='png',
+                        help='file format of the plots (default: png)')
+    parser.add_argument('--arrays', nargs='+', default=None,
+                        help='names of the arrays to render (default: all)')
+    parser.add_argument('--jobs', type=int, default=None,
+                        help='number of processes (default: number of CPUs)')
+    parser.add_argument('--force', action='store_true',
+                        help='render runs whose plots are up to date')
+    args = parser.parse_args(argv)
+
+    options = {'x': args.x, 'y': args.y, 'format': args.format,
+               'arrays': args.arrays}
+    failed = renderDirectory(args.datadir, args.outdir, options,
+                             jobs=args.jobs, force=args.force)
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,328 @@
+"""Benchmarks of the interactive operations of the CrossSectionWidget and
+of the startup of the application.
+
+Synthetic data arrays of increasing size are shown in a widget on an
+offscreen canvas. For every operation the latency and the peak memory
+allocated while it runs are measured, the mouse movement is measured per
+rendered frame. The results are saved as JSON together with the versions
+of the libraries, so that runs of different versions can be compared.
+
+Usage:
+    python -m qcqtui.benchmark [--sizes 50 200 ...] [--output FILE]
+                               [--compare FILE]
+"""
+import argparse
+import itertools
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+defaultSizes = [50, 200, 1000, 4000]
+
+# an operation is counted as regression if it got slower by more than this
+# fraction
+defaultThreshold = 0.2
+
+
+def makeDataArray(nx, ny, seed=0):
+    """A measured DataArray of ny x nx values on a uniform grid, with
+    structure on all scales and some noise."""
+    from qcodes.data.data_array import DataArray
+    x = np.linspace(-3, 3, nx)
+    y = np.linspace(-3, 3, ny)
+    Y = DataArray('y', label='y', unit='V', preset_data=y, is_setpoint=True)
+    X = DataArray('x', label='x', unit='V', preset_data=np.tile(x, (ny, 1)),
+                  is_setpoint=True, set_arrays=(Y,))
+    xx, yy = np.meshgrid(x, y)
+    z = ((1 - xx/2 + xx**5 + yy**3) * np.exp(-xx**2 - yy**2) + 0.1 * xx + 0.2 * yy +
+         0.01 * np.random.default_rng(seed).standard_normal((ny, nx)))
+    return DataArray('z', label='z', unit='A', preset_data=z, set_arrays=(Y, X))
+
+
+def _measure(func, repeat):
+    # peak memory of a first call, which also warms up caches, timings of
+    # the following calls that are not slowed down by tracing
+    tracemalloc.start()
+    base = tracemalloc.get_traced_memory()[0]
+    func()
+    peak = tracemalloc.get_traced_memory()[1] - base
+    tracemalloc.stop()
+    times = []
+    for i in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return {'median': float(np.median(times)), 'min': float(min(times)),
+            'max': float(max(times)), 'repeat': repeat, 'peakMemory': int(peak)}
+
+
+class WidgetBenchmark:
+    """Runs the operations on a CrossSectionWidget shown offscreen.
+
+    Args:
+        repeat: number of calls of every operation
+        frames: number of simulated mouse movements
+        size: size of the widget in pixels
+    """
+    def __init__(self, repeat=5, frames=50, size=(1200, 900)):
+        os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+        from PyQt5.QtCore import QObject, pyqtSignal
+        from PyQt5.QtWidgets import QApplication
+        from .widgets.xsection import CrossSectionWidget
+
+        class Signals(QObject):
+            dataArrayChanged = pyqtSignal(object)
+
+        self.app = QApplication.instance() or QApplication([])
+        self.signals = Signals()
+        self.repeat = repeat
+        self.frames = frames
+        # the tasks are run in the calling thread, so that they are part of
+        # the measured latency
+        self.widget = CrossSectionWidget(self.signals.dataArrayChanged, None,
+                                         synchronous=True)
+        self.widget.resize(*size)
+        self.widget.show()
+        self.app.processEvents()
+
+    def _positions(self, n, shape):
+        # positions in index coordinates spread over the array
+        rng = np.random.default_rng(1)
+        return np.column_stack([rng.integers(0, shape[1], n),
+                                rng.integers(0, shape[0], n)])
+
+    def _moveEvents(self, n):
+        # mouse events on the main axes at positions spread over it
+        from matplotlib.backend_bases import MouseEvent
+        w = self.widget
+        ax = w.axes['main']
+        (x0, x1), (y0, y1) = sorted(ax.get_xlim()), sorted(ax.get_ylim())
+        t = np.linspace(0.05, 0.95, n)
+        events = []
+        for u, v in zip(t, (t * 7) % 1 * 0.9 + 0.05):
+            px, py = ax.transData.transform((x0 + u * (x1 - x0), y0 + v * (y1 - y0)))
+            events.append(MouseEvent('motion_notify_event', w, px, py))
+        return events
+
+    def run(self, size):
+        """Measure all operations for an array of size x size values.
+
+        Returns:
+            dict of the results per operation
+        """
+        from . import processing
+        w = self.widget
+        dataArray = makeDataArray(size, size)
+        results = dict()
+
+        def showDataArray():
+            # as onDataArrayChange for an array with other setpoints, which
+            # would otherwise only swap the data after the first call
+            w.onToolChange('None')
+            w.showDataArray(dataArray)
+        results['showDataArray'] = _measure(showDataArray, self.repeat)
+
+        # switching back and forth between two channels of the same sweep
+        channels = itertools.cycle([makeDataArray(size, size, seed=1), dataArray])
+        results['swapDataArray'] = _measure(
+            lambda: w.onDataArrayChange(next(channels)), self.repeat)
+        w.onToolChange('None')
+        w.showDataArray(dataArray)
+        results['render'] = _measure(w.draw, self.repeat)
+
+        def draw3DData():
+            w._mesh.remove()
+            w.draw3DData(w.axes['main'])
+        results['draw3DData'] = _measure(draw3DData, self.repeat)
+
+        w.onToolChange('OrthoXSection')
+        w.draw()
+        self.app.processEvents()
+        positions = iter(self._positions(self.repeat + 1, dataArray.shape))
+
+        def updateXSections():
+            w.orhtoXSectionPos = list(next(positions))
+            w._updateXSections()
+        results['_updateXSections'] = _measure(updateXSections, self.repeat)
+
+        # a frame is the handling of a mouse movement and the rendering of
+        # the changes, as done by the frame timer
+        w.draw()
+        events = iter(self._moveEvents(self.frames + 1))
+
+        def frame():
+            w.callbacks.process('motion_notify_event', next(events))
+            w.frames.cancel()
+            w._onFrame()
+        results['frame'] = _measure(frame, self.frames)
+
+        config = w.traces[0]['config']
+        w.onToolChange('CustomXSection')
+        w._customLine = np.array([[config['xaxis'][0], config['yaxis'][0]],
+                                  [config['xaxis'][-1], config['yaxis'][-1]]])
+        w._customLinePos = np.array([[0, 0], [size - 1, size - 1]])
+        results['_interpolate'] = _measure(w._interpolate, self.repeat)
+
+        # a plane fit as added by its tool, evaluated by the pipeline and
+        # shown, and the bare processing function for comparison
+        w._rectangleSelection = [[0, 0], [size, size]]
+        stage = w._planeFitStage()
+
+        def planeFit():
+            # the result would be cached after the first call
+            w.pipeline.invalidate()
+            w.setStages([stage], record=False)
+        results['planeFit'] = _measure(planeFit, self.repeat)
+        w.setStages([], record=False)
+        results['planeFit kernel'] = _measure(
+            lambda: processing.planeFit(z=config['zoriginal'], **stage.params),
+            self.repeat)
+
+        w.onToolChange('sumXSection')
+
+        def sumXSection():
+            # the summed area tables are built anew for every call
+            w._integral = None
+            w._withIntegral(w._showProjections)
+        results['sumXSection'] = _measure(sumXSection, self.repeat)
+        return results
+
+
+def measureStartup(repeat=5):
+    """Cold start of the application, each in a new process, until the
+    imports are done and the window is shown.
+
+    Returns:
+        dict of the results per stage of the startup
+    """
+    package = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ, QT_QPA_PLATFORM='offscreen')
+    env['PYTHONPATH'] = os.pathsep.join(
+        [package] + [p for p in [env.get('PYTHONPATH')] if p])
+    times = dict()
+    for i in range(repeat):
+        output = subprocess.check_output(
+            [sys.executable, '-m', 'qcqtui.app', '--report-startup'],
+            env=env, stderr=subprocess.DEVNULL)
+        # the report is the last line, the application may print before
+        report = json.loads(output.decode().strip().splitlines()[-1])
+        for stage, value in report.items():
+            times.setdefault(stage, []).append(value)
+    return {'startup ' + stage: {'median': float(np.median(values)),
+                                 'min': float(min(values)),
+                                 'max': float(max(values)),
+                                 'repeat': repeat, 'peakMemory': None}
+            for stage, values in times.items()}
+
+
+def _gitRevision():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def metadata():
+    """Versions and platform the benchmarks are run on."""
+    import matplotlib
+    import PyQt5.QtCore
+    return {'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'revision': _gitRevision(),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'matplotlib': matplotlib.__version__,
+            'qt': PyQt5.QtCore.QT_VERSION_STR,
+            'platform': platform.platform(),
+            'processor': platform.processor()}
+
+
+def runBenchmarks(sizes=defaultSizes, repeat=5, frames=50, startup=True):
+    """Run the benchmarks for arrays of the given sizes, and of the cold
+    start of the application, which are listed with size 0.
+
+    Returns:
+        dict with the metadata and the results as list of dicts with the
+        operation, size, latencies in seconds and peak memory in bytes
+    """
+    benchmark = WidgetBenchmark(repeat=repeat, frames=frames)
+    results = []
+    if startup:
+        for operation, result in measureStartup(repeat).items():
+            results.append(dict(operation=operation, size=0, **result))
+            print('{:>16} {:>11} {:10.2f} ms'.format(
+                operation, '', result['median'] * 1e3))
+    for size in sizes:
+        for operation, result in benchmark.run(size).items():
+            results.append(dict(operation=operation, size=size, **result))
+            print('{:>16} {:>5}x{:<5} {:10.2f} ms {:10.1f} MB'.format(
+                operation, size, size, result['median'] * 1e3,
+                result['peakMemory'] / 2**20))
+    return {'metadata': metadata(), 'results': results}
+
+
+def compare(baseline, current, threshold=defaultThreshold):
+    """Compare the median latencies of two runs.
+
+    Returns:
+        list of (operation, size, baseline, current) of the operations that
+        got slower by more than threshold
+    """
+    before = {(r['operation'], r['size']): r['median'] for r in baseline['results']}
+    regressions = []
+    for r in current['results']:
+        key = (r['operation'], r['size'])
+        if key not in before:
+            continue
+        ratio = r['median'] / before[key] if before[key] else np.inf
+        mark = ' slower' if ratio > 1 + threshold else ''
+        print('{:>16} {:>5} {:10.2f} ms -> {:10.2f} ms {:6.2f}x{}'.format(
+            key[0], key[1], before[key] * 1e3, r['median'] * 1e3, ratio, mark))
+        if mark:
+            regressions.append((key[0], key[1], before[key], r['median']))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Benchmark the interactive operations of the cross '
+                    'section widget.')
+    parser.add_argument('--sizes', type=int, nargs='+', default=defaultSizes,
+                        help='sizes of the square arrays')
+    parser.add_argument('--repeat', type=int, default=5,
+                        help='calls per operation')
+    parser.add_argument('--frames', type=int, default=50,
+                        help='simulated mouse movements')
+    parser.add_argument('--no-startup', action='store_true',
+                        help='do not measure the startup of the application')
+    parser.add_argument('--output', default=None,
+                        help='JSON file the results are saved to')
+    parser.add_argument('--compare', default=None,
+                        help='JSON file of an earlier run to compare with')
+    parser.add_argument('--threshold', type=float, default=defaultThreshold,
+                        help='fraction an operation may get slower')
+    args = parser.parse_args(argv)
+
+    current = runBenchmarks(args.sizes, args.repeat, args.frames,
+                            startup=not args.no_startup)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(current, f, indent=1)
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if compare(baseline, current, args.threshold):
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,343 @@
+import json
+import logging
+import sqlite3
+import time
+
+import numpy as np
+
+from qcodes.data.data_array import DataArray
+
+from PyQt5.QtCore import QObject, QTimer, pyqtSignal
+
+from .loader import dataSetFromArrays
+
+log = logging.getLogger(__name__)
+
+
+def _quote(name):
+    return '"{}"'.format(name.replace('"', '""'))
+
+
+class RunReader:
+    """Incremental reader for a run of a QCoDeS SQLite database.
+
+    The values are read in pages of at most pageSize points in the order
+    they were inserted and written into DataArrays in the layout of the
+    legacy data sets, which the widgets show. The points are assumed to
+    lie on a regular grid of at most two dimensions, swept with the first
+    setpoint as the outer loop, like the ones of do1d and do2d.
+
+    The shape of the grid is taken from the run description if it has
+    been stored with the run. Otherwise it is inferred from the values:
+    the length of the inner loop from the first change of the outer
+    setpoint and the length of the outer loop from the number of points
+    of a completed run. For a run that is still being written the arrays
+    then grow, and are replaced, as the outer loop advances.
+
+    Args:
+        path: path of the database file
+        runId: run_id of the run
+        pageSize: maximum number of points read per query
+    """
+    def __init__(self, path, runId, pageSize=100000):
+        self.path = path
+        self.runId = runId
+        self.pageSize = pageSize
+        self.arrays = None
+        # the arrays have been replaced since they were last handed out
+        self.replaced = False
+        self._conn = sqlite3.connect('file:{}?mode=ro'.format(path), uri=True)
+        self._lastId = 0
+        self._count = 0
+        self._pending = []
+        self._readLayout()
+
+    def close(self):
+        self._conn.close()
+
+    def _readLayout(self):
+        cursor = self._conn.cursor()
+        row = cursor.execute('SELECT result_table_name FROM runs WHERE run_id=?',
+                             (self.runId, )).fetchone()
+        if row is None:
+            raise ValueError('no run {} in {}'.format(self.runId, self.path))
+        self.table = row[0]
+        layouts = cursor.execute(
+            'SELECT layout_id, parameter, label, unit FROM layouts WHERE run_id=?',
+            (self.runId, )).fetchall()
+        params = {layoutId: {'name': name, 'label': label, 'unit': unit}
+                  for layoutId, name, label, unit in layouts}
+        dependencies = dict()
+        for dependent, independent, _ in cursor.execute(
+                'SELECT dependent, independent, axis_num FROM dependencies '
+                'ORDER BY axis_num'):
+            if dependent in params and independent in params:
+                dependencies.setdefault(dependent, []).append(params[independent])
+        # the dependents with the most setpoints, up to two, and the same
+        # setpoints as the first one of them are shown
+        candidates = [(len(dependencies[i]), i) for i in sorted(dependencies)
+                      if len(dependencies[i]) <= 2]
+        if not candidates:
+            raise ValueError('run {} has no 1D or 2D data'.format(self.runId))
+        ndim = max(candidates)[0]
+        first = [i for n, i in candidates if n == ndim][0]
+        self.setpoints = dependencies[first]
+        self.dependents = [params[i] for i in sorted(dependencies)
+                           if dependencies[i] == self.setpoints]
+        skipped = set(dependencies) - {i for i in dependencies
+                                       if dependencies[i] == self.setpoints}
+        if skipped:
+            log.warning('run {}: not showing {}'.format(
+                self.runId, ', '.join(params[i]['name'] for i in skipped)))
+        self.ndim = ndim
+        self.shape = self._storedShape()
+
+    def _runInfo(self, column):
+        try:
+            row = self._conn.execute(
+                'SELECT {} FROM runs WHERE run_id=?'.format(column),
+                (self.runId, )).fetchone()
+        except sqlite3.OperationalError:
+            # column of a newer database version
+            return None
+        return row[0] if row else None
+
+    def _storedShape(self):
+        description = self._runInfo('run_description')
+        if not description:
+            return None
+        try:
+            shapes = json.loads(description).get('shapes') or {}
+        except ValueError:
+            return None
+        shape = shapes.get(self.dependents[0]['name'])
+        if shape is None or len(shape) != self.ndim:
+            return None
+        return tuple(shape)
+
+    def isCompleted(self):
+        return bool(self._runInfo('is_completed'))
+
+    def numPoints(self):
+        """Number of points of the run written to the database so far."""
+        return self._conn.execute(
+            'SELECT COUNT(*) FROM {} WHERE {} IS NOT NULL'.format(
+                _quote(self.table), _quote(self.dependents[0]['name']))).fetchone()[0]
+
+    def _createArrays(self, shape):
+        old = self.arrays
+        self.arrays = []
+        set_arrays = ()
+        for i, param in enumerate(self.setpoints + self.dependents):
+            is_setpoint = i < self.ndim
+            arrayShape = shape[:i + 1] if is_setpoint else shape
+            data = np.full(arrayShape, np.nan)
+            if old is not None:
+                # the values read so far, of arrays that have grown
+                section = tuple(slice(0, min(n, m)) for n, m in
+                                zip(arrayShape, old[i].ndarray.shape))
+                data[section] = old[i].ndarray[section]
+            array = DataArray(name=param['name'], array_id=param['name'],
+                              label=param['label'] or param['name'],
+                              unit=param['unit'],
+                              set_arrays=set_arrays, shape=arrayShape,
+                              is_setpoint=is_setpoint, preset_data=data)
+            if is_setpoint:
+                set_arrays = set_arrays + (array, )
+            self.arrays.append(array)
+        self.shape = shape
+        self.replaced = old is not None
+
+    def _readPage(self):
+        columns = ['id'] + [p['name'] for p in self.setpoints + self.dependents]
+        rows = self._conn.execute(
+            'SELECT {} FROM {} WHERE id>? AND {} IS NOT NULL ORDER BY id LIMIT ?'.format(
+                ', '.join(map(_quote, columns)), _quote(self.table),
+                _quote(self.dependents[0]['name'])),
+            (self._lastId, self.pageSize)).fetchall()
+        if not rows:
+            return None
+        values = np.array(rows, dtype=float)
+        self._lastId = rows[-1][0]
+        return values[:, 1:]
+
+    def _inferShape(self, completed, final=False):
+        values = np.concatenate(self._pending)
+        if self.ndim == 1:
+            inner = None
+        else:
+            changed = np.flatnonzero(values[:, 0] != values[0, 0])
+            if len(changed):
+                inner = int(changed[0])
+            elif final:
+                # the run has ended during the first row
+                inner = len(values)
+            else:
+                # the first row is not complete yet
+                return None
+        total = self.numPoints()
+        if completed:
+            outer = total if inner is None else -(-total // inner)
+        else:
+            # room for twice the points written so far, grown when needed
+            outer = max(2 * (total if inner is None else -(-total // inner)), 1)
+        return (outer, ) if inner is None else (outer, inner)
+
+    def _write(self, values):
+        shape = self.shape
+        k = self._count + np.arange(len(values))
+        self._count += len(values)
+        if self.ndim == 1:
+            index = (k, )
+        else:
+            index = (k // shape[1], k % shape[1])
+        if index[0][-1] >= shape[0]:
+            if self._storedShape() is not None:
+                # more values than announced by the shape
+                keep = index[0] < shape[0]
+                if not keep.any():
+                    return None
+                index = tuple(i[keep] for i in index)
+                values = values[keep]
+            else:
+                self._createArrays((max(2 * shape[0], index[0][-1] + 1), ) +
+                                   shape[1:])
+        for i, array in enumerate(self.arrays):
+            if i < self.ndim:
+                array.ndarray[index[:i + 1]] = values[:, i]
+            else:
+                array.ndarray[index] = values[:, i]
+        return int(index[0][0]), int(index[0][-1]) + 1
+
+    def read(self, timeLimit=None):
+        """Read the points written since the last call, page by page.
+
+        Args:
+            timeLimit: stop reading further pages after this many seconds,
+                the remaining ones are read by the next call
+
+        Returns:
+            (start, stop) of the range of the first index of the data
+            arrays that has changed, None if nothing has changed
+        """
+        start = time.perf_counter()
+        first = last = None
+        completed = self.isCompleted()
+        while True:
+            values = self._readPage()
+            if values is None:
+                break
+            if self.arrays is None:
+                self._pending.append(values)
+                shape = self.shape or self._inferShape(completed)
+                if shape is None:
+                    continue
+                self._createArrays(shape)
+                values = np.concatenate(self._pending)
+                self._pending = []
+            rows = self._write(values)
+            if rows is None:
+                continue
+            first = rows[0] if first is None else min(first, rows[0])
+            last = rows[1] if last is None else max(last, rows[1])
+            if timeLimit is not None and time.perf_counter() - start > timeLimit:
+                break
+        if self.arrays is None and completed and self._pending:
+            self._createArrays(self._inferShape(completed, final=True))
+            values = np.concatenate(self._pending)
+            self._pending = []
+            first, last = self._write(values) or (None, None)
+        if first is None:
+            return None
+        return first, last
+
+    def isExhausted(self):
+        """Whether all points of a completed run have been read."""
+        return self.isCompleted() and self._count >= self.numPoints()
+
+    def trim(self):
+        """Shrink arrays that have grown while the run was written to the
+        rows of the completed run.
+
+        Returns:
+            whether the arrays have been replaced
+        """
+        if self.arrays is None or self._storedShape() is not None:
+            return False
+        inner = self.shape[1] if self.ndim == 2 else 1
+        rows = -(-self._count // inner)
+        if rows >= self.shape[0]:
+            return False
+        self._createArrays((rows, ) + self.shape[1:])
+        return True
+
+
+class RunFollower(QObject):
+    """Shows a run of a QCoDeS SQLite database, completed or still being
+    written, by reading it in pages in the event loop.
+
+    Pages are read for at most budget seconds per iteration of the event
+    loop, so the window stays responsive while a large run is read.
+    Afterwards the database is polled for new points until the run is
+    completed.
+
+    Args:
+        path: path of the database file
+        runId: run_id of the run
+        interval: polling interval in ms while the run is being written
+        budget: time in seconds spent reading per iteration
+    """
+    # emitted with the data set once the shape of the arrays is known, and
+    # again if the arrays had to grow
+    started = pyqtSignal(object)
+    # range of the first index of the arrays that has been updated
+    updated = pyqtSignal(int, int)
+    # all points of the completed run have been read
+    finished = pyqtSignal()
+
+    def __init__(self, path, runId, interval=1000, budget=0.05, parent=None):
+        QObject.__init__(self, parent)
+        self.path = path
+        self.runId = runId
+        self.interval = interval
+        self.budget = budget
+        self.dataSet = None
+        self.reader = RunReader(path, runId)
+        self._timer = QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.timeout.connect(self.poll)
+
+    def start(self):
+        self._timer.start(0)
+
+    def stop(self):
+        self._timer.stop()
+        self.reader.close()
+
+    def isActive(self):
+        return self._timer.isActive()
+
+    def _start(self):
+        self.reader.replaced = False
+        self.dataSet = dataSetFromArrays(self.reader.arrays)
+        self.dataSet.metadata.update({'database': self.path,
+                                      'run_id': self.runId})
+        self.started.emit(self.dataSet)
+
+    def poll(self):
+        rows = self.reader.read(self.budget)
+        if self.reader.arrays is not None and (self.dataSet is None or
+                                               self.reader.replaced):
+            self._start()
+        elif rows is not None:
+            self.updated.emit(*rows)
+        if rows is not None:
+            # there may be more pages
+            self._timer.start(0)
+        elif self.reader.isExhausted():
+            if self.reader.trim():
+                self._start()
+            self.reader.close()
+            self.finished.emit()
+        else:
+            self._timer.start(self.interval)
@@ -0,0 +1,171 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+from qcodes.data.data_array import DataArray
+
+from .loader import dataSetFromArrays
+
+
+def defaultCacheDirectory():
+    base = os.environ.get('XDG_CACHE_HOME',
+                          os.path.join(os.path.expanduser('~'), '.cache'))
+    return os.path.join(base, 'qcqtui')
+
+
+class DataSetCache:
+    """Binary copies of parsed data sets for fast reopening.
+
+    Every data set is stored in its own directory as one .npy file per
+    array and a JSON file with the array attributes and the metadata of
+    the data set. Entries are keyed by the path, size and modification
+    time of the source files, so that changed files are parsed again.
+    Cached arrays are opened as read only memory maps.
+
+    The least recently used entries are removed once the cache grows
+    beyond maxBytes.
+
+    Args:
+        directory: where the cache is stored, defaults to qcqtui in the
+            user cache directory
+        maxBytes: size limit of the cache
+    """
+    metaFile = 'meta.json'
+
+    def __init__(self, directory=None, maxBytes=4*1024**3):
+        self.directory = directory or defaultCacheDirectory()
+        self.maxBytes = maxBytes
+
+    @staticmethod
+    def _sourceFiles(location):
+        if os.path.isdir(location):
+            return sorted(os.path.join(root, name)
+                          for root, _, names in os.walk(location)
+                          for name in names)
+        return [location]
+
+    def key(self, location):
+        """Cache key of the data set at location or None if the location
+        does not exist."""
+        h = hashlib.sha1()
+        try:
+            for fn in self._sourceFiles(os.path.abspath(location)):
+                stat = os.stat(fn)
+                h.update('{}\0{}\0{}\0'.format(fn, stat.st_size,
+                                               stat.st_mtime_ns).encode())
+        except OSError:
+            return None
+        return h.hexdigest()
+
+    def _entry(self, key):
+        return os.path.join(self.directory, key)
+
+    def load(self, location):
+        """Load the data set at location from the cache, returns None if it
+        is not cached."""
+        key = self.key(location)
+        if key is None:
+            return None
+        entry = self._entry(key)
+        try:
+            with open(os.path.join(entry, self.metaFile)) as f:
+                meta = json.load(f)
+            arrays = dict()
+            for info in meta['arrays']:
+                data = np.load(os.path.join(entry, info['file']), mmap_mode='r')
+                array = DataArray(name=info['name'], array_id=info['array_id'],
+                                  label=info['label'], unit=info['unit'],
+                                  is_setpoint=info['is_setpoint'],
+                                  action_indices=tuple(info['action_indices']),
+                                  preset_data=data)
+                arrays[info['array_id']] = array
+            # set arrays may come after the arrays referencing them
+            for info in meta['arrays']:
+                arrays[info['array_id']].set_arrays = tuple(
+                    arrays[i] for i in info['set_arrays'])
+        except (OSError, ValueError, KeyError):
+            # missing or incomplete entry
+            return None
+        # mark as recently used
+        os.utime(os.path.join(entry, self.metaFile))
+        dataSet = dataSetFromArrays(arrays.values(), location)
+        dataSet.metadata.update(meta['metadata'])
+        return dataSet
+
+    def store(self, location, dataSet):
+        """Store a data set loaded from location."""
+        key = self.key(location)
+        if key is None:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        # write to a temporary directory first, so that readers never see
+        # an incomplete entry
+        tmp = tempfile.mkdtemp(dir=self.directory, prefix='.tmp')
+        try:
+            infos = []
+            for i, array in enumerate(dataSet.arrays.values()):
+                fileName = '{}.npy'.format(i)
+                np.save(os.path.join(tmp, fileName), np.asarray(array.ndarray))
+                infos.append({'file': fileName,
+                              'array_id': array.array_id,
+                              'name': array.name,
+                              'label': array.label,
+                              'unit': array.unit,
+                              'is_setpoint': array.is_setpoint,
+                              'action_indices': list(array.action_indices),
+                              'set_arrays': [a.array_id for a in array.set_arrays]})
+            meta = {'location': os.path.abspath(location),
+                    'arrays': infos,
+                    'metadata': dataSet.metadata}
+            with open(os.path.join(tmp, self.metaFile), 'w') as f:
+                json.dump(meta, f, default=str)
+            entry = self._entry(key)
+            if os.path.exists(entry):
+                shutil.rmtree(entry)
+            os.replace(tmp, entry)
+        except Exception:
+            shutil.rmtree(tmp, ignore_errors=True)
+            raise
+        self._evict()
+
+    def _entries(self):
+        # (last use, size, path) of all entries
+        entries = []
+        if not os.path.isdir(self.directory):
+            return entries
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if name.startswith('.') or not os.path.isdir(path):
+                continue
+            try:
+                lastUse = os.stat(os.path.join(path, self.metaFile)).st_mtime
+                size = sum(os.path.getsize(os.path.join(path, f))
+                           for f in os.listdir(path))
+            except OSError:
+                continue
+            entries.append((lastUse, size, path))
+        return entries
+
+    def size(self):
+        """Total size of the cache in bytes."""
+        return sum(size for _, size, _ in self._entries())
+
+    def _evict(self):
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+        # the most recently used entry is kept even if it alone exceeds
+        # the limit
+        for lastUse, size, path in entries[:-1]:
+            if total <= self.maxBytes:
+                break
+            shutil.rmtree(path, ignore_errors=True)
+            total -= size
+
+    def clear(self):
+        """Remove all entries."""
+        if os.path.isdir(self.directory):
+            shutil.rmtree(self.directory, ignore_errors=True)
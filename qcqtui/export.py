@@ -0,0 +1,141 @@
+import numpy as np
+
+import matplotlib.image
+from matplotlib.backend_bases import FigureCanvasBase
+from matplotlib.transforms import Bbox
+
+# formats that are cut out of a single rendering of the figure, all others
+# are saved as vector graphics
+rasterFormats = ('png', 'jpg', 'jpeg', 'tif', 'tiff')
+
+
+def fullExtent(ax, pad=0.0):
+    """Get the full extent of an axes, including axes labels, tick labels, and
+    titles."""
+    # for text objects we only include them if they are non empty.
+    # empty ticks may be rendered outside the figure
+    items = []
+    items += [ax.xaxis.label, ax.yaxis.label, ax.title]
+    items = [item for item in items if item.get_text()]
+    items.append(ax)
+    bbox = Bbox.union([item.get_window_extent() for item in items])
+    return bbox.expanded(1.0 + pad, 1.0 + pad)
+
+
+class FigureExporter:
+    """Saves the axes of a figure as separate files.
+
+    Raster formats are cut out of a single rendering of the figure. A
+    vector renderer writes a single file, so vector formats need a
+    renderer per file. Each of them only renders the axes the file
+    contains, the other axes are hidden meanwhile, so that an export
+    renders every artist once instead of the whole figure per file. The
+    extents of all axes are computed once per export.
+
+    Args:
+        fig: the figure, drawn on a canvas based on Agg, as the ones of the
+            Qt backends
+        axes: list of (axes, filename without extension)
+    """
+    def __init__(self, fig, axes):
+        self.fig = fig
+        self.axes = [(ax, name) for ax, name in axes if ax is not None]
+        self._extents = None
+
+    def extents(self):
+        """Extents of the axes including their labels, in display
+        coordinates."""
+        if self._extents is None:
+            self._extents = [fullExtent(ax) for ax, _ in self.axes]
+        return self._extents
+
+    def save(self, saveformat='pdf'):
+        """Save every axes to its own file.
+
+        Returns:
+            list of the saved file names
+        """
+        if saveformat in rasterFormats:
+            return self._saveRaster(saveformat)
+        return self._saveVector(saveformat)
+
+    def _saveRaster(self, saveformat):
+        canvas = self.fig.canvas
+        canvas.draw()
+        image = np.asarray(canvas.buffer_rgba())
+        height = image.shape[0]
+        # the buffer of high dpi displays may be larger than the figure
+        scale = image.shape[1] / self.fig.bbox.width
+        filenames = []
+        for (ax, name), extent in zip(self.axes, self.extents()):
+            extent = Bbox.intersection(extent, self.fig.bbox)
+            x0, x1 = int(np.floor(extent.x0 * scale)), int(np.ceil(extent.x1 * scale))
+            y0, y1 = int(np.floor(extent.y0 * scale)), int(np.ceil(extent.y1 * scale))
+            filename = '{}.{}'.format(name, saveformat)
+            # the rows of the buffer start at the top of the figure
+            section = np.ascontiguousarray(image[height - y1:height - y0, x0:x1])
+            matplotlib.image.imsave(filename, section, format=saveformat,
+                                    dpi=self.fig.dpi)
+            filenames.append(filename)
+        return filenames
+
+    def _pages(self):
+        # yields the extent in inches with only the respective axes shown
+        extents = self.extents()
+        visible = {ax: ax.get_visible() for ax in self.fig.axes}
+        toInches = self.fig.dpi_scale_trans.inverted()
+        try:
+            for (ax, name), extent in zip(self.axes, extents):
+                for other in self.fig.axes:
+                    other.set_visible(other is ax)
+                yield ax, name, extent.transformed(toInches)
+        finally:
+            for ax, isVisible in visible.items():
+                ax.set_visible(isVisible)
+
+    def _saveVector(self, saveformat):
+        filenames = []
+        for ax, name, extent in self._pages():
+            filename = '{}.{}'.format(name, saveformat)
+            # not fig.savefig, the canvases of the Qt backends redraw the
+            # whole figure on screen after saving every file
+            FigureCanvasBase.print_figure(self.fig.canvas, filename,
+                                          bbox_inches=extent, format=saveformat)
+            filenames.append(filename)
+        return filenames
+
+    def saveMultipage(self, filename):
+        """Save all axes to a single PDF with one page per axes."""
+        # the PDF backend takes long to import and is rarely needed
+        from matplotlib.backends.backend_pdf import PdfPages
+        with PdfPages(filename) as pdf:
+            for ax, name, extent in self._pages():
+                pdf.savefig(self.fig, bbox_inches=extent)
+        return [filename]
+
+
+def lineData(ax):
+    """The data of the lines of an axes, as dict of arrays named
+    line0_x, line0_y, line1_x, ..."""
+    data = dict()
+    for i, line in enumerate(ax.get_lines()):
+        data['line{}_x'.format(i)] = np.asarray(line.get_xdata(), dtype=float)
+        data['line{}_y'.format(i)] = np.asarray(line.get_ydata(), dtype=float)
+    return data
+
+
+def saveLineData(filename, axes):
+    """Save the data of the lines of several axes to a single .npz file.
+
+    Args:
+        filename: name of the file
+        axes: dict of axes, the keys prefix the names of the arrays
+    """
+    data = dict()
+    for key, ax in axes.items():
+        if ax is None:
+            continue
+        for name, values in lineData(ax).items():
+            data['{}_{}'.format(key, name)] = values
+    np.savez(filename, **data)
+    return filename
@@ -0,0 +1,179 @@
+import os
+
+import numpy as np
+
+from qcodes.data.data_array import DataArray
+from qcodes.data.data_set import DataSet
+
+from PyQt5.QtCore import QObject, QTimer, pyqtSignal
+
+from .loader import dataSetFromArrays
+
+
+class GNUPlotReader:
+    """Incremental reader for a data file in the qcodes GNUPlot format.
+
+    Each call of read parses only the complete lines appended since the
+    previous call and writes their values into the arrays in place. The
+    arrays are allocated with their full shape from the file header and
+    filled with NaN where no values have been written yet.
+
+    Args:
+        path: path of the .dat file
+        metadata: metadata of the data set, used for names and units of
+            the arrays
+    """
+    def __init__(self, path, metadata=None):
+        self.path = path
+        self.metadata = metadata or {}
+        self.offset = 0
+        self.arrays = None
+        self._header = []
+        self._remainder = b''
+        self._ndim = None
+        self._indices = None
+        self._resetting = 0
+
+    @staticmethod
+    def _getLabels(labelstr):
+        labelstr = labelstr.strip()
+        if labelstr[0] != '"' or labelstr[-1] != '"':
+            # fields are *not* quoted
+            return labelstr.split()
+        # fields *are* quoted (and escaped)
+        parts = labelstr[1:-1].split('"\t"')
+        return [l.replace('\\"', '"').replace('\\\\', '\\') for l in parts]
+
+    def _createArrays(self):
+        ids = self._header[0].split()
+        labels = self._getLabels(self._header[1])
+        shape = tuple(map(int, self._header[2].split()))
+        self._ndim = len(shape)
+        self._indices = [0] * self._ndim
+        info = self.metadata.get('arrays', {})
+        self.arrays = []
+        set_arrays = ()
+        for i, (array_id, label) in enumerate(zip(ids, labels)):
+            meta = info.get(array_id, {})
+            is_setpoint = i < self._ndim
+            arrayShape = shape[:i + 1] if is_setpoint else shape
+            array = DataArray(name=meta.get('name') or array_id,
+                              array_id=array_id,
+                              label=meta.get('label') or label,
+                              unit=meta.get('unit'),
+                              set_arrays=set_arrays, shape=arrayShape,
+                              is_setpoint=is_setpoint,
+                              preset_data=np.full(arrayShape, np.nan))
+            if is_setpoint:
+                set_arrays = set_arrays + (array, )
+            self.arrays.append(array)
+
+    def read(self):
+        """Parse the lines appended since the last call.
+
+        Returns:
+            (start, stop) of the range of the first index of the data
+            arrays that has changed, None if nothing has changed
+        """
+        try:
+            size = os.path.getsize(self.path)
+        except OSError:
+            return None
+        if size <= self.offset:
+            return None
+        with open(self.path, 'rb') as f:
+            f.seek(self.offset)
+            chunk = f.read(size - self.offset)
+        self.offset = size
+        chunk = self._remainder + chunk
+        # an incomplete last line is parsed with the next chunk
+        end = chunk.rfind(b'\n') + 1
+        self._remainder = chunk[end:]
+        lines = chunk[:end].decode().splitlines()
+
+        first = last = None
+        for line in lines:
+            if line.startswith('#'):
+                if self.arrays is None:
+                    self._header.append(line[1:])
+                    if len(self._header) == 3:
+                        self._createArrays()
+                continue
+            if self.arrays is None:
+                continue
+            line = line.strip()
+            if not line:
+                # each consecutive blank line implies one more loop to reset
+                # when we read the next data point
+                self._resetting += 1
+                continue
+            values = tuple(map(float, line.split()))
+            indices = self._indices
+            if self._resetting:
+                r = min(self._resetting, self._ndim - 1)
+                indices[-r - 1] += 1
+                indices[-r:] = [0] * r
+                self._resetting = 0
+            if indices[0] >= self.arrays[-1].ndarray.shape[0]:
+                # more values than announced by the header
+                continue
+            for value, array in zip(values, self.arrays):
+                array.ndarray[tuple(indices[:array.ndarray.ndim])] = value
+            first = indices[0] if first is None else first
+            last = indices[0]
+            indices[-1] += 1
+        if first is None:
+            return None
+        return first, last + 1
+
+
+class DataSetFollower(QObject):
+    """Follows a data set that is still being written, e.g. by a running
+    do2d loop, by polling its data file for appended lines.
+
+    Args:
+        location: the .dat file of the data set
+        interval: polling interval in ms
+    """
+    # emitted with the data set once the header has been read
+    started = pyqtSignal(object)
+    # range of the first index of the arrays that has been updated
+    updated = pyqtSignal(int, int)
+
+    def __init__(self, location, interval=1000, parent=None):
+        QObject.__init__(self, parent)
+        self.location = location
+        self.dataSet = None
+        metadata = {}
+        try:
+            metaSet = DataSet(location=os.path.dirname(location))
+            metaSet.read_metadata()
+            metadata = metaSet.metadata
+        except Exception:
+            # the metadata is only used for names and units
+            pass
+        self.reader = GNUPlotReader(location, metadata)
+        self._timer = QTimer(self)
+        self._timer.setInterval(interval)
+        self._timer.timeout.connect(self.poll)
+
+    def start(self):
+        self.poll()
+        self._timer.start()
+
+    def stop(self):
+        self._timer.stop()
+
+    def isActive(self):
+        return self._timer.isActive()
+
+    def poll(self):
+        rows = self.reader.read()
+        if self.dataSet is None:
+            if self.reader.arrays is None:
+                return
+            self.dataSet = dataSetFromArrays(self.reader.arrays, self.location)
+            self.dataSet.metadata.update(self.reader.metadata)
+            self.started.emit(self.dataSet)
+        elif rows is not None:
+            self.updated.emit(*rows)
@@ -0,0 +1,49 @@
+import time
+
+from PyQt5.QtCore import QObject, QTimer
+
+
+class FrameScheduler(QObject):
+    """Throttles the rendering of interactive changes.
+
+    Event handlers only record the latest requested state and call
+    schedule. The pending changes are rendered by the callback with the
+    next frame, frames are at least 1/maxFPS seconds apart and requests
+    in between are merged into the pending frame.
+
+    Args:
+        callback: renders the pending changes
+        parent: parent QObject, e.g. the widget
+        maxFPS: maximum number of frames per second, 0 renders every
+            frame as soon as the event loop is idle
+    """
+    def __init__(self, callback, parent=None, maxFPS=60):
+        QObject.__init__(self, parent)
+        self.callback = callback
+        self.maxFPS = maxFPS
+        self._lastFrameTime = 0
+        self._timer = QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.timeout.connect(self._onTimeout)
+
+    def schedule(self):
+        """Render the pending changes with the next frame."""
+        if self._timer.isActive():
+            return
+        if self.maxFPS:
+            elapsed = time.perf_counter() - self._lastFrameTime
+            delay = max(0, int(1000 * (1.0 / self.maxFPS - elapsed)))
+        else:
+            delay = 0
+        self._timer.start(delay)
+
+    def isPending(self):
+        return self._timer.isActive()
+
+    def cancel(self):
+        """Drop the pending frame, e.g. if it is rendered directly."""
+        self._timer.stop()
+
+    def _onTimeout(self):
+        self._lastFrameTime = time.perf_counter()
+        self.callback()
@@ -0,0 +1,38 @@
+class ProcessingHistory:
+    """Undo and redo history of the stages of a processing pipeline.
+
+    Only the lists of stages are recorded, with their parameters. The
+    results are recomputed by the pipeline on demand, which keeps the
+    recent ones in its cache, so that moving through the history does not
+    hold a full copy of the data per step.
+    """
+    def __init__(self):
+        self.states = [()]
+        # index of the current state
+        self.position = 0
+
+    def current(self):
+        return list(self.states[self.position])
+
+    def canUndo(self):
+        return self.position > 0
+
+    def canRedo(self):
+        return self.position < len(self.states) - 1
+
+    def push(self, stages):
+        """Record a new list of stages, dropping the states that have been
+        undone."""
+        del self.states[self.position + 1:]
+        self.states.append(tuple(stages))
+        self.position += 1
+
+    def undo(self):
+        if self.canUndo():
+            self.position -= 1
+        return self.current()
+
+    def redo(self):
+        if self.canRedo():
+            self.position += 1
+        return self.current()
@@ -0,0 +1,160 @@
+import cProfile
+import functools
+import json
+import time
+from collections import deque
+from contextlib import contextmanager
+
+import numpy as np
+
+
+class LatencyRecorder:
+    """Records the duration of interactive events, like mouse movements and
+    redraws, and of the stages they consist of, like index lookup, array
+    slicing, updating artists and rendering, in a ring buffer.
+
+    Events that happen while another one is handled, e.g. a redraw from a
+    tool change, are recorded on their own and also count as stage of the
+    outer event.
+
+    Args:
+        size: number of events kept
+    """
+    def __init__(self, size=2000):
+        self.records = deque(maxlen=size)
+        self.enabled = True
+        # records of the events being handled, innermost last
+        self._stack = []
+        self._profiler = None
+        self._profileRemaining = 0
+        self._profileFilename = None
+
+    @contextmanager
+    def event(self, name):
+        """Time the handling of an event."""
+        if not self.enabled:
+            yield
+            return
+        profiling = not self._stack and self._profiler is not None
+        record = {'name': name, 'start': time.perf_counter(), 'stages': dict()}
+        self._stack.append(record)
+        if profiling:
+            self._profiler.enable()
+        try:
+            yield
+        finally:
+            if profiling:
+                self._profiler.disable()
+            self._stack.pop()
+            record['duration'] = time.perf_counter() - record['start']
+            if self._stack:
+                stages = self._stack[-1]['stages']
+                stages[name] = stages.get(name, 0.0) + record['duration']
+            self.records.append(record)
+            if profiling:
+                self._profileRemaining -= 1
+                if self._profileRemaining <= 0:
+                    self._finishProfile()
+
+    @contextmanager
+    def stage(self, name):
+        """Time a stage of the event being handled."""
+        if not self.enabled or not self._stack:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            stages = self._stack[-1]['stages']
+            stages[name] = stages.get(name, 0.0) + time.perf_counter() - start
+
+    def clear(self):
+        self.records.clear()
+
+    def profileNext(self, n, filename):
+        """Profile the handling of the next n events with cProfile and save
+        the statistics to filename, readable by pstats."""
+        self._profiler = cProfile.Profile()
+        self._profileRemaining = n
+        self._profileFilename = filename
+
+    def isProfiling(self):
+        return self._profiler is not None
+
+    def _finishProfile(self):
+        profiler, self._profiler = self._profiler, None
+        profiler.dump_stats(self._profileFilename)
+
+    def summary(self):
+        """Statistics of the durations in seconds per event name, and the
+        mean duration of their stages."""
+        durations = dict()
+        stages = dict()
+        for record in self.records:
+            durations.setdefault(record['name'], []).append(record['duration'])
+            eventStages = stages.setdefault(record['name'], dict())
+            for stage, duration in record['stages'].items():
+                eventStages[stage] = eventStages.get(stage, 0.0) + duration
+        summary = dict()
+        for name, values in durations.items():
+            values = np.array(values)
+            summary[name] = {
+                'count': len(values),
+                'mean': float(values.mean()),
+                'median': float(np.median(values)),
+                'p95': float(np.percentile(values, 95)),
+                'max': float(values.max()),
+                'stages': {stage: total / len(values)
+                           for stage, total in stages[name].items()}}
+        return summary
+
+    def rate(self, name, window=1.0):
+        """Events of the given name per second and their mean duration in
+        seconds, over the last window seconds."""
+        since = time.perf_counter() - window
+        durations = [record['duration'] for record in self.records
+                     if record['start'] >= since and record['name'] == name]
+        if not durations:
+            return 0.0, 0.0
+        return len(durations) / window, sum(durations) / len(durations)
+
+    def frameStats(self, window=1.0):
+        """Rendered frames and full redraws over the last window seconds.
+
+        Frames render the interactive changes scheduled by the widgets.
+        Full redraws of the figure, e.g. after zooming, are counted
+        separately, so that they do not add to the frame rate.
+
+        Returns:
+            (frames per second, mean frame duration, redraws per second,
+            mean redraw duration), durations in seconds
+        """
+        return self.rate('frame', window) + self.rate('draw', window)
+
+    def latest(self, name):
+        """Duration of the latest event of the given name, None if there is
+        none."""
+        for record in reversed(self.records):
+            if record['name'] == name:
+                return record['duration']
+        return None
+
+    def dump(self, filename):
+        """Save the summary and all recorded events to a JSON file."""
+        with open(filename, 'w') as f:
+            json.dump({'summary': self.summary(),
+                       'records': list(self.records)}, f, indent=1)
+        return filename
+
+
+def timed(name):
+    """Decorator recording the calls of a method as event of the
+    LatencyRecorder in the latency attribute of the instance."""
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            with self.latency.event(name):
+                return method(self, *args, **kwargs)
+        return wrapper
+    return decorator
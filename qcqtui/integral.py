@@ -0,0 +1,113 @@
+import numpy as np
+
+
+class IntegralImage:
+    """Summed area tables of a 2D array, for the sum, mean and variance of
+    the values in any rectangle in constant time.
+
+    Values that are not finite are left out. The tables are built from
+    the values minus their mean, which keeps the variance accurate for
+    data with a large offset.
+
+    Rectangles are given in index coordinates as [[x1, y1], [x2, y2]],
+    the columns x1 to x2 and rows y1 to y2 excluding x2 and y2, like
+    sections of processing. None stands for the whole array.
+
+    Args:
+        z: the 2D array
+        task: Task reporting the progress, if built on a worker thread
+    """
+    def __init__(self, z, task=None):
+        z = np.asarray(z, dtype=float)
+        self.shape = z.shape
+        finite = np.isfinite(z)
+        complete = finite.all()
+        self.offset = float(z.mean() if complete else
+                            z[finite].mean() if finite.any() else 0.0)
+        values = z - self.offset
+        if not complete:
+            values[~finite] = 0
+        self._sum = self._table(values)
+        if task is not None:
+            task.setProgress(33)
+        np.square(values, out=values)
+        self._squares = self._table(values)
+        if task is not None:
+            task.setProgress(66)
+        # without missing values the count is the area
+        self._count = None if complete else self._table(finite.astype(float))
+
+    @staticmethod
+    def _table(values):
+        table = np.zeros((values.shape[0] + 1, values.shape[1] + 1))
+        np.cumsum(values, axis=0, out=table[1:, 1:])
+        np.cumsum(table[1:, 1:], axis=1, out=table[1:, 1:])
+        return table
+
+    def _bounds(self, section):
+        if section is None:
+            return 0, 0, self.shape[1], self.shape[0]
+        (x1, y1), (x2, y2) = np.sort(np.asarray(section, dtype=int), axis=0)
+        x1, x2 = np.clip([x1, x2], 0, self.shape[1])
+        y1, y2 = np.clip([y1, y2], 0, self.shape[0])
+        return x1, y1, x2, y2
+
+    def _rectangle(self, table, section):
+        x1, y1, x2, y2 = self._bounds(section)
+        return table[y2, x2] - table[y1, x2] - table[y2, x1] + table[y1, x1]
+
+    def count(self, section=None):
+        """Number of finite values."""
+        if self._count is None:
+            x1, y1, x2, y2 = self._bounds(section)
+            return (x2 - x1) * (y2 - y1)
+        return int(round(self._rectangle(self._count, section)))
+
+    def stats(self, section=None):
+        """Count, sum, mean, variance and standard deviation of the finite
+        values, as dict."""
+        n = self.count(section)
+        if n == 0:
+            return {'count': 0, 'sum': 0.0, 'mean': np.nan,
+                    'variance': np.nan, 'std': np.nan}
+        shifted = self._rectangle(self._sum, section)
+        mean = shifted / n
+        variance = max(self._rectangle(self._squares, section) / n - mean**2, 0.0)
+        return {'count': n, 'sum': shifted + n * self.offset,
+                'mean': mean + self.offset, 'variance': variance,
+                'std': np.sqrt(variance)}
+
+    def sum(self, section=None):
+        return self.stats(section)['sum']
+
+    def mean(self, section=None):
+        return self.stats(section)['mean']
+
+    def variance(self, section=None):
+        return self.stats(section)['variance']
+
+    def _lineSums(self, table, x1, y1, x2, y2):
+        # sums over the rows y1 to y2 of the columns x1 to x2
+        columns = table[y2, x1:x2 + 1] - table[y1, x1:x2 + 1]
+        return np.diff(columns)
+
+    def projections(self, section=None):
+        """Sums of the finite values of the section along y and along x,
+        with the length of the x and y axis of the full array. Columns and
+        rows outside the section are NaN.
+
+        Returns:
+            (sums of the columns, sums of the rows)
+        """
+        x1, y1, x2, y2 = self._bounds(section)
+        results = []
+        for table, count, (a1, b1, a2, b2), n in [
+                (self._sum, self._count, (x1, y1, x2, y2), self.shape[1]),
+                (self._sum.T, None if self._count is None else self._count.T,
+                 (y1, x1, y2, x2), self.shape[0])]:
+            sums = np.full(n, np.nan)
+            counts = (b2 - b1 if count is None else
+                      self._lineSums(count, a1, b1, a2, b2))
+            sums[a1:a2] = self._lineSums(table, a1, b1, a2, b2) + counts * self.offset
+            results.append(sums)
+        return tuple(results)
@@ -0,0 +1,141 @@
+import numpy as np
+from scipy.ndimage import map_coordinates, spline_filter
+
+
+class LineProfile:
+    """Samples 2D data along straight lines.
+
+    Only the points on the line are evaluated. The data is resampled in
+    index space, where the fractional index of a data coordinate is
+    obtained by linear interpolation of the setpoint axis. The spline
+    coefficients needed for cubic sampling are computed once and reused
+    for all lines sampled from the same array. Points whose cubic
+    neighbourhood contains values that are not finite, e.g. of an
+    interrupted sweep, are sampled linearly.
+
+    Args:
+        xaxis: setpoints along the second (column) dimension of z
+        yaxis: setpoints along the first (row) dimension of z
+        z: 2D data with shape (len(yaxis), len(xaxis))
+    """
+    methods = ('nearest', 'linear', 'cubic')
+
+    def __init__(self, xaxis, yaxis, z):
+        # keep a reference to the input, so that the owner can check if the
+        # profile still belongs to the displayed data
+        self.z = z
+        xaxis = np.asarray(xaxis, dtype=float)
+        yaxis = np.asarray(yaxis, dtype=float)
+        data = np.asarray(z, dtype=float)
+        # sort the axes, e.g. for back and forth sweeps, so that fractional
+        # indices can be obtained by interpolation
+        xorder = np.argsort(xaxis, kind='mergesort')
+        yorder = np.argsort(yaxis, kind='mergesort')
+        if np.any(np.diff(xorder) != 1):
+            xaxis = xaxis[xorder]
+            data = data[:, xorder]
+        if np.any(np.diff(yorder) != 1):
+            yaxis = yaxis[yorder]
+            data = data[yorder, :]
+        self._xaxis = xaxis
+        self._yaxis = yaxis
+        self._data = data
+        self._coefficients = None
+        # mask of the values that are not finite, None if all are
+        self._nonFinite = None
+
+    @staticmethod
+    def _toIndex(axis, values):
+        return np.interp(values, axis, np.arange(len(axis), dtype=float))
+
+    def _cubicCoefficients(self):
+        if self._coefficients is None:
+            finite = np.isfinite(self._data)
+            data = self._data
+            if not finite.all():
+                # a single NaN would spread over all coefficients
+                self._nonFinite = ~finite
+                data = np.where(finite, data,
+                                np.mean(data[finite]) if finite.any() else 0.0)
+            self._coefficients = spline_filter(data, order=3)
+        return self._coefficients
+
+    def _nearNonFinite(self, rows, cols):
+        # whether the 4 x 4 values a cubic sample depends on contain values
+        # that are not finite
+        near = np.zeros(np.shape(rows), dtype=bool)
+        r0 = np.floor(rows).astype(int)
+        c0 = np.floor(cols).astype(int)
+        nrows, ncols = self._data.shape
+        for dr in range(-1, 3):
+            for dc in range(-1, 3):
+                near |= self._nonFinite[np.clip(r0 + dr, 0, nrows - 1),
+                                        np.clip(c0 + dc, 0, ncols - 1)]
+        return near
+
+    def _sampleIndices(self, rows, cols, method):
+        if method == 'nearest':
+            rows = np.clip(np.rint(rows).astype(int), 0, self._data.shape[0]-1)
+            cols = np.clip(np.rint(cols).astype(int), 0, self._data.shape[1]-1)
+            return self._data[rows, cols]
+        elif method == 'linear':
+            return map_coordinates(self._data, [rows, cols], order=1,
+                                   mode='nearest')
+        elif method == 'cubic':
+            values = map_coordinates(self._cubicCoefficients(), [rows, cols],
+                                     order=3, mode='nearest', prefilter=False)
+            if self._nonFinite is not None:
+                near = self._nearNonFinite(rows, cols)
+                if near.any():
+                    values[near] = map_coordinates(
+                        self._data, [rows[near], cols[near]], order=1,
+                        mode='nearest')
+            return values
+        raise ValueError("Unknown sampling method {}, use one of "
+                         "{}".format(method, self.methods))
+
+    def sample(self, start, end, numPoints=None, method='linear', width=0):
+        """Sample the data along the line from start to end.
+
+        Args:
+            start: (x, y) of the first point in data coordinates
+            end: (x, y) of the last point in data coordinates
+            numPoints: number of samples, defaults to one per data point
+                crossed by the line
+            method: one of 'nearest', 'linear' or 'cubic'
+            width: width in data points of a band perpendicular to the line
+                that is averaged over, 0 samples only the line itself
+
+        Returns:
+            distances along the line in data coordinates and sampled values
+        """
+        start = np.asarray(start, dtype=float)
+        end = np.asarray(end, dtype=float)
+        istart = np.array([self._toIndex(self._xaxis, start[0]),
+                           self._toIndex(self._yaxis, start[1])])
+        iend = np.array([self._toIndex(self._xaxis, end[0]),
+                         self._toIndex(self._yaxis, end[1])])
+        direction = iend - istart
+        length = np.hypot(*direction)
+        if numPoints is None:
+            numPoints = int(np.ceil(length)) + 1
+        numPoints = max(int(numPoints), 2)
+
+        p = np.linspace(0, 1, numPoints)
+        cols = istart[0] + p*direction[0]
+        rows = istart[1] + p*direction[1]
+
+        numOffsets = int(np.ceil(width)) + 1 if width > 0 else 1
+        if numOffsets > 1 and length > 0:
+            # unit vector perpendicular to the line in index space
+            normal = np.array([-direction[1], direction[0]]) / length
+            offsets = np.linspace(-width/2, width/2, numOffsets)
+            cols = cols[np.newaxis, :] + offsets[:, np.newaxis]*normal[0]
+            rows = rows[np.newaxis, :] + offsets[:, np.newaxis]*normal[1]
+            values = self._sampleIndices(rows.ravel(), cols.ravel(), method)
+            values = values.reshape(numOffsets, numPoints).mean(axis=0)
+        else:
+            values = self._sampleIndices(rows, cols, method)
+
+        distances = np.linspace(0, np.hypot(*(end-start)), numPoints)
+        return distances, values
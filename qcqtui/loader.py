@@ -0,0 +1,149 @@
+import logging
+import os
+from traceback import format_exc
+
+from qcodes.data.data_set import DataSet
+
+log = logging.getLogger(__name__)
+
+
+class _ProgressFile:
+    """Wraps a file opened by the io manager of a data set and reports
+    how much of it has been read to a task, which also gives the task the
+    chance to stop while a file is being parsed."""
+    # report progress every this many lines
+    interval = 10000
+
+    def __init__(self, f, task, offset, total, onHeaderRead=None):
+        self._f = f
+        self._task = task
+        self._offset = offset
+        self._total = total
+        self._onHeaderRead = onHeaderRead
+        self.bytesRead = 0
+
+    def __getattr__(self, name):
+        return getattr(self._f, name)
+
+    def _count(self, line, lineNumber):
+        self.bytesRead += len(line)
+        if self._task is not None and lineNumber % self.interval == 0:
+            if self._total:
+                self._task.setProgress(
+                    100 * (self._offset + self.bytesRead) / self._total)
+            else:
+                self._task.checkCancelled()
+
+    def readline(self, *args):
+        line = self._f.readline(*args)
+        self._count(line, 1)
+        return line
+
+    def __iter__(self):
+        # the formatters read the header line by line and iterate over
+        # the values, so the arrays are known once iteration starts
+        if self._onHeaderRead is not None:
+            self._onHeaderRead()
+        for i, line in enumerate(self._f):
+            self._count(line, i)
+            yield line
+
+
+def dataSetFromArrays(arrays, location=False):
+    """A DataSet of DataArrays that keep their array ids.
+
+    The arrays are added one by one, as passing them to the DataSet would
+    derive new array ids from their names, e.g. of setpoints, or fail for
+    arrays without names, as read by the GNUPlot formatter.
+    """
+    dataSet = DataSet(location=location)
+    for array in arrays:
+        dataSet.add_array(array)
+    return dataSet
+
+
+def _arrayInfo(dataSet):
+    # name and is_setpoint of all arrays of a data set, as published to the
+    # onPartial callback
+    return [{'name': array.name, 'is_setpoint': array.is_setpoint}
+            for array in dataSet.arrays.values()]
+
+
+def loadDataSet(location, task=None, cache=None):
+    """Load the data set at location, like qcodes.data.data_set.load_data.
+
+    When run as a task, the progress is reported per read line and the
+    name and is_setpoint of all arrays are published as soon as they are
+    known from the metadata or the file header, before the values are
+    parsed.
+
+    If a DataSetCache is given, the data set is loaded from it if
+    possible and otherwise stored in it after parsing. In both cases the
+    returned arrays are memory mapped from the cache, so that only the
+    parts that are accessed are held in memory.
+    """
+    if cache is not None:
+        dataSet = cache.load(location)
+        if dataSet is not None:
+            return dataSet
+
+    dataSet = DataSet(location=location)
+    dataSet.read_metadata()
+    published = False
+    arrays = dataSet.metadata.get('arrays')
+    if task is not None and arrays:
+        task.publish([{'name': array.get('name'),
+                       'is_setpoint': array.get('is_setpoint', False)}
+                      for array in arrays.values()])
+        published = True
+
+    # the following is the read loop of the qcodes Formatter, with the
+    # files wrapped for reporting progress
+    io = dataSet.io
+    dataFiles = io.list(dataSet.location)
+    if not dataFiles:
+        raise IOError('no data found at ' + location)
+    for array in dataSet.arrays.values():
+        if array.ndarray is None:
+            array.init_data()
+
+    sizes = []
+    for fn in dataFiles:
+        try:
+            sizes.append(os.path.getsize(io.to_path(fn)))
+        except (AttributeError, OSError):
+            sizes.append(0)
+    total = sum(sizes)
+
+    def onHeaderRead():
+        nonlocal published
+        if task is not None and not published and dataSet.arrays:
+            task.publish(_arrayInfo(dataSet))
+            published = True
+
+    idsRead = set()
+    offset = 0
+    for fn, size in zip(dataFiles, sizes):
+        with io.open(fn, 'r') as f:
+            tracked = _ProgressFile(f, task, offset, total, onHeaderRead)
+            try:
+                dataSet.formatter.read_one_file(dataSet, tracked, idsRead)
+            except ValueError:
+                log.warning('error reading file ' + fn)
+                log.warning(format_exc())
+        offset += size
+
+    if cache is not None:
+        if task is not None:
+            task.checkCancelled()
+        try:
+            cache.store(location, dataSet)
+        except OSError:
+            log.warning('could not cache data set ' + location)
+            log.warning(format_exc())
+        else:
+            # replace the parsed arrays by memory maps of the cached copy
+            cached = cache.load(location)
+            if cached is not None:
+                return cached
+    return dataSet
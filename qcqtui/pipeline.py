@@ -0,0 +1,161 @@
+from collections import OrderedDict
+
+import numpy as np
+
+
+def _freeze(value):
+    # hashable form of a stage parameter
+    if isinstance(value, np.ndarray):
+        return ('ndarray', value.shape, value.dtype.str, value.tobytes())
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(v) for v in value)
+    if isinstance(value, dict):
+        return tuple(sorted((k, _freeze(v)) for k, v in value.items()))
+    return value
+
+
+class Stage:
+    """A transform of the processing pipeline, e.g. a plane fit, with its
+    parameters.
+
+    Calling it applies func to the data, which is passed as keyword
+    argument z together with the parameters. The data must not be
+    modified in place, a new array is returned.
+
+    Args:
+        name: name of the stage shown to the user
+        func: processing function, like the ones in processing
+        **params: keyword arguments of func besides z
+    """
+    def __init__(self, name, func, **params):
+        self.name = name
+        self.func = func
+        self.params = params
+        self._key = None
+
+    def __call__(self, z, task=None):
+        return self.func(z=z, task=task, **self.params)
+
+    def __repr__(self):
+        return 'Stage({!r})'.format(self.name)
+
+    def key(self):
+        """Identifies the result of the stage for a given input."""
+        if self._key is None:
+            self._key = (self.func, _freeze(self.params))
+        return self._key
+
+    def replace(self, **params):
+        """A copy of the stage with some parameters changed."""
+        return Stage(self.name, self.func, **dict(self.params, **params))
+
+
+def evaluate(z, stages, task=None):
+    """Apply the stages to z one after another.
+
+    Returns:
+        list of the results after each of the stages
+    """
+    results = []
+    for stage in stages:
+        if task is not None:
+            task.checkCancelled()
+        z = stage(z, task=task)
+        results.append(z)
+    return results
+
+
+class Pipeline:
+    """A sequence of stages transforming a data array, evaluated lazily.
+
+    The result after each stage is memoized, keyed by the identity of the
+    input and the parameters of all stages up to it. Changing a stage
+    therefore only recomputes the stages from it on, and returning to
+    earlier stages, e.g. by undo, finds their results in the cache as long
+    as they fit into the memory budget. The least recently used results
+    are evicted first.
+
+    The evaluation is split, so that it can run on a worker thread:
+    recipe gives the nearest cached result and the stages to apply to it,
+    evaluate applies them and store adds the results to the cache.
+
+    Args:
+        original: input of the first stage, never evicted and not counted
+            towards maxBytes
+        maxBytes: memory budget of the cached results
+    """
+    def __init__(self, original, maxBytes=1024**3):
+        self.original = original
+        self.maxBytes = maxBytes
+        self.stages = []
+        self._cache = OrderedDict()
+        self._cacheBytes = 0
+
+    def key(self, stages=None):
+        """Cache key of the result of stages, the current ones by default."""
+        if stages is None:
+            stages = self.stages
+        return (id(self.original), ) + tuple(stage.key() for stage in stages)
+
+    def cached(self, stages=None):
+        """The result of stages, the current ones by default, or None if it
+        has to be computed."""
+        if stages is None:
+            stages = self.stages
+        if not stages:
+            return self.original
+        key = self.key(stages)
+        if key in self._cache:
+            self._cache.move_to_end(key)
+            return self._cache[key]
+        return None
+
+    def recipe(self, stages=None):
+        """The nearest cached result on the way to the result of stages and
+        the stages still to be applied to it, as (z, stages)."""
+        if stages is None:
+            stages = self.stages
+        for n in range(len(stages), -1, -1):
+            z = self.cached(stages[:n])
+            if z is not None:
+                return z, list(stages[n:])
+
+    def store(self, stages, results):
+        """Cache the results of evaluate for the last len(results) of
+        stages."""
+        first = len(stages) - len(results)
+        for n, z in enumerate(results, first + 1):
+            key = self.key(stages[:n])
+            if key in self._cache:
+                self._drop(key)
+            size = getattr(z, 'nbytes', 0)
+            if size > self.maxBytes:
+                continue
+            self._cache[key] = z
+            self._cacheBytes += size
+        while self._cacheBytes > self.maxBytes:
+            self._drop(next(iter(self._cache)))
+
+    def output(self, task=None):
+        """The result of the current stages, computed if needed."""
+        z = self.cached()
+        if z is None:
+            base, stages = self.recipe()
+            results = evaluate(base, stages, task=task)
+            self.store(self.stages, results)
+            z = results[-1]
+        return z
+
+    def invalidate(self):
+        """Forget all cached results, e.g. after the values of the original
+        have changed in place."""
+        self._cache.clear()
+        self._cacheBytes = 0
+
+    def _drop(self, key):
+        z = self._cache.pop(key)
+        self._cacheBytes -= getattr(z, 'nbytes', 0)
+
+    def size(self):
+        """Bytes used by the cached results."""
+        return self._cacheBytes
@@ -0,0 +1,200 @@
+import warnings
+
+import numpy as np
+
+
+def getSection(x, y, z, section):
+    x = x[section[0,0]:section[1,0]]
+    y = y[section[0,1]:section[1,1]]
+    z = z[section[0,1]:section[1,1],section[0,0]:section[1,0]]
+    return x, y, z
+
+
+def _scaling(t):
+    # center and half width of the finite values of t, fits are done in
+    # coordinates scaled to [-1, 1] for a well conditioned system
+    t = np.asarray(t, dtype=float)
+    finite = t[np.isfinite(t)]
+    if not len(finite):
+        return 0.0, 1.0
+    lo, hi = finite.min(), finite.max()
+    return (lo + hi) / 2, ((hi - lo) / 2) or 1.0
+
+
+def _powers(t, order, scaling):
+    # powers 0..order of the scaled coordinates t as columns, coordinates
+    # that are not finite give NaN
+    t = (np.asarray(t, dtype=float) - scaling[0]) / scaling[1]
+    return t[:, None] ** np.arange(order + 1)
+
+
+def _weights(z, x, y):
+    # 1 for the values used in a fit, 0 for the ones not measured yet or
+    # cropped, and z with those values set to 0, so that they drop out of
+    # the sums
+    finite = np.isfinite(z) & np.isfinite(x)[None, :] & np.isfinite(y)[:, None]
+    return finite.astype(float), np.where(finite, z, 0)
+
+
+def _subtract(z, background, out, task, chunkSize=2**20):
+    # out = z - background(r0, r1), row chunk by row chunk, so that no
+    # temporary array of the full size is allocated
+    z = np.asarray(z)
+    if out is None:
+        out = np.empty(z.shape, dtype=np.result_type(z, float))
+    rows = max(chunkSize // max(z.shape[1], 1), 1)
+    for r0 in range(0, z.shape[0], rows):
+        r1 = min(r0 + rows, z.shape[0])
+        if task is not None:
+            task.setProgress(50 + 50 * r0 / z.shape[0])
+        np.subtract(z[r0:r1], background(r0, r1), out=out[r0:r1])
+    return out
+
+
+def polynomialFit(x, y, z, section, order=1, out=None, task=None):
+    """Subtract the polynomial in x and y of the given total order fitted
+    to the section of z given in index coordinates as [[x1, y1], [x2, y2]].
+
+    The normal equations are built from sums over the axes, which for a
+    grid of values factorize into products of the powers of x and of y,
+    so no coordinate grids are allocated. Values that are not finite are
+    not fitted. The result is written to out, which may be z for
+    subtracting in place, or a new array.
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    nx, ny, nz = getSection(x, y, np.asarray(z), section)
+    scalingX, scalingY = _scaling(nx), _scaling(ny)
+    weights, nz = _weights(nz, nx, ny)
+    px = np.nan_to_num(_powers(nx, 2 * order, scalingX))
+    py = np.nan_to_num(_powers(ny, 2 * order, scalingY))
+    # sums of y**j x**i over the fitted values
+    if weights.all():
+        sums = np.outer(py.sum(axis=0), px.sum(axis=0))
+    else:
+        sums = py.T @ weights @ px
+    # sums of z y**j x**i
+    moments = py[:, :order + 1].T @ nz @ px[:, :order + 1]
+    terms = [(j, i) for j in range(order + 1) for i in range(order + 1 - j)]
+    normal = np.array([[sums[j + l, i + k] for l, k in terms] for j, i in terms])
+    rhs = np.array([moments[j, i] for j, i in terms])
+    solution = np.linalg.lstsq(normal, rhs, rcond=None)[0]
+    if task is not None:
+        task.setProgress(50)
+
+    coefficients = np.zeros((order + 1, order + 1))
+    for (j, i), c in zip(terms, solution):
+        coefficients[j, i] = c
+    # background = py @ coefficients @ px.T on the full grid
+    xTerms = coefficients @ _powers(x, order, scalingX).T
+    py = _powers(y, order, scalingY)
+    return _subtract(z, lambda r0, r1: py[r0:r1] @ xTerms, out, task)
+
+
+def planeFit(x, y, z, section, task=None):
+    """Subtract the plane fitted to the section of z given in index
+    coordinates as [[x1, y1], [x2, y2]]."""
+    return polynomialFit(x, y, z, section, order=1, task=task)
+
+
+def lineFit(x, y, z, section=None, axis='x', order=1, out=None, task=None):
+    """Subtract from every line of z along axis, 'x' for the rows and 'y'
+    for the columns, the polynomial of the given order fitted to it.
+
+    Only the values of the lines within the section, given in index
+    coordinates as [[x1, y1], [x2, y2]], are fitted, all lines by
+    default. The fits of all lines are solved at once from sums over the
+    lines.
+    """
+    z = np.asarray(z)
+    if axis == 'y':
+        # fit the rows of the transposed data
+        if out is None:
+            out = np.empty(z.shape, dtype=np.result_type(z, float))
+        if section is not None:
+            section = np.asarray(section)[:, ::-1]
+        lineFit(y, x, z.T, section, 'x', order, out.T, task)
+        return out
+    x = np.asarray(x, dtype=float)
+    if section is None:
+        columns = slice(None)
+    else:
+        columns = slice(section[0, 0], section[1, 0])
+    fitX = x[columns]
+    scaling = _scaling(fitX)
+    weights, fitZ = _weights(z[:, columns], fitX, np.zeros(z.shape[0]))
+    px = np.nan_to_num(_powers(fitX, 2 * order, scaling))
+    # normal matrices of all lines from the sums of x**(i+k) per line
+    index = np.add.outer(np.arange(order + 1), np.arange(order + 1))
+    if weights.all():
+        normal = np.linalg.pinv(px.sum(axis=0)[index])
+        coefficients = (fitZ @ px[:, :order + 1]) @ normal.T
+    else:
+        normal = np.linalg.pinv((weights @ px)[:, index])
+        rhs = fitZ @ px[:, :order + 1]
+        coefficients = (normal @ rhs[:, :, None])[:, :, 0]
+    if task is not None:
+        task.setProgress(50)
+
+    xTerms = _powers(x, order, scaling).T
+    return _subtract(z, lambda r0, r1: coefficients[r0:r1] @ xTerms, out, task)
+
+
+def levelLines(z, axis='x', method='median', task=None):
+    """Subtract the median or mean of every line of z along axis, 'x' for
+    the rows and 'y' for the columns."""
+    z = np.asarray(z)
+    func = np.nanmedian if method == 'median' else np.nanmean
+    with warnings.catch_warnings():
+        # lines without any finite values
+        warnings.simplefilter('ignore', RuntimeWarning)
+        return z - func(z, axis=1 if axis == 'x' else 0, keepdims=True)
+
+
+def derivative(x, y, z, axis='x', task=None):
+    """Derivative of z along axis, 'x' or 'y', with respect to the
+    setpoints."""
+    z = np.asarray(z)
+    coords, index = (x, 1) if axis == 'x' else (y, 0)
+    if z.shape[index] < 2:
+        return np.zeros_like(z, dtype=float)
+    coords = np.asarray(coords, dtype=float)
+    if not np.isfinite(coords).all() or np.any(np.diff(coords) == 0):
+        # per step of the setpoints
+        return np.gradient(z, axis=index)
+    return np.gradient(z, coords, axis=index)
+
+
+def smooth(z, sigma=1.0, task=None):
+    """Gaussian smoothing of z with a width of sigma data points. Values
+    that are not finite are left out and stay NaN."""
+    from scipy.ndimage import gaussian_filter
+    z = np.asarray(z, dtype=float)
+    finite = np.isfinite(z)
+    if finite.all():
+        return gaussian_filter(z, sigma)
+    values = gaussian_filter(np.where(finite, z, 0), sigma)
+    if task is not None:
+        task.setProgress(50)
+    weights = gaussian_filter(finite.astype(float), sigma)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        smoothed = values / weights
+    smoothed[~finite] = np.nan
+    return smoothed
+
+
+def offsetScale(z, offset=0.0, scale=1.0, task=None):
+    """z multiplied by scale plus offset."""
+    return np.asarray(z) * scale + offset
+
+
+def crop(z, section, task=None):
+    """Only the section of z given in index coordinates as
+    [[x1, y1], [x2, y2]], the values outside are NaN. The shape of z is
+    kept, so that the setpoints still apply."""
+    z = np.asarray(z)
+    # the corners may be given in any order
+    (x1, y1), (x2, y2) = np.sort(np.asarray(section), axis=0)
+    cropped = np.full(z.shape, np.nan)
+    cropped[y1:y2, x1:x2] = z[y1:y2, x1:x2]
+    return cropped
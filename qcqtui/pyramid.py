@@ -0,0 +1,197 @@
+import warnings
+
+import numpy as np
+
+
+# functions combining the values of blocks per mode, for blocks with and
+# without NaN values
+_reductions = {'mean': (np.nanmean, np.mean),
+               'min': (np.nanmin, np.min),
+               'max': (np.nanmax, np.max)}
+
+
+def _reduce(data, factor, mode, band=64):
+    # combine blocks of factor x factor values, padding the last blocks
+    # with NaN. The rows are reduced in bands of blocks, so that only
+    # temporary copies of a band are made.
+    rows, cols = data.shape
+    out = np.empty((-(-rows // factor), -(-cols // factor)))
+    for r in range(0, rows, band * factor):
+        chunk = data[r:r + band * factor]
+        shape = (-(-chunk.shape[0] // factor) * factor, out.shape[1] * factor)
+        if chunk.shape != shape:
+            padded = np.full(shape, np.nan)
+            padded[:chunk.shape[0], :cols] = chunk
+            chunk = padded
+        blocks = chunk.reshape(shape[0] // factor, factor, shape[1] // factor, factor)
+        # the NaN aware functions are much slower
+        func = _reductions[mode][0 if np.isnan(chunk).any() else 1]
+        with warnings.catch_warnings():
+            # blocks consisting of NaN only, e.g. of interrupted sweeps
+            warnings.simplefilter('ignore', RuntimeWarning)
+            out[r // factor:r // factor + blocks.shape[0]] = func(blocks, axis=(1, 3))
+    return out
+
+
+def _limits(data):
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)
+        return np.nanmin(data), np.nanmax(data)
+
+
+def limits(data, task=None, band=1024):
+    """Minimum and maximum of a 2D array, computed in bands of rows, so
+    that it can be run as a task that is cancelled in between."""
+    bands = []
+    for r in range(0, len(data), band):
+        if task is not None:
+            task.checkCancelled()
+        bands.append(_limits(data[r:r + band]))
+    if not bands:
+        return np.nan, np.nan
+    lows, highs = zip(*bands)
+    return _limits(lows)[0], _limits(highs)[1]
+
+
+class ImagePyramid:
+    """Level of detail representation of a 2D array for display.
+
+    Level 0 is the full resolution data, every further level halves both
+    dimensions. For each level the mean, minimum or maximum of the
+    combined data points can be shown, so that extrema do not get lost in
+    the coarser levels.
+
+    The levels are computed from the full resolution data when they are
+    requested first, so that only the levels and modes that are shown
+    take time and memory.
+
+    Args:
+        data: 2D array
+        minSize: there are no further levels once both dimensions are
+            smaller than this
+    """
+    modes = ('mean', 'min', 'max')
+
+    def __init__(self, data, minSize=256):
+        self.data = np.asarray(data, dtype=float)
+        self.shape = self.data.shape
+        self.numLevels = 1
+        size = max(self.shape)
+        while size > minSize:
+            size = -(-size // 2)
+            self.numLevels += 1
+        # the computed levels by (level, mode)
+        self._levels = dict()
+        self._limits = None
+
+    def __len__(self):
+        return self.numLevels
+
+    def get(self, level, mode='mean'):
+        """The data of a level, computed if it is requested for the first
+        time."""
+        if level == 0:
+            return self.data
+        if (level, mode) not in self._levels:
+            self._levels[level, mode] = _reduce(self.data, 2**level, mode)
+        return self._levels[level, mode]
+
+    def update(self, data, rows):
+        """Recompute the computed levels for a range of rows of the full
+        resolution data, after they have been changed in place.
+
+        Args:
+            data: the full resolution data
+            rows: (start, stop) of the changed rows
+        """
+        self.data = np.asarray(data, dtype=float)
+        start, stop = rows
+        for (level, mode), values in self._levels.items():
+            factor = 2**level
+            b0, b1 = start // factor, -(-stop // factor)
+            values[b0:b1] = _reduce(self.data[b0*factor:b1*factor], factor, mode)
+        if start <= 0 and stop >= self.shape[0]:
+            self._limits = None
+        elif self._limits is not None and stop > start:
+            # widen the limits to the new values
+            lo, hi = _limits(self.data[start:stop])
+            self._limits = (np.nanmin([self._limits[0], lo]),
+                            np.nanmax([self._limits[1], hi]))
+
+    def limits(self):
+        """Minimum and maximum of the full resolution data."""
+        if self._limits is None:
+            self._limits = _limits(self.data)
+        return self._limits
+
+    def hasLimits(self):
+        """Whether the limits are known without scanning the data."""
+        return self._limits is not None
+
+    def setLimits(self, limits):
+        """Set the limits computed elsewhere, e.g. by the function limits
+        off the GUI thread."""
+        self._limits = tuple(limits)
+
+    def level(self, rows, cols, height, width):
+        """Coarsest level that still has at least one data point per pixel
+        when showing the given section.
+
+        Args:
+            rows: (start, stop) of the shown rows at full resolution
+            cols: (start, stop) of the shown columns at full resolution
+            height: height of the display in pixels
+            width: width of the display in pixels
+        """
+        pointsPerPixel = max((rows[1] - rows[0]) / max(height, 1),
+                             (cols[1] - cols[0]) / max(width, 1))
+        if pointsPerPixel <= 1:
+            return 0
+        return int(min(np.floor(np.log2(pointsPerPixel)), self.numLevels - 1))
+
+    def tile(self, level, rows, cols, mode='mean', margin=0.25):
+        """Section of a level covering the given full resolution rows and
+        columns plus a margin relative to the section size, so that small
+        pans do not need a new tile.
+
+        Returns:
+            the data of the tile and its (start, stop) rows and columns in
+            full resolution indices. The stop of the last tile may exceed
+            the shape of the data by less than the size of a block.
+        """
+        scale = 2**level
+        data = self.get(level, mode)
+        bounds = []
+        for (start, stop), size in zip((rows, cols), data.shape):
+            extra = margin * (stop - start)
+            start = int(np.clip(np.floor((start - extra) / scale), 0, size - 1))
+            stop = int(np.clip(np.ceil((stop + extra) / scale), start + 1, size))
+            bounds.append((start, stop))
+        (r0, r1), (c0, c1) = bounds
+        return (data[r0:r1, c0:c1],
+                (r0*scale, r1*scale), (c0*scale, c1*scale))
+
+
+def thumbnail(data, size=48, task=None):
+    """Downsampled copy of a 2D array with at most size values along both
+    dimensions, as means of blocks of values. Large arrays are sampled at
+    evenly spaced rows and columns first, so that only a small part of
+    memory mapped data is read."""
+    data = np.asarray(data)
+    # a few samples per block along both dimensions
+    steps = [max(n // (4 * size), 1) for n in data.shape]
+    data = np.asarray(data[::steps[0], ::steps[1]], dtype=float)
+    if task is not None:
+        task.checkCancelled()
+    factors = [-(-n // size) for n in data.shape]
+    rows, cols = [-(-n // f) * f for n, f in zip(data.shape, factors)]
+    if (rows, cols) != data.shape:
+        padded = np.full((rows, cols), np.nan)
+        padded[:data.shape[0], :data.shape[1]] = data
+        data = padded
+    blocks = data.reshape(rows // factors[0], factors[0],
+                          cols // factors[1], factors[1])
+    with warnings.catch_warnings():
+        # blocks that have not been measured yet
+        warnings.simplefilter('ignore', RuntimeWarning)
+        return np.nanmean(blocks, axis=(1, 3))
@@ -0,0 +1,207 @@
+import json
+import struct
+import weakref
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from qcodes.data.data_array import DataArray
+
+from PyQt5.QtCore import QObject, QTimer, pyqtSignal
+
+from .loader import dataSetFromArrays
+
+# layout of the control block: update sequence number, number of rows of
+# the outermost loop reached so far, closed flag and length of the JSON
+# description of the arrays, which follows directly after
+_CONTROL = struct.Struct('<QqQQ')
+
+
+def _attach(name):
+    # attach to an existing block without handing it over to the resource
+    # tracker of this process, which would remove it when the viewer exits
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        shm = shared_memory.SharedMemory(name=name)
+        try:
+            from multiprocessing import resource_tracker
+            resource_tracker.unregister(shm._name, 'shared_memory')
+        except Exception:
+            pass
+        return shm
+
+
+def _wrap(block, shape, dtype):
+    # array on the memory of block without copying. The block is closed
+    # once the array and all views of it are gone, as accessing it after
+    # closing would crash.
+    data = np.ndarray(shape, dtype=dtype, buffer=block.buf)
+    weakref.finalize(data, block.close).atexit = False
+    return data
+
+
+class SharedDataPublisher:
+    """Publishes the arrays of a running measurement to viewers in other
+    processes through shared memory.
+
+    The ndarray of every array is replaced by one backed by a shared
+    memory block, so the measurement writes directly into memory that
+    viewers map without copying. After writing, call notify, e.g. as a
+    background task of the loop, to let the viewers know about the new
+    rows. Any number of viewers can subscribe by the name of the
+    publisher.
+
+    Args:
+        name: name the viewers subscribe to, unique on this machine
+        dataSet: qcodes DataSet or iterable of DataArrays to publish
+    """
+    def __init__(self, name, dataSet):
+        arrays = list(getattr(dataSet, 'arrays', {}).values()) or list(dataSet)
+        self.name = name
+        self.arrays = arrays
+        self._blocks = []
+        infos = []
+        for i, array in enumerate(arrays):
+            if array.ndarray is None:
+                array.init_data()
+            data = array.ndarray
+            block = shared_memory.SharedMemory(name='{}_{}'.format(name, i),
+                                               create=True,
+                                               size=max(data.nbytes, 1))
+            shared = _wrap(block, data.shape, data.dtype)
+            shared[...] = data
+            array.ndarray = shared
+            self._blocks.append(block)
+            infos.append({'block': block.name,
+                          'array_id': array.array_id,
+                          'name': array.name,
+                          'label': array.label,
+                          'unit': array.unit,
+                          'is_setpoint': array.is_setpoint,
+                          'set_arrays': [a.array_id for a in array.set_arrays],
+                          'shape': list(data.shape),
+                          'dtype': data.dtype.str})
+        header = json.dumps({'arrays': infos}).encode()
+        self._control = shared_memory.SharedMemory(
+            name=name, create=True, size=_CONTROL.size + len(header))
+        self._control.buf[_CONTROL.size:_CONTROL.size + len(header)] = header
+        self._sequence = 0
+        self._rows = 0
+        self._write(closed=False, headerLength=len(header))
+
+    def _write(self, closed=False, headerLength=None):
+        if headerLength is None:
+            headerLength = _CONTROL.unpack_from(self._control.buf)[3]
+        _CONTROL.pack_into(self._control.buf, 0, self._sequence, self._rows,
+                           int(closed), headerLength)
+
+    def _reachedRows(self):
+        # rows of the outermost loop written so far, from the write
+        # tracking of the DataArrays
+        rows = 0
+        for array in self.arrays:
+            if array.is_setpoint or not array.ndarray.ndim:
+                continue
+            last = -1
+            if getattr(array, 'modified_range', None):
+                last = array.modified_range[1]
+            last = max(last, getattr(array, 'last_saved_index', None) or -1)
+            rowSize = max(int(np.prod(array.ndarray.shape[1:])), 1)
+            rows = max(rows, last // rowSize + 1)
+        return rows
+
+    def notify(self, rows=None):
+        """Tell the viewers that new values have been written.
+
+        Args:
+            rows: number of rows of the outermost loop that have been
+                reached, determined from the arrays by default
+        """
+        self._rows = max(self._rows, self._reachedRows() if rows is None else rows)
+        self._sequence += 1
+        self._write()
+
+    def close(self):
+        """Stop publishing. The arrays get their own memory again, the
+        shared memory is freed once no viewer maps it any more."""
+        self._sequence += 1
+        self._write(closed=True)
+        for array, block in zip(self.arrays, self._blocks):
+            array.ndarray = np.array(array.ndarray)
+            block.unlink()
+        self._blocks = []
+        self._control.close()
+        self._control.unlink()
+
+
+class SharedDataSubscriber(QObject):
+    """Shows the arrays of a SharedDataPublisher in another process.
+
+    The arrays of the data set are mapped from the shared memory blocks
+    without copying. The update sequence number of the publisher is
+    polled, which is a single read from shared memory, so the signals
+    match those of DataSetFollower.
+
+    Args:
+        name: name of the publisher
+        interval: polling interval in ms
+    """
+    # emitted with the data set once attached to the publisher
+    started = pyqtSignal(object)
+    # range of the first index of the arrays that has been updated
+    updated = pyqtSignal(int, int)
+    # the publisher has stopped
+    closed = pyqtSignal()
+
+    def __init__(self, name, interval=50, parent=None):
+        QObject.__init__(self, parent)
+        self.name = name
+        self._control = _attach(name)
+        sequence, rows, closed, headerLength = _CONTROL.unpack_from(self._control.buf)
+        header = json.loads(bytes(
+            self._control.buf[_CONTROL.size:_CONTROL.size + headerLength]).decode())
+        arrays = dict()
+        for info in header['arrays']:
+            data = _wrap(_attach(info['block']), tuple(info['shape']),
+                         np.dtype(info['dtype']))
+            arrays[info['array_id']] = DataArray(
+                name=info['name'], array_id=info['array_id'],
+                label=info['label'], unit=info['unit'],
+                is_setpoint=info['is_setpoint'], preset_data=data)
+        for info in header['arrays']:
+            arrays[info['array_id']].set_arrays = tuple(
+                arrays[i] for i in info['set_arrays'])
+        self.dataSet = dataSetFromArrays(arrays.values())
+        self._sequence = sequence
+        self._rows = rows
+        self._timer = QTimer(self)
+        self._timer.setInterval(interval)
+        self._timer.timeout.connect(self.poll)
+
+    def start(self):
+        self.started.emit(self.dataSet)
+        self._timer.start()
+
+    def stop(self):
+        self._timer.stop()
+
+    def isActive(self):
+        return self._timer.isActive()
+
+    def poll(self):
+        if self._control is None:
+            return
+        sequence, rows, closed, _ = _CONTROL.unpack_from(self._control.buf)
+        if sequence != self._sequence:
+            self._sequence = sequence
+            # the last row seen before may have been incomplete
+            start = max(min(self._rows, rows) - 1, 0)
+            self._rows = rows
+            self.updated.emit(start, max(rows, start + 1))
+        if closed:
+            # the arrays stay mapped, only the control block is released
+            self.stop()
+            self._control.close()
+            self._control = None
+            self.closed.emit()
@@ -1,51 +1,240 @@
-# QCoDeS
-from qcodes.plots.base import BasePlot
+from collections import OrderedDict
+
+import numpy as np
 
 # PyQt
-from PyQt5 import QtWidgets, QtCore
-from PyQt5.QtWidgets import  QAction, QApplication, QListWidget, QListWidgetItem
+from PyQt5 import QtCore
+from PyQt5.QtCore import QAbstractListModel, QModelIndex, QSize, QThreadPool
+from PyQt5.QtGui import QImage, QPixmap
+from PyQt5.QtWidgets import QAbstractItemView, QListView
+
+from ..pyramid import thumbnail
+from ..worker import TaskExecutor
+
+# role of the DataArray of an entry, None while the data set is loading
+DataArrayRole = QtCore.Qt.UserRole
+
+
+def _thumbnailColors(z, size, cmap='viridis', task=None):
+    # RGBA values of the thumbnail of z, with the first row at the top and
+    # values that are not finite transparent
+    import matplotlib
+    small = thumbnail(z, size, task=task)[::-1]
+    finite = np.isfinite(small)
+    if finite.any():
+        lo, hi = np.nanmin(small), np.nanmax(small)
+        small = (small - lo) / ((hi - lo) or 1)
+    colors = matplotlib.colormaps[cmap](np.where(finite, small, 0), bytes=True)
+    colors[~finite] = 0
+    return np.ascontiguousarray(colors)
+
+
+class DataArrayModel(QAbstractListModel):
+    """The measured arrays of a data set, with a thumbnail of each.
+
+    Thumbnails are only computed for the rows the view asks for, which
+    are the visible ones, on threads of a pool of their own. The most
+    recently shown ones are cached.
+    """
+    thumbnailSize = 48
+    maxThumbnails = 256
+
+    def __init__(self, parent=None):
+        QAbstractListModel.__init__(self, parent)
+        # [name, DataArray or None]
+        self._entries = []
+        self._thumbnails = OrderedDict()
+        # names of the arrays whose thumbnails are being computed
+        self._pending = set()
+        # few threads, so that loading and processing are not held up
+        self._pool = QThreadPool(self)
+        self._pool.setMaxThreadCount(2)
+        self.executor = TaskExecutor(self, pool=self._pool)
+        self.executor.failed.connect(self._onFailed)
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._entries)
+
+    def data(self, index, role=QtCore.Qt.DisplayRole):
+        if not index.isValid() or index.row() >= len(self._entries):
+            return None
+        name, dataArray = self._entries[index.row()]
+        if role == QtCore.Qt.DisplayRole:
+            return name
+        if role == DataArrayRole:
+            return dataArray
+        if dataArray is None:
+            return None
+        if role == QtCore.Qt.ToolTipRole:
+            shape = getattr(dataArray.ndarray, 'shape', ())
+            return '{} ({}), {}'.format(dataArray.label or name, dataArray.unit,
+                                        ' x '.join(str(n) for n in shape))
+        if role == QtCore.Qt.DecorationRole:
+            return self._thumbnail(name, dataArray)
+        return None
+
+    def names(self):
+        return [name for name, _ in self._entries]
+
+    def dataArrays(self):
+        """The loaded arrays by name."""
+        return OrderedDict((name, dataArray) for name, dataArray in self._entries
+                           if dataArray is not None)
+
+    def setEntries(self, entries):
+        """Show a new list of arrays.
+
+        Args:
+            entries: list of (name, DataArray), the DataArray may be None
+                while the data set is loading
+        """
+        self.beginResetModel()
+        self.executor.cancelAll()
+        self._entries = [list(entry) for entry in entries]
+        self._thumbnails.clear()
+        self._pending.clear()
+        self.endResetModel()
+
+    def _thumbnail(self, name, dataArray):
+        pixmap = self._thumbnails.get(name)
+        if pixmap is not None:
+            self._thumbnails.move_to_end(name)
+            return pixmap
+        z = dataArray.ndarray
+        if name not in self._pending and z is not None and z.ndim == 2:
+            self._pending.add(name)
+            self.executor.submit(
+                'thumbnail ' + name, _thumbnailColors, z, self.thumbnailSize,
+                onResult=lambda colors, name=name: self._onThumbnail(name, colors))
+        return None
+
+    def keepThumbnails(self, first, last):
+        """Cancel the thumbnails requested for rows outside of first to
+        last, e.g. after scrolling. They are requested again once the rows
+        are shown."""
+        keep = set(self.names()[first:last + 1])
+        for name in list(self._pending - keep):
+            self.executor.cancel('thumbnail ' + name)
+            self._pending.discard(name)
 
-class DataArrayListWidget(QListWidget):
+    def _onThumbnail(self, name, colors):
+        self._pending.discard(name)
+        height, width = colors.shape[:2]
+        image = QImage(colors.data, width, height, 4 * width,
+                       QImage.Format_RGBA8888)
+        self._thumbnails[name] = QPixmap.fromImage(image).scaled(
+            self.thumbnailSize, self.thumbnailSize, QtCore.Qt.KeepAspectRatio)
+        while len(self._thumbnails) > self.maxThumbnails:
+            self._thumbnails.popitem(last=False)
+        names = self.names()
+        if name in names:
+            index = self.index(names.index(name))
+            self.dataChanged.emit(index, index, [QtCore.Qt.DecorationRole])
+
+    def _onFailed(self, taskName, message):
+        self._pending.discard(taskName[len('thumbnail '):])
+
+
+class DataArrayListWidget(QListView):
 
     def __init__(self, dataArrayChanged, parent=None):
         self.dataArrayChanged = dataArrayChanged
-        QListWidget.__init__(self, parent)
+        QListView.__init__(self, parent)
+        self.arrayModel = DataArrayModel(self)
+        self.setModel(self.arrayModel)
+        self.setIconSize(QSize(DataArrayModel.thumbnailSize,
+                               DataArrayModel.thumbnailSize))
+        # the size of every row is known from the first one, so that the
+        # view does not query all rows for laying them out
+        self.setUniformItemSizes(True)
+        # several arrays can be selected for comparing them
+        self.setSelectionMode(QAbstractItemView.ExtendedSelection)
         self.selectionModel().currentChanged.connect(self.onSelectionChange)
-        self.dataArrays = dict()
+        self.verticalScrollBar().valueChanged.connect(self._onScrolled)
+        self._dataset = None
+        # name of the array selected while the data set is still loading
+        self._pendingSelection = None
+
+    @property
+    def dataArrays(self):
+        return self.arrayModel.dataArrays()
+
+    def selectedDataArrays(self):
+        """The loaded arrays that are selected, in the order of the list."""
+        rows = sorted(index.row() for index in self.selectedIndexes())
+        arrays = [self.arrayModel.index(row).data(DataArrayRole) for row in rows]
+        return [a for a in arrays if a is not None]
 
     def onSelectionChange(self, current, previous):
-        # TODO: add some fail check to this
-        print('current = {}'.format(current.data()))
-        self.dataArrayChanged.emit(self.dataArrays[current.data()])
+        dataArray = current.data(DataArrayRole)
+        if dataArray is None:
+            # the data set is still loading, show the array once it is loaded
+            self._pendingSelection = current.data()
+            return
+        self.dataArrayChanged.emit(dataArray)
 
+    def _onScrolled(self, value):
+        first = self.indexAt(self.viewport().rect().topLeft())
+        last = self.indexAt(self.viewport().rect().bottomLeft())
+        if first.isValid():
+            self.arrayModel.keepThumbnails(
+                first.row(),
+                last.row() if last.isValid() else self.arrayModel.rowCount() - 1)
+
+    @staticmethod
+    def _names(arrays):
+        # names shown for the measured arrays, given as tuples of
+        # (name, is_setpoint, data)
+        iUnnamed=1
+        for name, is_setpoint, data in arrays:
+            if not is_setpoint:
+                if name == '' or not name:
+                    name = 'unamed {}'.format(iUnnamed)
+                    iUnnamed += 1
+                yield name, data
+
+    def loadMetadata(self, arrays):
+        """List the names of the arrays of a data set that is being loaded.
+
+        Args:
+            arrays: list of dicts with the name and is_setpoint of every
+                array of the data set
+        """
+        self._pendingSelection = None
+        self.arrayModel.setEntries(
+            self._names((a.get('name'), a.get('is_setpoint'), None)
+                        for a in arrays))
+
+    def cancelLoading(self):
+        """List the arrays of the previous data set again, after loading a
+        new one has been cancelled."""
+        self._pendingSelection = None
+        if self._dataset is not None:
+            self._populate()
+        else:
+            self.arrayModel.setEntries([])
 
     def loadDataSet(self, dataset):
         self._dataset = dataset
+        pending = self._pendingSelection
+        self._pendingSelection = None
         self._populate()
+        names = self.arrayModel.names()
         # set the active view
-        # for now just use the first array
-        for data_array in self._dataset.arrays.values():
-            if not data_array.is_setpoint:
-                break
+        if pending in self.dataArrays:
+            data_array = self.dataArrays[pending]
+            # only mark the selection, the array is shown below
+            self.selectionModel().blockSignals(True)
+            self.setCurrentIndex(self.arrayModel.index(names.index(pending)))
+            self.selectionModel().blockSignals(False)
+        else:
+            # for now just use the first array
+            for data_array in self._dataset.arrays.values():
+                if not data_array.is_setpoint:
+                    break
         self.dataArrayChanged.emit(data_array)
 
     def _populate(self):
-        self.clear()
-        self.dataArrays.clear()
-        iUnnamed=1
-        for data_array in self._dataset.arrays.values():
-            if not data_array.is_setpoint:
-                # for now, store dataarrays in dictionary
-                name = data_array.name
-                print(name)
-                if name == '' or not name:
-                    name = 'unamed {}'.format(iUnnamed)
-                    iUnnamed += 1
-                self.dataArrays[name] = data_array
-                item = QListWidgetItem(name, self)
-                # 0 display role... cant find include at the moment
-                # TODO: replace by proper constant Qt.DisplayRole
-                item.setData(0,data_array)
-                item.setText(name)
-                # data_array.name
-                self.addItem(item)
+        self.arrayModel.setEntries(
+            self._names((a.name, a.is_setpoint, a)
+                        for a in self._dataset.arrays.values()))
@@ -0,0 +1,57 @@
+# PyQt
+from PyQt5 import QtCore
+from PyQt5.QtWidgets import QInputDialog, QListWidget, QListWidgetItem
+
+
+class PipelineWidget(QListWidget):
+    """Lists the stages of the processing pipeline of a CrossSectionWidget.
+
+    Double clicking a stage edits its parameters, the delete key removes
+    it. Parameters that are arrays, like the selected section, are set by
+    the tool that adds the stage and not shown.
+    """
+
+    def __init__(self, crossSectionWidget, parent=None):
+        QListWidget.__init__(self, parent)
+        self.crossSectionWidget = crossSectionWidget
+        self.stages = []
+        crossSectionWidget.stagesChanged.connect(self.showStages)
+        self.itemDoubleClicked.connect(self.onEdit)
+
+    @staticmethod
+    def _editable(stage):
+        return [(name, value) for name, value in stage.params.items()
+                if isinstance(value, (int, float, str)) and not isinstance(value, bool)]
+
+    def showStages(self, stages):
+        self.stages = list(stages)
+        self.clear()
+        for stage in self.stages:
+            params = ', '.join('{}={}'.format(name, value)
+                               for name, value in self._editable(stage))
+            text = '{} ({})'.format(stage.name, params) if params else stage.name
+            self.addItem(QListWidgetItem(text, self))
+
+    def onEdit(self, item):
+        index = self.row(item)
+        stage = self.stages[index]
+        changes = dict()
+        for name, value in self._editable(stage):
+            if isinstance(value, str):
+                value, ok = QInputDialog.getText(self, stage.name, name, text=value)
+            elif isinstance(value, int):
+                value, ok = QInputDialog.getInt(self, stage.name, name, value)
+            else:
+                value, ok = QInputDialog.getDouble(self, stage.name, name, value,
+                                                   -1e300, 1e300, 6)
+            if not ok:
+                return
+            changes[name] = value
+        if changes:
+            self.crossSectionWidget.setStageParams(index, **changes)
+
+    def keyPressEvent(self, event):
+        if event.key() == QtCore.Qt.Key_Delete and self.currentRow() >= 0:
+            self.crossSectionWidget.removeStage(self.currentRow())
+        else:
+            QListWidget.keyPressEvent(self, event)
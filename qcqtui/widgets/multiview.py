@@ -0,0 +1,267 @@
+# matplotlib
+import matplotlib
+matplotlib.use("QT5Agg")
+from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
+from matplotlib.figure import Figure
+from matplotlib.gridspec import GridSpec
+
+# numpy
+import numpy as np
+
+# PyQt
+from PyQt5 import QtCore
+
+from ..axisindex import AxisIndex
+from ..frames import FrameScheduler
+from ..instrument import LatencyRecorder, timed
+from .xsection import CrossSectionWidget
+
+
+def _setpoints(dataArray):
+    # x and y setpoints of a 2D data array
+    y, x = dataArray.set_arrays[:2]
+    return (np.asarray(x.ndarray, dtype=float)[0, :],
+            np.asarray(y.ndarray, dtype=float))
+
+
+def _label(dataArray):
+    return "{} ({})".format(dataArray.label or dataArray.name, dataArray.unit)
+
+
+def sameSetpoints(a, b):
+    """Whether two 2D data arrays are measured at the same setpoints."""
+    if np.shape(a.ndarray) != np.shape(b.ndarray):
+        return False
+    if tuple(a.set_arrays) == tuple(b.set_arrays):
+        return True
+    return all(np.array_equal(s, t, equal_nan=True)
+               for s, t in zip(_setpoints(a), _setpoints(b)))
+
+
+def sharedSetpointArrays(dataArrays):
+    """The measured 2D arrays of a list that have the same setpoints as the
+    first of them."""
+    arrays = [a for a in dataArrays if not a.is_setpoint and
+              a.ndarray is not None and np.ndim(a.ndarray) == 2]
+    return [a for a in arrays if sameSetpoints(arrays[0], a)] if arrays else []
+
+
+class MultiArrayWidget(FigureCanvas):
+    """Several data arrays measured at the same setpoints, e.g. channels of
+    the same sweep, with one cursor for all of them.
+
+    Every array is shown in a row with its map and the cross sections
+    along x and along y at the cursor. The maps and cross sections share
+    their setpoint axes, so that zooming into one zooms all of them.
+
+    A mouse movement takes a single index lookup for all panels, and the
+    cross sections and cursors of all panels are blitted onto one cached
+    background of the figure at once, so the time per frame grows slower
+    than the number of panels.
+
+    Args:
+        dataArrays: list of 2D DataArrays with the same setpoints
+        parent: parent widget
+        maxFPS: maximum number of frames per second rendered on mouse
+            movement
+    """
+    def __init__(self, dataArrays, parent=None, maxFPS=60):
+        self.latency = LatencyRecorder()
+        self.fig = Figure()
+        FigureCanvas.__init__(self, self.fig)
+        self.setParent(parent)
+        self.setFocusPolicy(QtCore.Qt.ClickFocus)
+
+        # latest requested cursor position in data and index coordinates
+        self._pendingPos = None
+        # the cross sections stay at a clicked position until released by
+        # the right mouse button
+        self.live = True
+        self.frames = FrameScheduler(self._onFrame, self, maxFPS=maxFPS)
+        # background of the whole figure without the animated artists and
+        # the view state it was captured for
+        self._background = None
+        self._backgroundState = None
+
+        self.setDataArrays(dataArrays)
+
+        self.mpl_connect('draw_event', self._onDraw)
+        self.mpl_connect('resize_event', self._invalidateBackground)
+        self.mpl_connect('motion_notify_event', self._onMouseMove)
+        self.mpl_connect('button_press_event', self._onMouseDown)
+
+    def setDataArrays(self, dataArrays):
+        """Show a new list of data arrays, which have to share their
+        setpoints."""
+        dataArrays = list(dataArrays)
+        if not dataArrays:
+            raise ValueError('no data arrays to show')
+        for dataArray in dataArrays[1:]:
+            if not sameSetpoints(dataArrays[0], dataArray):
+                raise ValueError('{} is not measured at the same setpoints as {}'.format(
+                    dataArray.name, dataArrays[0].name))
+        self.dataArrays = dataArrays
+        xaxis, yaxis = _setpoints(dataArrays[0])
+        # one index for all panels
+        self.xindex = AxisIndex(xaxis)
+        self.yindex = AxisIndex(yaxis)
+        self.xaxis, self.yaxis = xaxis, yaxis
+        self.pos = [len(xaxis) // 2, len(yaxis) // 2]
+        self._build()
+
+    def _build(self):
+        self.fig.clear()
+        self._invalidateBackground()
+        grid = GridSpec(len(self.dataArrays), 3, figure=self.fig,
+                        width_ratios=[2, 1, 1])
+        xlabel = _label(self.dataArrays[0].set_arrays[1])
+        ylabel = _label(self.dataArrays[0].set_arrays[0])
+        self.panels = []
+        self._animated = []
+        main = None
+        for row, dataArray in enumerate(self.dataArrays):
+            z = np.asarray(dataArray.ndarray)
+            mainAx = self.fig.add_subplot(grid[row, 0], sharex=main, sharey=main)
+            main = main or mainAx
+            xAx = self.fig.add_subplot(grid[row, 1], sharex=main)
+            yAx = self.fig.add_subplot(grid[row, 2], sharey=main)
+            self._drawMap(mainAx, z)
+            mainAx.set_title(_label(dataArray), fontsize='small')
+            mainAx.set_ylabel(ylabel)
+            xAx.set_ylabel(_label(dataArray))
+            yAx.set_xlabel(_label(dataArray))
+            if row == len(self.dataArrays) - 1:
+                mainAx.set_xlabel(xlabel)
+                xAx.set_xlabel(xlabel)
+            panel = {
+                'dataArray': dataArray, 'z': z,
+                'main': mainAx, 'x': xAx, 'y': yAx,
+                'rowLine': xAx.plot(self.xaxis, z[self.pos[1], :],
+                                    color='C0', marker='.', animated=True)[0],
+                'columnLine': yAx.plot(z[:, self.pos[0]], self.yaxis,
+                                       color='C0', marker='.', animated=True)[0],
+                'crosshair': [mainAx.axhline(self.yaxis[self.pos[1]], color='black',
+                                             lw=1, animated=True),
+                              mainAx.axvline(self.xaxis[self.pos[0]], color='black',
+                                             lw=1, animated=True)]}
+            self._setLimits(panel)
+            self.panels.append(panel)
+            self._animated += [(xAx, panel['rowLine']), (yAx, panel['columnLine'])]
+            self._animated += [(mainAx, line) for line in panel['crosshair']]
+        self._mainAxes = set(panel['main'] for panel in self.panels)
+        self._positionText = self.fig.text(0.01, 0.995, '', va='top',
+                                           fontsize='small', animated=True)
+        self._animated.append((None, self._positionText))
+        self._setPositionText()
+        self.fig.tight_layout(rect=(0, 0, 1, 0.98))
+        self.draw_idle()
+
+    def _drawMap(self, ax, z):
+        if self.xindex.kind == 'uniform' and self.yindex.kind == 'uniform':
+            # a regular grid is drawn as a single image
+            (x0, x1), flipx = CrossSectionWidget._imageExtent(self.xindex)
+            (y0, y1), flipy = CrossSectionWidget._imageExtent(self.yindex)
+            image = z[:, ::-1] if flipx else z
+            image = image[::-1, :] if flipy else image
+            ax.imshow(image, extent=(x0, x1, y0, y1), origin='lower',
+                      aspect='auto', interpolation='nearest')
+        else:
+            x, y = np.meshgrid(self.xaxis, self.yaxis)
+            ax.pcolormesh(x, y, z, edgecolor='face')
+
+    def _setLimits(self, panel):
+        # fixed limits of the cross sections, so that they do not have to be
+        # rescaled on mouse movement
+        z = panel['z']
+        if not np.isfinite(z).any():
+            return
+        lo, hi = np.nanmin(z), np.nanmax(z)
+        margin = 0.05 * ((hi - lo) or abs(hi) or 1)
+        panel['x'].set_ylim(lo - margin, hi + margin)
+        panel['y'].set_xlim(lo - margin, hi + margin)
+
+    def _setPositionText(self):
+        self._positionText.set_text('x = {:.4g}, y = {:.4g}'.format(
+            self.xindex.value(self.pos[0]), self.yindex.value(self.pos[1])))
+
+    # blitting
+    def _viewState(self):
+        # the maps and cross sections share their limits with the first map
+        main = self.panels[0]['main']
+        return (tuple(self.fig.bbox.bounds), tuple(main.get_xlim()),
+                tuple(main.get_ylim()))
+
+    def _invalidateBackground(self, event=None):
+        self._background = None
+        self._backgroundState = None
+
+    @timed('draw')
+    def draw(self):
+        FigureCanvas.draw(self)
+
+    def _onDraw(self, event):
+        self._background = self.copy_from_bbox(self.fig.bbox)
+        self._backgroundState = self._viewState()
+        self._drawAnimated()
+
+    def _drawAnimated(self):
+        for ax, artist in self._animated:
+            if ax is None:
+                self.fig.draw_artist(artist)
+            else:
+                ax.draw_artist(artist)
+
+    def _refresh(self):
+        """Blit all animated artists at once onto the cached background, or
+        redraw the figure if the background is out of date."""
+        if self._background is None or self._backgroundState != self._viewState():
+            self._invalidateBackground()
+            self.draw_idle()
+            return
+        with self.latency.stage('blit'):
+            self.restore_region(self._background)
+            self._drawAnimated()
+            self.blit(self.fig.bbox)
+
+    @timed('frame')
+    def _onFrame(self):
+        pos, self._pendingPos = self._pendingPos, None
+        if pos is None:
+            return
+        self.pos = list(pos)
+        ix, iy = self.pos
+        x, y = self.xaxis[ix], self.yaxis[iy]
+        for panel in self.panels:
+            with self.latency.stage('slicing'):
+                z = panel['z']
+                row, column = z[iy, :], z[:, ix]
+            with self.latency.stage('artists'):
+                panel['rowLine'].set_ydata(row)
+                panel['columnLine'].set_xdata(column)
+                panel['crosshair'][0].set_ydata([y, y])
+                panel['crosshair'][1].set_xdata([x, x])
+        self._setPositionText()
+        self._refresh()
+
+    # events
+    def _requestPos(self, event):
+        with self.latency.stage('index lookup'):
+            self._pendingPos = (self.xindex.index(event.xdata),
+                                self.yindex.index(event.ydata))
+        self.frames.schedule()
+
+    @timed('mouse move')
+    def _onMouseMove(self, event):
+        if self.live and event.inaxes in self._mainAxes:
+            self._requestPos(event)
+
+    @timed('mouse down')
+    def _onMouseDown(self, event):
+        if event.inaxes not in self._mainAxes:
+            return
+        if event.button == 1:
+            # keep the cross sections at the clicked position
+            self.live = False
+            self._requestPos(event)
+        elif event.button == 3:
+            self.live = True
@@ -7,28 +7,90 @@ matplotlib.use("QT5Agg")
 from matplotlib.widgets import Cursor, RectangleSelector
 from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
 from matplotlib.backends.backend_qt5 import NavigationToolbar2QT as NavigationToolbar
-from matplotlib.ticker import FormatStrFormatter
+from matplotlib.transforms import Bbox
 from matplotlib.widgets import RectangleSelector
-import matplotlib.pyplot as plt
-import matplotlib.patches as patches
+import matplotlib.image
 from matplotlib.figure import Figure
-import mplcursors
 
-# scipy and numpy
-from scipy.interpolate import interp2d
+# numpy
 import numpy as np
 
 # PyQt
 from PyQt5 import QtWidgets, QtCore
+from PyQt5.QtCore import pyqtSignal
 
+from contextlib import contextmanager
+import logging
 
-class CrossSectionWidget(FigureCanvas, BasePlot):
+from ..axisindex import AxisIndex
+from ..export import FigureExporter, fullExtent, saveLineData
+from ..frames import FrameScheduler
+from ..integral import IntegralImage
+from ..history import ProcessingHistory
+from ..instrument import LatencyRecorder, timed
+from ..pipeline import Pipeline, Stage, evaluate
+from ..processing import (crop, derivative, levelLines, lineFit, offsetScale,
+                          planeFit, polynomialFit, smooth)
+from ..pyramid import ImagePyramid, limits
+from ..worker import TaskExecutor
+
+log = logging.getLogger(__name__)
 
-    def __init__(self, dataArrayChanged, parent, tools=None, rotateCrossSection = False):
+
+class CrossSectionWidget(FigureCanvas, BasePlot):
+    # images with more data points than this are displayed from a level of
+    # detail pyramid, showing only as many data points as there are pixels
+    pyramidThreshold = 2000*2000
+    # memory budget in bytes of the cached results of the processing pipeline
+    processingMaxBytes = 1024**3
+    # message and timeout in ms for the status bar
+    statusMessage = pyqtSignal(str, int)
+    # the list of stages of the processing pipeline has changed
+    stagesChanged = pyqtSignal(object)
+
+    def __init__(self, dataArrayChanged, parent, tools=None, rotateCrossSection = False,
+                 useBlit=True, maxFPS=60, synchronous=False):
         #
         self.dataArrayChanged = dataArrayChanged
         self.rotateCrossSection = rotateCrossSection
         self.parent = parent
+        # redraw only the cross section lines, their titles and the crosshair
+        # on mouse movement instead of rerendering the whole figure
+        self.useBlit = useBlit
+        # artists that are excluded from the cached backgrounds and redrawn
+        # on top of them, grouped by the key of the axes they belong to
+        self._animated = dict()
+        # cached backgrounds per axes key as tuples of (region, background)
+        self._backgrounds = dict()
+        # view state the backgrounds were captured for, used for invalidation
+        self._backgroundsState = None
+        # set while exporting, so that the animated artists are rendered
+        # normally and no backgrounds are captured from the export renderer
+        self._exporting = False
+
+        # frame scheduling: mouse and key events only record the latest
+        # requested state, which is rendered at most maxFPS times per second
+        # by the FrameScheduler created below
+        # latest requested cursor position in index coordinates
+        self._pendingPos = None
+        # cursor position the cross sections were last rendered at
+        self._renderedPos = None
+        # the static cursor has to be redrawn in the next frame
+        self._pendingStaticCursor = False
+        # the crosshair has moved and has to be redrawn in the next frame
+        self._pendingRefresh = False
+
+        # timings of the event handlers and redraws
+        self.latency = LatencyRecorder()
+
+        # set by showDataArray, the canvas may be resized before
+        self._mesh = None
+        self._pyramid = None
+        # axes and ids of the callbacks showing the level of detail on
+        # changes of the limits of the main axes
+        self._limitCallbacks = None
+        # set by onToolChange, data arrays may be shown before
+        self.tool = 'none'
 
         BasePlot.__init__(self)
 
@@ -47,6 +109,18 @@ class CrossSectionWidget(FigureCanvas, BasePlot):
         # connect events for data array update
         dataArrayChanged.connect(self.onDataArrayChange)
 
+        # processing is run off the GUI thread, unless rendering without an
+        # event loop, as the batch renderer does
+        self.executor = TaskExecutor(self, synchronous=synchronous)
+        self.executor.progress.connect(
+            lambda name, percent: self.statusMessage.emit(
+                "{}: {}%".format(name, percent), 0))
+        self.executor.finished.connect(
+            lambda name: self.statusMessage.emit("{}: done".format(name), 2000))
+        self.executor.failed.connect(self._onTaskFailed)
+
+        self.frames = FrameScheduler(self._onFrame, self, maxFPS=maxFPS)
+
         # connect events for tools
         if tools is not None:
         # this function does not do anything. It is however necessary to create a new scope for id
@@ -59,12 +133,78 @@ class CrossSectionWidget(FigureCanvas, BasePlot):
         # add toolbar
         self.mpl_toolbar = NavigationToolbar(self, parent)
 
+        # capture the backgrounds for blitting after every full redraw.
+        # Resizing and zooming always trigger a full redraw.
+        self.mpl_connect('draw_event', self._onDraw)
+        self.mpl_connect('resize_event', self._invalidateBackgrounds)
+        self.mpl_connect('resize_event', self._updateLevelOfDetail)
+
     def onDataArrayChange(self, dataArray):
-        print('on data array change in xsection widget')
+        if self._sharesSetpoints(dataArray):
+            # e.g. another channel of the same sweep
+            self.swapDataArray(dataArray)
+            return
         self.onToolChange('None') # this is kind of a hacky quick fix
         self.showDataArray(dataArray)
 
+    def _sharesSetpoints(self, dataArray):
+        """Whether dataArray has the same setpoints as the displayed one."""
+        if not getattr(self, 'traces', None) or self._mesh is None:
+            return False
+        config = self.traces[0]['config']
+        if np.shape(dataArray.ndarray) != config['zoriginal'].shape:
+            return False
+        data = {}
+        self.expand_trace(args=[dataArray], kwargs=data)
+        for d, values in [('x', lambda: data['x'].ndarray[0, :]),
+                          ('y', lambda: data['y'].ndarray)]:
+            if data[d] is config[d]:
+                continue
+            if not np.array_equal(np.asarray(values(), dtype=float),
+                                  np.asarray(config[d+'axis'], dtype=float),
+                                  equal_nan=True):
+                return False
+        return True
+
+    def swapDataArray(self, dataArray):
+        """Show a data array with the same setpoints as the displayed one.
+
+        The axes, artists, coordinate indexes, cursor position and tool are
+        kept and only the data is replaced, which is much faster than
+        building the figure anew by showDataArray.
+        """
+        self.executor.cancelAll()
+        config = self.traces[0]['config']
+        config['z'] = dataArray
+        config['zlabel'] = self.get_label(dataArray)
+        config['zoriginal'] = np.asarray(dataArray).view()
+        config['zoriginal'].flags.writeable = False
+        # the processing belongs to the previous data
+        self.pipeline = Pipeline(config['zoriginal'], self.processingMaxBytes)
+        self.history = ProcessingHistory()
+        self.stagesChanged.emit([])
+        self._integral = None
+        self._updateMainImage()
+
+        if self._lines:
+            self._update_label(self.axes['x'], 'y', config['zlabel'])
+            self._update_label(self.axes['y'], 'y' if self.rotateCrossSection else 'x',
+                               config['zlabel'])
+        if self.tool in ('OrthoXSection', 'CustomXSection') and self._lines:
+            # cross sections at the same position
+            self._setXSectionLimits()
+            self._updateXSections()
+        if self.tool == 'sumXSection':
+            self._withIntegral(self._showProjections)
+        if self.tool == 'CustomXSection' and self._customLineExists:
+            self._resampleCustomXSection()
+        if self.tool == 'selectionTool' and self._selectionOrNone() is not None:
+            self._showRegionStats(self._rectangleSelection)
+        self.fig.canvas.draw_idle()
+
     def showDataArray(self, dataArray):
+        # results of running tasks belong to the previous data
+        self.executor.cancelAll()
         # handle data
         data = {}
         self.expand_trace(args=[dataArray], kwargs=data)
@@ -75,14 +215,41 @@ class CrossSectionWidget(FigureCanvas, BasePlot):
         data['zlabel'] = self.get_label(data['z'])
         data['xaxis'] = data['x'].ndarray[0, :]
         data['yaxis'] = data['y'].ndarray
-        data['zoriginal'] = np.array(data['z'])
+        # nearest setpoint lookup for converting data to index coordinates
+        data['xindex'] = AxisIndex(data['xaxis'])
+        data['yindex'] = AxisIndex(data['yaxis'])
+        # keep the original as a read only view instead of a copy, so that
+        # memory mapped data is only paged in where it is accessed
+        data['zoriginal'] = np.asarray(data['z']).view()
+        data['zoriginal'].flags.writeable = False
         self.traces.append({
             'config': data,
         })
+        # the displayed z is the output of the pipeline applied to
+        # zoriginal, the history records its stages for undo and redo
+        self.pipeline = Pipeline(data['zoriginal'], self.processingMaxBytes)
+        self.history = ProcessingHistory()
+        self.stagesChanged.emit([])
 
         # clear figure first
         self.fig.clear()
+        self._clearAnimated()
         self.axes = dict()
+        # artist showing the z data on the main axes, created by draw3DData
+        self._mesh = None
+        # whether the x and y axis are flipped in the image of the z data
+        self._meshFlip = (False, False)
+        # extent of the full image of the z data
+        self._meshExtent = None
+        # level of detail representation of large images, the level and
+        # section of it currently shown as (level, rows, cols)
+        self._pyramid = None
+        self._meshTile = None
+        # the callbacks are removed with the axes
+        self._limitCallbacks = None
+        self._integral = None
+        # which of ImagePyramid.modes is displayed for the coarser levels
+        self.pyramidMode = 'mean'
         self.axes['main'] = self.fig.add_subplot(111)
         self.draw3DData(self.axes['main'])
         self.fig.canvas.draw_idle()
@@ -100,9 +267,14 @@ class CrossSectionWidget(FigureCanvas, BasePlot):
         # representing the cuts where the cross sections are taken at
         self.staticOrthoCursors = []
         # position where the two cursors meet in index coordinates
-        self.orhtoXSectionPos = (0,0)
+        self.orhtoXSectionPos = [0, 0]
+        self._pendingPos = None
+        self._renderedPos = None
         # plot object reference to the plots in the two axis of the cross sections
         self._lines = []
+        # horizontal and vertical line following the mouse on the main axes,
+        # only used when blitting, otherwise the matplotlib Cursor is used
+        self._crosshair = []
         # Indicates wheter the cross section should be updated on cursor movement
         self.orthoXSectionlive = True
 
@@ -123,9 +295,23 @@ class CrossSectionWidget(FigureCanvas, BasePlot):
         # inter polated data representing the data points along the cross section
         self._customXPoints = None
         self._customYPoints = None
+        # sampler for the custom cross section, reused for successive lines
+        # as long as the data does not change
+        self._lineProfile = None
+        # sampling method of the custom cross section, see LineProfile.methods
+        self.customXSectionMethod = 'linear'
+        # width in data points of the band averaged over perpendicular to the
+        # custom cross section
+        self.customXSectionWidth = 0
 
         # rectangle selection
         self._rectangleSelection=np.array([[0, 0], [0, 0]])
+        # summed area tables of the displayed z, for the statistics of the
+        # selection and the sums, built in the background when first needed
+        self._integral = None
+        # the selection has been changed and its statistics have to be
+        # shown in the next frame
+        self._pendingStats = None
 
 
 
@@ -133,31 +319,162 @@ class CrossSectionWidget(FigureCanvas, BasePlot):
     def full_extent(ax, pad=0.0):
         """Get the full extent of an axes, including axes labels, tick labels, and
         titles."""
-        # for text objects we only include them if they are non empty.
-        # empty ticks may be rendered outside the figure
-        from matplotlib.transforms import Bbox
-        items = []
-        items += [ax.xaxis.label, ax.yaxis.label, ax.title]
-        items = [item for item in items if item.get_text()]
-        items.append(ax)
-        bbox = Bbox.union([item.get_window_extent() for item in items])
-        return bbox.expanded(1.0 + pad, 1.0 + pad)
+        return fullExtent(ax, pad)
 
+    def _subplotName(self, axes, name_infix):
+        title = self.get_default_title()
+        return title + " " + name_infix + " " + axes.get_title().replace(',','.')
 
     def save_subplot_title_infix(self, axes, name_infix, saveformat='pdf'):
         if axes:
-            title = self.get_default_title()
-            title += " " + name_infix + " " + axes.get_title().replace(',','.')
-            self.save_subplot(axes, savename=title, saveformat=saveformat)
+            self.save_subplot(axes, savename=self._subplotName(axes, name_infix),
+                              saveformat=saveformat)
         else:
-            print("not saving axes with infix \"{}\" because passed axes were invalid".format(name_infix))
+            log.warning('not saving axes with infix "{}" because passed axes '
+                        'were invalid'.format(name_infix))
+            self.statusMessage.emit("Nothing to save for {}".format(name_infix), 5000)
 
     def save_subplot(self, axes, savename, saveformat='pdf'):
-        extent = self.full_extent(axes).transformed(
-            self.fig.dpi_scale_trans.inverted())
-        print(savename)
-        full_title = "{}.{}".format(savename, saveformat)
-        self.fig.savefig(full_title, bbox_inches=extent)
+        with self._staticArtists():
+            filenames = FigureExporter(self.fig, [(axes, savename)]).save(saveformat)
+        self.fig.canvas.draw_idle()
+        for filename in filenames:
+            log.info('saved {}'.format(filename))
+        self.statusMessage.emit("Saved {}".format(", ".join(filenames)), 5000)
+
+    # subplots saved by exportPlots, as (key of the axes, name infix)
+    _exportedSubplots = [('x', "Crossection for"),
+                         ('y', "Crossection for"),
+                         ('main', "2DPlot"),
+                         ('custom', "custom cross section")]
+
+    def exportPlots(self, saveformat='pdf', multipage=False):
+        """Save all subplots, each to its own file, or all to one PDF with
+        a page per subplot. The figure is rendered only once.
+
+        Returns:
+            list of the saved file names
+        """
+        items = [(self.axes[key], self._subplotName(self.axes[key], infix))
+                 for key, infix in self._exportedSubplots if self.axes.get(key)]
+        exporter = FigureExporter(self.fig, items)
+        with self._staticArtists():
+            if multipage:
+                filenames = exporter.saveMultipage(
+                    "{} plots.pdf".format(self.get_default_title()))
+            else:
+                filenames = exporter.save(saveformat)
+        self.fig.canvas.draw_idle()
+        for filename in filenames:
+            log.info('saved {}'.format(filename))
+        self.statusMessage.emit("Saved {}".format(", ".join(filenames)), 5000)
+        return filenames
+
+    def exportXSectionData(self):
+        """Save the data of the displayed cross sections to a .npz file,
+        with the arrays named after the subplot and line, like x_line0_y.
+
+        Returns:
+            the file name
+        """
+        filename = "{} cross sections.npz".format(self.get_default_title())
+        saveLineData(filename, {key: self.axes.get(key)
+                                for key in ('x', 'y', 'custom')})
+        log.info('saved {}'.format(filename))
+        self.statusMessage.emit("Saved {}".format(filename), 5000)
+        return filename
+
+    # blitting
+    @contextmanager
+    def _staticArtists(self):
+        """Temporarily render the animated artists as part of the figure, as
+        done for exporting, where no blitting takes place."""
+        artists = [a for artists in self._animated.values() for a in artists]
+        for artist in artists:
+            artist.set_animated(False)
+        self._exporting = True
+        try:
+            yield
+        finally:
+            self._exporting = False
+            for artist in artists:
+                artist.set_animated(True)
+            self._invalidateBackgrounds()
+
+    def _addAnimated(self, key, artist):
+        """Register an artist that changes on mouse movement. When blitting,
+        it is excluded from the background of the axes with the given key."""
+        if self.useBlit:
+            artist.set_animated(True)
+            self._animated.setdefault(key, []).append(artist)
+        return artist
+
+    def _clearAnimated(self):
+        self._animated = dict()
+        self._invalidateBackgrounds()
+
+    def _invalidateBackgrounds(self, event=None):
+        self._backgrounds = dict()
+        self._backgroundsState = None
+
+    def _viewState(self):
+        # the backgrounds are only valid for the figure size and view limits
+        # they were captured with
+        limits = tuple((tuple(ax.get_xlim()), tuple(ax.get_ylim()))
+                       for ax in self.axes.values())
+        return (tuple(self.fig.bbox.bounds), limits)
+
+    def _blitRegion(self, ax):
+        # the region covers the axes and its title, which is updated with
+        # the position of the cross section
+        region = ax.bbox
+        if ax.title.get_text():
+            title = ax.title.get_window_extent(self.get_renderer())
+            region = Bbox([[ax.bbox.x0, ax.bbox.y0],
+                           [ax.bbox.x1, max(ax.bbox.y1, title.y1)]])
+        return Bbox.intersection(region.padded(1), self.fig.bbox)
+
+    @timed('draw')
+    def draw(self):
+        # the full rendering of the figure by Agg
+        FigureCanvas.draw(self)
+
+    def _onDraw(self, event):
+        if not self.useBlit or self._exporting or not self._animated:
+            return
+        self._backgrounds = dict()
+        for key, artists in self._animated.items():
+            ax = self.axes.get(key)
+            if ax is None:
+                continue
+            region = self._blitRegion(ax)
+            self._backgrounds[key] = (region, self.copy_from_bbox(region))
+        self._backgroundsState = self._viewState()
+        # the animated artists are not drawn by a full redraw
+        self._drawAnimated()
+
+    def _drawAnimated(self):
+        for key, artists in self._animated.items():
+            ax = self.axes.get(key)
+            if ax is None:
+                continue
+            for artist in artists:
+                ax.draw_artist(artist)
+
+    def _refresh(self):
+        """Show changes of the animated artists. Blits them onto the cached
+        backgrounds if those are valid, otherwise schedules a full redraw."""
+        if (not self.useBlit or not self._backgrounds or
+                self._backgroundsState != self._viewState()):
+            self._invalidateBackgrounds()
+            self.fig.canvas.draw_idle()
+            return
+        with self.latency.stage('blit'):
+            for region, background in self._backgrounds.values():
+                self.restore_region(background)
+            self._drawAnimated()
+            for region, background in self._backgrounds.values():
+                self.blit(region)
 
 
     def _update_label(self, ax, axletter, label, extra=None):
@@ -187,6 +504,8 @@ class CrossSectionWidget(FigureCanvas, BasePlot):
         self._customLinePlots = []
         self.staticOrthoCursors = []
         self._lines = []
+        self._crosshair = []
+        self._clearAnimated()
 
     def _addXSectionPlots(self):
         # self.remove_plots()
@@ -194,78 +513,302 @@ class CrossSectionWidget(FigureCanvas, BasePlot):
         # y is first index in traces
         ax = self.axes['x'] 
         ax.yaxis.get_major_formatter().set_powerlimits((0,0))
-        self._lines.append(ax.plot(self.traces[0]['config']['xaxis'],
-                                   self.traces[0]['config']['z'][self.orhtoXSectionPos[1], :],
-                                   color='C0',
-                                   marker='.')[0])
+        self._lines.append(self._addAnimated('x', ax.plot(
+            self.traces[0]['config']['xaxis'],
+            self.traces[0]['config']['z'][self.orhtoXSectionPos[1], :],
+            color='C0',
+            marker='.')[0]))
+        self._addAnimated('x', ax.title)
         self._update_label(ax, 'x', self.traces[0]['config']['xlabel'])
         self._update_label(ax, 'y', self.traces[0]['config']['zlabel'])
         self.traces[0]['config']['ypos'] = self.traces[0]['config']['yaxis'][self.orhtoXSectionPos[1]]
-        theMax = self.traces[0]['config']['z'].ravel().max() * 1.05
-        theMin = self.traces[0]['config']['z'].ravel().min() * 1.05
-        ax.set_ylim(theMin, theMax)
 
         # y means cut parrallel to y axes at a given x value, right plot
         # x is second index in traces
         ax = self.axes['y'] # y means cut parrallel to y axes, as 
         if self.rotateCrossSection:
             ax.xaxis.get_major_formatter().set_powerlimits((0,0))
-            self._lines.append(ax.plot(self.traces[0]['config']['yaxis'],
-                                       self.traces[0]['config']['z'][:,self.orhtoXSectionPos[0]],
-                                       color='C0',
-                                       marker='.')[0])
+            self._lines.append(self._addAnimated('y', ax.plot(
+                self.traces[0]['config']['yaxis'],
+                self.traces[0]['config']['z'][:,self.orhtoXSectionPos[0]],
+                color='C0',
+                marker='.')[0]))
             self._update_label(ax, 'x', self.traces[0]['config']['ylabel'])
             self._update_label(ax, 'y', self.traces[0]['config']['zlabel'])
             self.traces[0]['config']['xpos'] = self.traces[0]['config']['yaxis'][self.orhtoXSectionPos[0]]
-            sum = self.traces[0]['config']['z'].sum(axis=0) * 1.05
-            ax.set_ylim(theMin, theMax)
         else:
             ax.yaxis.get_major_formatter().set_powerlimits((0,0))
-            self._lines.append(ax.plot(self.traces[0]['config']['z'][:,self.orhtoXSectionPos[0]],
-                                       self.traces[0]['config']['yaxis'],
-                                       color='C0',
-                                       marker='.')[0])
+            self._lines.append(self._addAnimated('y', ax.plot(
+                self.traces[0]['config']['z'][:,self.orhtoXSectionPos[0]],
+                self.traces[0]['config']['yaxis'],
+                color='C0',
+                marker='.')[0]))
             self._update_label(ax, 'y', self.traces[0]['config']['ylabel'])
             self._update_label(ax, 'x', self.traces[0]['config']['zlabel'])
             self.traces[0]['config']['xpos'] = self.traces[0]['config']['yaxis'][self.orhtoXSectionPos[0]]
-            sum = self.traces[0]['config']['z'].sum(axis=0) * 1.05
-            ax.set_xlim(theMin, theMax)
+        self._addAnimated('y', ax.title)
+        self._setXSectionLimits()
 
         self._updateXSections()
 
 
+    def _setXSectionLimits(self):
+        z = np.asarray(self.traces[0]['config']['z'])
+        if not np.isfinite(z).any():
+            # nothing measured yet
+            return
+        theMax = np.nanmax(z) * 1.05
+        theMin = np.nanmin(z) * 1.05
+        self.axes['x'].set_ylim(theMin, theMax)
+        if self.rotateCrossSection:
+            self.axes['y'].set_ylim(theMin, theMax)
+        else:
+            self.axes['y'].set_xlim(theMin, theMax)
+
     def _updateXSections(self):
         # updating data points
         if not self._lines:
             self._addXSectionPlots()
         else:
-            # lines[0] is parallel x axes, so y values change for a given ypos
-            self._lines[0].set_ydata(self.traces[0]['config']['z'][self.orhtoXSectionPos[1], :])
-            if self.rotateCrossSection:
-                self._lines[1].set_ydata(self.traces[0]['config']['z'][:, self.orhtoXSectionPos[0]])
-            else:
-                self._lines[1].set_xdata(self.traces[0]['config']['z'][:, self.orhtoXSectionPos[0]])
+            with self.latency.stage('slicing'):
+                z = self.traces[0]['config']['z']
+                row = z[self.orhtoXSectionPos[1], :]
+                column = z[:, self.orhtoXSectionPos[0]]
+            with self.latency.stage('artists'):
+                # lines[0] is parallel x axes, so y values change for a given ypos
+                self._lines[0].set_ydata(row)
+                if self.rotateCrossSection:
+                    self._lines[1].set_ydata(column)
+                else:
+                    self._lines[1].set_xdata(column)
+
+        self._renderedPos = tuple(self.orhtoXSectionPos)
 
         # updateing title and label
-        for i,d in enumerate(['x', 'y']):
-            # self.axes[d].relim()
-            # self.axes[d].autoscale_view()
-            label, unit = self._get_label_and_unit(self.traces[0]['config'][d+'label'])
-            self.axes[d].set_title("{} = {:.2n} {} ".format(
-                label, self.traces[0]['config'][d+'axis'][self.orhtoXSectionPos[i]], unit),
-                                   fontsize='small')
+        with self.latency.stage('artists'):
+            for i,d in enumerate(['x', 'y']):
+                # self.axes[d].relim()
+                # self.axes[d].autoscale_view()
+                label, unit = self._get_label_and_unit(self.traces[0]['config'][d+'label'])
+                self.axes[d].set_title("{} = {:.2n} {} ".format(
+                    label, self.traces[0]['config'][d+'index'].value(self.orhtoXSectionPos[i]), unit),
+                                       fontsize='small')
         # self._datacursor = mplcursor.cursor(self._lines, multiple=False)
-        self.fig.canvas.draw_idle()
+        self._refresh()
+
+    def _addCrosshair(self):
+        ax = self.axes['main']
+        self._crosshair = [
+            self._addAnimated('main', ax.axhline(color='black', lw=1, visible=False)),
+            self._addAnimated('main', ax.axvline(color='black', lw=1, visible=False))]
+
+    def _updateCrosshair(self, event):
+        if not self._crosshair:
+            return
+        with self.latency.stage('artists'):
+            visible = event.inaxes == self.axes['main']
+            if visible:
+                self._crosshair[0].set_ydata([event.ydata, event.ydata])
+                self._crosshair[1].set_xdata([event.xdata, event.xdata])
+            for line in self._crosshair:
+                line.set_visible(visible)
+
+    @staticmethod
+    def _imageExtent(index):
+        # extent of an image with pixels centered on the setpoints of a
+        # uniform axis and whether the data has to be flipped to make it
+        # increasing
+        lo, hi = index.value(0), index.value(-1)
+        if len(index) < 2 or lo == hi:
+            return (lo - 0.5, lo + 0.5), False
+        flip = hi < lo
+        if flip:
+            lo, hi = hi, lo
+        half = 0.5 * (hi - lo) / (len(index) - 1)
+        return (lo - half, hi + half), flip
+
+    def _imageData(self):
+        z = np.asarray(self.traces[0]['config']['z'])
+        if self._meshFlip[0]:
+            z = z[:, ::-1]
+        if self._meshFlip[1]:
+            z = z[::-1, :]
+        return z
 
     def draw3DData(self, ax):
-        ax.pcolormesh(self.traces[0]['config']['x'],
-                      self.traces[0]['config']['y'],
-                      self.traces[0]['config']['z'],
-                      edgecolor='face')
+        config = self.traces[0]['config']
+        # draw3DData is called again on the same axes if the grid changes
+        self._disconnectLimitCallbacks()
+        if config['xindex'].kind == 'uniform' and config['yindex'].kind == 'uniform':
+            # a regular grid can be drawn as a single image, which is much
+            # faster to render than a mesh with one quad per data point
+            (x0, x1), flipx = self._imageExtent(config['xindex'])
+            (y0, y1), flipy = self._imageExtent(config['yindex'])
+            self._meshFlip = (flipx, flipy)
+            self._meshExtent = (x0, x1, y0, y1)
+            z = self._imageData()
+            self._pyramid = None
+            self._meshTile = None
+            if z.size > self.pyramidThreshold:
+                self._pyramid = ImagePyramid(z)
+                # the level matching the view is shown below, it is only
+                # computed then
+                z = np.full((1, 1), np.nan)
+            self._mesh = ax.imshow(z, extent=(x0, x1, y0, y1),
+                                   origin='lower', aspect='auto',
+                                   interpolation='nearest')
+            if self._pyramid is not None:
+                # fix the limits, the extent of the tiles must not change them
+                ax.set_xlim(x0, x1)
+                ax.set_ylim(y0, y1)
+                self._limitCallbacks = (ax, [
+                    ax.callbacks.connect('xlim_changed', self._updateLevelOfDetail),
+                    ax.callbacks.connect('ylim_changed', self._updateLevelOfDetail)])
+                self._updatePyramidLimits()
+        else:
+            self._meshFlip = (False, False)
+            self._pyramid = None
+            self._mesh = ax.pcolormesh(config['x'], config['y'], config['z'],
+                                       edgecolor='face')
         self._update_label(ax, 'x', self.traces[0]['config']['xlabel'])
         self._update_label(ax, 'y', self.traces[0]['config']['ylabel'])
         ax.yaxis.get_major_formatter().set_powerlimits((0,0))
 
+    def _disconnectLimitCallbacks(self):
+        if self._limitCallbacks is not None:
+            ax, cids = self._limitCallbacks
+            for cid in cids:
+                ax.callbacks.disconnect(cid)
+            self._limitCallbacks = None
+
+    def _updatePyramidLimits(self):
+        """Set the color limits of the pyramid and show the level matching
+        the view. Unknown limits are computed off the GUI thread, until then
+        the image shown before, or the placeholder, stays."""
+        pyramid = self._pyramid
+        if pyramid.hasLimits():
+            self._mesh.set_clim(*pyramid.limits())
+            self._updateLevelOfDetail()
+            return
+        def onResult(result):
+            # the data may have been replaced while the limits were computed
+            if self._pyramid is pyramid:
+                pyramid.setLimits(result)
+                self._updatePyramidLimits()
+                self.fig.canvas.draw_idle()
+        self.executor.submit('color limits', limits, pyramid.data, onResult=onResult)
+
+    def _imageRows(self, rows):
+        # rows of the image showing the given rows of the z data
+        if self._meshFlip[1]:
+            n = self._imageData().shape[0]
+            return n - rows[1], n - rows[0]
+        return rows
+
+    def _updateMainImage(self, rows=None):
+        """Show changed z data by updating the artist drawn by draw3DData in
+        place. If only the (start, stop) rows have changed, only those are
+        updated."""
+        z = self._imageData()
+        if self._pyramid is not None:
+            if rows is None and z.shape != self._pyramid.shape:
+                self._pyramid = ImagePyramid(z)
+            else:
+                # only the levels that have been shown are recomputed
+                self._pyramid.update(z, self._imageRows(rows or (0, z.shape[0])))
+            self._meshTile = None
+            self._updatePyramidLimits()
+            return
+        if isinstance(self._mesh, matplotlib.image.AxesImage) and rows is not None:
+            r0, r1 = self._imageRows(rows)
+            image = self._mesh.get_array()
+            image[r0:r1] = np.ma.masked_invalid(z[r0:r1])
+            self._mesh.changed()
+            # widen the color limits to the new values
+            z = np.concatenate([z[r0:r1].ravel(),
+                                [v for v in self._mesh.get_clim() if v is not None]])
+        elif isinstance(self._mesh, matplotlib.image.AxesImage):
+            self._mesh.set_data(z)
+        else:
+            current = self._mesh.get_array()
+            if current.size != z.size:
+                # flat shading drops the last row and column
+                z = z[:-1, :-1]
+            self._mesh.set_array(z.reshape(current.shape))
+        if np.isfinite(z).any():
+            self._mesh.set_clim(np.nanmin(z), np.nanmax(z))
+
+    def refreshData(self, rows=None):
+        """Show new values of the displayed data array, e.g. of a measurement
+        that is still running, by updating the artists in place.
+
+        Args:
+            rows: (start, stop) of the changed rows, all rows by default
+        """
+        if self._mesh is None:
+            return
+        config = self.traces[0]['config']
+        # the setpoints of a running sweep become known row by row
+        layout = []
+        for d in ['x', 'y']:
+            index = AxisIndex(config[d+'axis'])
+            old = config[d+'index']
+            layout.append(index.sameGrid(old))
+            config[d+'index'] = index
+        # the original is a view of the updated data, processed data is
+        # computed anew from it
+        processed = bool(self.pipeline.stages)
+        if processed:
+            self.pipeline.invalidate()
+        # the values have changed in place
+        self._integral = None
+        self._lineProfile = None
+        if not all(layout) or not isinstance(self._mesh, matplotlib.image.AxesImage):
+            # the grid has changed, e.g. a new row of setpoints, redraw the
+            # artist on the existing axes
+            ax = self._mesh.axes
+            self._mesh.remove()
+            self.draw3DData(ax)
+        elif not processed:
+            self._updateMainImage(rows)
+        if processed:
+            self._showPipeline()
+        if self._lines and self.tool in ('OrthoXSection', 'CustomXSection'):
+            self._setXSectionLimits()
+            self._updateXSections()
+        if self.tool == 'CustomXSection' and self._customLineExists:
+            self._resampleCustomXSection()
+        self.fig.canvas.draw_idle()
+
+    def _updateLevelOfDetail(self, *args):
+        """Show the level of the pyramid matching the current view and size
+        of the main axes. A new tile is only loaded if the level changes or
+        the view leaves the current tile."""
+        if self._pyramid is None or self._mesh is None or self._mesh.axes is None:
+            return
+        if not self._pyramid.hasLimits():
+            # the color limits are being computed
+            return
+        ax = self._mesh.axes
+        x0, x1, y0, y1 = self._meshExtent
+        nrows, ncols = self._pyramid.shape
+        dx = (x1 - x0) / ncols
+        dy = (y1 - y0) / nrows
+        cols = [float(np.clip((v - x0) / dx, 0, ncols)) for v in sorted(ax.get_xlim())]
+        rows = [float(np.clip((v - y0) / dy, 0, nrows)) for v in sorted(ax.get_ylim())]
+        level = self._pyramid.level(rows, cols, ax.bbox.height, ax.bbox.width)
+        if self._meshTile is not None:
+            tileLevel, tileRows, tileCols = self._meshTile
+            if (tileLevel == level and
+                    tileRows[0] <= rows[0] and rows[1] <= tileRows[1] and
+                    tileCols[0] <= cols[0] and cols[1] <= tileCols[1]):
+                return
+        data, (r0, r1), (c0, c1) = self._pyramid.tile(level, rows, cols,
+                                                      mode=self.pyramidMode)
+        self._mesh.set_data(data)
+        self._mesh.set_extent((x0 + c0*dx, x0 + c1*dx, y0 + r0*dy, y0 + r1*dy))
+        self._meshTile = (level, (r0, r1), (c0, c1))
+
     def drawCustomXSection(self, ax):
         ax.set_xlim((min(self._customXPoints),max(self._customXPoints)))
         ax.plot(self._customXPoints,self._customYPoints, color='C0')
@@ -289,18 +832,17 @@ class CrossSectionWidget(FigureCanvas, BasePlot):
 
     # Coordinate transformations
     def _getAxisCoordinatesFromEvent(self, event):
-        xpos = (abs(self.traces[0]['config']['xaxis'] - event.xdata)).argmin()
-        ypos = (abs(self.traces[0]['config']['yaxis'] - event.ydata)).argmin()
-        return [xpos, ypos]
+        with self.latency.stage('index lookup'):
+            return list(self._data2index((event.xdata, event.ydata)))
 
     def _index2data(self, index):
-        x = self.traces[0]['config']['xaxis'][index[0]]
-        y = self.traces[0]['config']['yaxis'][index[1]]
+        x = self.traces[0]['config']['xindex'].value(index[0])
+        y = self.traces[0]['config']['yindex'].value(index[1])
         return (x,y)
 
     def _data2index(self, data_coordinate):
-        ix = np.abs(self.traces[0]['config']['xaxis']-data_coordinate[0]).argmin()
-        iy = np.abs(self.traces[0]['config']['yaxis']-data_coordinate[1]).argmin()
+        ix = self.traces[0]['config']['xindex'].index(data_coordinate[0])
+        iy = self.traces[0]['config']['yindex'].index(data_coordinate[1])
         return ix, iy
 
     # events
@@ -319,11 +861,11 @@ class CrossSectionWidget(FigureCanvas, BasePlot):
         self.fig.canvas.draw_idle()
 
     def _onKey(self, event):
-        print('onKey')
+        pass
 
+    @timed('tool change')
     def onToolChange(self, id):
         self.tool = id
-        print(id)
         if id == 'none':
             self.remove_plots()
             self.fig.clear()
@@ -342,7 +884,10 @@ class CrossSectionWidget(FigureCanvas, BasePlot):
             self.fig.canvas.draw_idle()
 
         if id == 'OrthoXSection' or id=='CustomXSection':
-            self._cursor = Cursor(self.axes['main'], useblit=False, color='black')
+            if self.useBlit:
+                self._addCrosshair()
+            else:
+                self._cursor = Cursor(self.axes['main'], useblit=False, color='black')
             # rewire events
             for eventName, callback in [('motion_notify_event', self._onMouseMove),
                                         ('button_press_event', self._onMouseDown),
@@ -359,17 +904,7 @@ class CrossSectionWidget(FigureCanvas, BasePlot):
             self.axes['custom'] = self.fig.add_subplot(2, 2, 4)
 
         if id == 'sumXSection':
-            # lines[0] is parallel x axes, so y values change for a given ypos
-            self.axes['x'].set_ylim(0, self.traces[0]['config']['z'].sum(axis=0).max() * 1.05)
-            self._lines[0].set_ydata(self.traces[0]['config']['z'].sum(axis=0))
-            if self.rotateCrossSection:
-                self.axes['y'].set_ylim(0, self.traces[0]['config']['z'].sum(axis=1).max() * 1.05)
-                self._lines[1].set_ydata(self.traces[0]['config']['z'].sum(axis=1))
-            else:
-                self.axes['y'].set_xlim(0, self.traces[0]['config']['z'].sum(axis=1).max() * 1.05)
-                self._lines[1].set_xdata(self.traces[0]['config']['z'].sum(axis=1))
-
-            self.fig.canvas.draw_idle()
+            self._withIntegral(self._showProjections)
         if id == 'selectionTool':
             # if self.RS is not None:
             #     self.RS.delete()
@@ -380,62 +915,282 @@ class CrossSectionWidget(FigureCanvas, BasePlot):
                                         minspanx=5, minspany=5,
                                         spancoords='pixels',
                                         interactive=True)
+            # statistics of the selection while it is dragged
+            if self.eventIDs.get('selection_motion') is not None:
+                self.fig.canvas.mpl_disconnect(self.eventIDs['selection_motion'])
+            self.eventIDs['selection_motion'] = self.fig.canvas.mpl_connect(
+                'motion_notify_event', self._onSelectionMove)
+            self._withIntegral(lambda integral: None)
         if id == 'restore':
-            cpy = self.traces[0]['config']['zoriginal']
-            self.traces[0]['config']['z'] = np.array(cpy)
-            self.draw3DData(self.axes['main'])
-            # self.axes['main'].set_xlim(x.min(), x.max())
-            # self.axes['main'].set_ylim(y.min(), y.max())
-            self.fig.tight_layout()
-            self.fig.canvas.draw_idle()
-
-        if id == 'planeFit':
-            def getSection(x, y, z, section):
-               x = x[section[0,0]:section[1,0]]
-               y = y[section[0,1]:section[1,1]]
-               z = z[section[0,1]:section[1,1],section[0,0]:section[1,0]]
-               # print("xmax: {}, xmin: {}, ymax {}, ymin {}".format(x.max(), x.min(), y.max(), y.min()))
-               return x, y, z
-            x = self.traces[0]['config']['xaxis']
-            y = self.traces[0]['config']['yaxis']
-            z = self.traces[0]['config']['z']
-            nx, ny, nz = getSection(x,y,z, self._rectangleSelection)
-
-            # actual algorithm
-            nxv, nyv = np.meshgrid(nx,ny)
-            A = np.column_stack((np.ones(nxv.size), nxv.flatten(), nyv.flatten()))
-            zus,resid,rank,sigma = np.linalg.lstsq(A,nz.flatten())
-
-            xv, yv = np.meshgrid(x,y)
-            z = z-zus[0]-xv*zus[1]-yv*zus[2]
-
-            # setting data and update
-            self.traces[0]['config']['z'] = z
-            self.draw3DData(self.axes['main'])
-            self.axes['main'].set_xlim(x.min(), x.max())
-            self.axes['main'].set_ylim(y.min(), y.max())
-            self.fig.tight_layout()
-            self.fig.canvas.draw_idle()
+            # can be undone like any other change of the pipeline
+            self.setStages([])
+        if id == 'undo':
+            self.setStages(self.history.undo(), record=False)
+        if id == 'redo':
+            self.setStages(self.history.redo(), record=False)
+
+        if id in self._stageTools:
+            stage = self._stageTools[id](self)
+            if stage is not None:
+                self.addStage(stage)
 
         if id == 'SavePlotsPDF' or id == 'SavePlotsPNG':
            if id=='SavePlotsPNG':
                saveformat = 'png'
            elif id == 'SavePlotsPDF':
                saveformat = 'pdf'
-           self.save_subplot_title_infix(self.axes.get('x'), "Crossection for", saveformat=saveformat)
-           self.save_subplot_title_infix(self.axes.get('y'), "Crossection for", saveformat=saveformat)
-           self.save_subplot_title_infix(self.axes.get('main'), "2DPlot", saveformat=saveformat)
-           self.save_subplot_title_infix(self.axes.get('custom'), "custom cross section", saveformat=saveformat)
+           self.exportPlots(saveformat)
+        if id == 'SavePlotsMultipage':
+            self.exportPlots(multipage=True)
+        if id == 'SaveXSectionData':
+            self.exportXSectionData()
+
+    # frame scheduling
+    def _requestXSectionPos(self, pos):
+        self._pendingPos = tuple(pos)
+        self.frames.schedule()
+
+    @timed('frame')
+    def _onFrame(self):
+        pos, self._pendingPos = self._pendingPos, None
+        staticCursor, self._pendingStaticCursor = self._pendingStaticCursor, False
+        refresh, self._pendingRefresh = self._pendingRefresh, False
+        stats, self._pendingStats = self._pendingStats, None
+        if stats is not None:
+            self._showRegionStats(stats)
+        if not self._lines:
+            # the plots have been removed since the frame was requested
+            return
+        if pos is not None:
+            self.orhtoXSectionPos = list(pos)
+        if staticCursor:
+            self._updateStaticCursor()
+        if pos is not None and pos != self._renderedPos:
+            self._updateXSections()
+        elif refresh:
+            self._refresh()
+
+    # results of the tasks run by the executor, called on the GUI thread
+    def _onTaskFailed(self, name, message):
+        log.error('{} failed\n{}'.format(name, message))
+        self.statusMessage.emit("{}: failed".format(name), 5000)
+
+    def _onEvaluated(self, stages, results):
+        self.pipeline.store(stages, results)
+        if self.pipeline.key(stages) == self.pipeline.key():
+            self._showProcessed(results[-1])
+
+    def _showProcessed(self, z):
+        # processing never modifies z in place, so the read only original
+        # and cached results can be shown directly
+        self.traces[0]['config']['z'] = z
+        self._updateMainImage()
+        if self.tool == 'sumXSection':
+            self._withIntegral(self._showProjections)
+        self.fig.tight_layout()
+        self.fig.canvas.draw_idle()
+
+    # processing pipeline
+    def _showPipeline(self):
+        """Show the output of the pipeline. Stages whose results are not
+        cached are evaluated in the background."""
+        z = self.pipeline.cached()
+        if z is not None:
+            self.executor.cancel('processing')
+            self._showProcessed(z)
+            return
+        stages = list(self.pipeline.stages)
+        base, remaining = self.pipeline.recipe(stages)
+        self.executor.submit('processing', evaluate, base, remaining,
+                             onResult=lambda results: self._onEvaluated(stages, results))
+
+    def setStages(self, stages, record=True):
+        """Process the data with the given list of Stages.
+
+        Args:
+            stages: the new stages of the pipeline
+            record: add the stages to the history for undo
+        """
+        self.pipeline.stages = list(stages)
+        if record:
+            self.history.push(stages)
+        self.stagesChanged.emit(list(stages))
+        self._showPipeline()
+
+    def addStage(self, stage):
+        self.setStages(self.pipeline.stages + [stage])
+
+    def removeStage(self, index):
+        stages = list(self.pipeline.stages)
+        del stages[index]
+        self.setStages(stages)
+
+    def setStageParams(self, index, **params):
+        """Change parameters of a stage. Only this and the following stages
+        are evaluated again."""
+        stages = list(self.pipeline.stages)
+        stages[index] = stages[index].replace(**params)
+        self.setStages(stages)
+
+    def _selectedSection(self):
+        section = np.array(self._rectangleSelection)
+        if np.any(section[0] == section[1]):
+            self.statusMessage.emit("Select a region first", 5000)
+            return None
+        # the corners in increasing order, however the rectangle was drawn
+        return np.sort(section, axis=0)
+
+    def _stageAxes(self):
+        # the setpoints passed to all stages, as shown on the axes, with the
+        # extrapolated setpoints of a running sweep
+        config = self.traces[0]['config']
+        return {'x': config['xindex'].values, 'y': config['yindex'].values}
+
+    def _planeFitStage(self):
+        section = self._selectedSection()
+        if section is None:
+            return None
+        return Stage('plane fit', planeFit, section=section, **self._stageAxes())
+
+    def _polynomialFitStage(self):
+        section = self._selectedSection()
+        if section is None:
+            return None
+        return Stage('polynomial background', polynomialFit, section=section,
+                     order=2, **self._stageAxes())
+
+    def _lineFitStage(self):
+        # the lines are fitted within the selection if there is one
+        section = np.array(self._rectangleSelection)
+        if np.any(section[0] == section[1]):
+            section = None
+        else:
+            section = np.sort(section, axis=0)
+        return Stage('line fit', lineFit, section=section, axis='x', order=1,
+                     **self._stageAxes())
+
+    def _cropStage(self):
+        section = self._selectedSection()
+        if section is None:
+            return None
+        return Stage('crop', crop, section=section)
+
+    def _derivativeStage(self, axis):
+        return Stage('derivative', derivative, axis=axis, **self._stageAxes())
+
+    # tools adding a stage to the pipeline, creating it from the widget
+    _stageTools = {
+        'planeFit': _planeFitStage,
+        'polynomialFit': _polynomialFitStage,
+        'lineFit': _lineFitStage,
+        'crop': _cropStage,
+        'levelRows': lambda self: Stage('level rows', levelLines, axis='x',
+                                        method='median'),
+        'levelColumns': lambda self: Stage('level columns', levelLines,
+                                           axis='y', method='median'),
+        'derivativeX': lambda self: self._derivativeStage('x'),
+        'derivativeY': lambda self: self._derivativeStage('y'),
+        'smooth': lambda self: Stage('smooth', smooth, sigma=1.0),
+        'offsetScale': lambda self: Stage('offset and scale', offsetScale,
+                                          offset=0.0, scale=1.0),
+    }
+
+    def _withIntegral(self, callback):
+        """Call callback with the IntegralImage of the displayed z, once it
+        has been built."""
+        z = self.traces[0]['config']['z']
+        if self._integral is not None and self._integral[0] is z:
+            callback(self._integral[1])
+            return
+        def onResult(integral):
+            # z may have changed while the tables were built
+            if self.traces[0]['config']['z'] is z:
+                self._integral = (z, integral)
+                callback(integral)
+        self.executor.submit('integral image', IntegralImage, z, onResult=onResult)
+
+    def _selectionOrNone(self):
+        section = np.array(self._rectangleSelection)
+        if np.any(section[0] == section[1]):
+            return None
+        return section
+
+    def _showProjections(self, integral):
+        if self.tool != 'sumXSection' or not self._lines:
+            return
+        # sums over the selected region only, if there is one
+        sumX, sumY = integral.projections(self._selectionOrNone())
+        limits = []
+        for sums in (sumX, sumY):
+            if np.isfinite(sums).any():
+                lo, hi = min(np.nanmin(sums), 0), max(np.nanmax(sums), 0)
+            else:
+                lo, hi = 0, 1
+            limits.append((lo * 1.05, hi * 1.05))
+        # lines[0] is parallel x axes, so y values change for a given ypos
+        self.axes['x'].set_ylim(*limits[0])
+        self._lines[0].set_ydata(sumX)
+        if self.rotateCrossSection:
+            self.axes['y'].set_ylim(*limits[1])
+            self._lines[1].set_ydata(sumY)
+        else:
+            self.axes['y'].set_xlim(*limits[1])
+            self._lines[1].set_xdata(sumY)
+
+        self.fig.canvas.draw_idle()
+
+    def _showRegionStats(self, section):
+        integral = self._integral
+        if integral is None or integral[0] is not self.traces[0]['config']['z']:
+            self._withIntegral(lambda integral: self._showRegionStats(section))
+            return
+        stats = integral[1].stats(section)
+        (x1, y1), (x2, y2) = np.sort(section, axis=0)
+        self.statusMessage.emit(
+            "{} x {} points, {} values: mean {:.4g}, std {:.4g}, sum {:.4g}".format(
+                x2 - x1, y2 - y1, stats['count'], stats['mean'], stats['std'],
+                stats['sum']), 0)
+
+    def _onSelectionMove(self, event):
+        if self.tool != 'selectionTool' or event.button is None:
+            return
+        x1, x2, y1, y2 = self.RS.extents
+        self._pendingStats = np.array([self._data2index([x1, y1]),
+                                       self._data2index([x2, y2])])
+        self.frames.schedule()
+
+    def _resampleCustomXSection(self):
+        # sample the custom cross section of changed data, the previous
+        # profile is shown until the new one is ready
+        def onResult(points):
+            if 'custom' in self.axes:
+                for line in list(self.axes['custom'].lines):
+                    line.remove()
+            self._onCustomXSection(points)
+        self.executor.submit('custom cross section', self._customLineSampler(),
+                             onResult=onResult)
+
+    def _onCustomXSection(self, points):
+        if self.tool != 'CustomXSection' or 'custom' not in self.axes:
+            return
+        self._customXPoints, self._customYPoints = points
+        self.drawCustomXSection(self.axes['custom'])
+        self.fig.canvas.draw_idle()
 
+    @timed('mouse move')
     def _onMouseMove(self, event):
+        if self._crosshair:
+            self._updateCrosshair(event)
+            self._pendingRefresh = True
+            self.frames.schedule()
         if event.inaxes == self.axes['main']:
             pos = self._getAxisCoordinatesFromEvent(event)
             if self.tool == 'OrthoXSection':
                 if self.orthoXSectionlive == True:
-                    self.orhtoXSectionPos = pos
-                    self._updateXSections()
+                    self._requestXSectionPos(pos)
 
 
+    @timed('mouse down')
     def _onMouseDown(self, event):
         # only capture click events for the main figure
         if event.inaxes == self.axes['main']:
@@ -476,12 +1231,15 @@ class CrossSectionWidget(FigureCanvas, BasePlot):
                         self._drawingLine = False
                         self._customLineExists = True
                         self.fig.canvas.draw_idle()
-                        self._customXPoints, self._customYPoints = self._interpolate()
-                        self.drawCustomXSection(self.axes['custom'])
+                        self.executor.submit('custom cross section',
+                                             self._customLineSampler(),
+                                             onResult=self._onCustomXSection)
 
                 elif self.tool == 'OrthoXSection':
                     # using the parallel cross section tool
                     self.orthoXSectionlive = False
+                    # the click position takes precedence over pending moves
+                    self._pendingPos = None
                     self.orhtoXSectionPos = pos
                     self._updateStaticCursor()
                     self._updateXSections()
@@ -491,20 +1249,26 @@ class CrossSectionWidget(FigureCanvas, BasePlot):
                     self.orthoXSectionlive = True
 
 
+    @timed('key press')
     def _onKeyPress(self, event):
         if self.tool == 'CustomXSection':
             pass
         elif self.tool == 'OrthoXSection':
+            # continue from a position that has been requested but not yet
+            # rendered, so that no key press of a held key gets lost
+            pos = list(self._pendingPos or self.orhtoXSectionPos)
             if event.key == 'left':
-                self.orhtoXSectionPos[0] = self.orhtoXSectionPos[0]-1
+                pos[0] = pos[0]-1
             elif event.key == 'right':
-                self.orhtoXSectionPos[0] = self.orhtoXSectionPos[0]+1
+                pos[0] = pos[0]+1
             if event.key == 'up':
-                self.orhtoXSectionPos[1] = self.orhtoXSectionPos[1]+1
+                pos[1] = pos[1]+1
             elif event.key == 'down':
-                self.orhtoXSectionPos[1] = self.orhtoXSectionPos[1]-1
-            self._updateStaticCursor()
-            self._updateXSections()
+                pos[1] = pos[1]-1
+            pos[0] = min(max(pos[0], 0), len(self.traces[0]['config']['xaxis'])-1)
+            pos[1] = min(max(pos[1], 0), len(self.traces[0]['config']['yaxis'])-1)
+            self._pendingStaticCursor = True
+            self._requestXSectionPos(pos)
 
     def _onRectangleSelected(self,eclick, erelease):
         x1, y1 = eclick.xdata, eclick.ydata
@@ -513,21 +1277,33 @@ class CrossSectionWidget(FigureCanvas, BasePlot):
         x1, y1 = self._data2index([x1, y1])
         x2, y2 = self._data2index([x2, y2])
         self._rectangleSelection=np.array([[x1, y1], [x2, y2]])
+        self._showRegionStats(self._rectangleSelection)
         # print("(%3.2f, %3.2f) --> (%3.2f, %3.2f)" % (x1, y1, x2, y2))
 
-    def _interpolate(self ):
-        f = interp2d(self.traces[0]['config']['xaxis'],
-                     self.traces[0]['config']['yaxis'],
-                     self.traces[0]['config']['z'])
-        start = self._customLine[0,:]
-        end = self._customLine[1,:]
-        maxV = np.hypot(end[0]-start[0],end[1]-start[1])
-        r2 = np.expand_dims(end-start,1)
-        s2 = np.expand_dims(start,1)
+    def _getLineProfile(self):
+        # scipy is only imported once a custom cross section is requested
+        from ..lineprofile import LineProfile
+        z = self.traces[0]['config']['z']
+        if self._lineProfile is None or self._lineProfile.z is not z:
+            self._lineProfile = LineProfile(self.traces[0]['config']['xaxis'],
+                                            self.traces[0]['config']['yaxis'],
+                                            z)
+        return self._lineProfile
+
+    def _customLineSampler(self):
+        # returns a function sampling the current custom cross section, that
+        # can be run on a worker thread as it does not access the widget
+        profile = self._getLineProfile()
         lp = self._customLinePos
         numPoints = np.hypot(lp[0,0]-lp[1,0],lp[0,1]-lp[1,1])
-        xPoints = np.linspace(0,maxV, numPoints)
-        p = np.linspace(0,1,numPoints)
-        points = s2 + np.kron(r2,p)
-        # ok this is dirty but it should work
-        return xPoints, np.transpose(np.diag(f(points[0,:],points[1,:])))
+        start = np.array(self._customLine[0,:])
+        end = np.array(self._customLine[1,:])
+        method = self.customXSectionMethod
+        width = self.customXSectionWidth
+        def sample(task=None):
+            return profile.sample(start, end, numPoints=numPoints,
+                                  method=method, width=width)
+        return sample
+
+    def _interpolate(self ):
+        return self._customLineSampler()()
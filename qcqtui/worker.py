@@ -0,0 +1,154 @@
+import traceback
+
+from PyQt5.QtCore import QObject, QRunnable, QThreadPool, pyqtSignal
+
+
+class TaskCancelled(Exception):
+    """Raised inside a task to stop it after it has been cancelled."""
+
+
+class _TaskSignals(QObject):
+    # QRunnable is not a QObject, so the signals of a task live here
+    progress = pyqtSignal(object, int)
+    partial = pyqtSignal(object, object)
+    result = pyqtSignal(object, object)
+    failed = pyqtSignal(object, str)
+
+
+class Task(QRunnable):
+    """A computation run by a TaskExecutor on a thread of a QThreadPool.
+
+    The function is called with the given arguments and the keyword
+    argument task, through which it can report progress, publish partial
+    results and check for cancellation.
+    """
+    def __init__(self, name, func, args, kwargs, onResult=None, onPartial=None):
+        QRunnable.__init__(self)
+        self.name = name
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.onResult = onResult
+        self.onPartial = onPartial
+        self.signals = _TaskSignals()
+        self._cancelled = False
+
+    def cancel(self):
+        self._cancelled = True
+
+    def isCancelled(self):
+        return self._cancelled
+
+    def checkCancelled(self):
+        """Stop the task by raising TaskCancelled if it has been cancelled."""
+        if self._cancelled:
+            raise TaskCancelled()
+
+    def setProgress(self, percent):
+        self.checkCancelled()
+        self.signals.progress.emit(self, int(percent))
+
+    def publish(self, value):
+        """Hand an intermediate result to the onPartial callback."""
+        self.checkCancelled()
+        self.signals.partial.emit(self, value)
+
+    def run(self):
+        try:
+            result = self.func(*self.args, task=self, **self.kwargs)
+        except TaskCancelled:
+            return
+        except Exception:
+            self.signals.failed.emit(self, traceback.format_exc())
+        else:
+            self.signals.result.emit(self, result)
+
+
+class TaskExecutor(QObject):
+    """Runs computations off the GUI thread.
+
+    There is at most one task per name. Submitting a task cancels the
+    task of the same name that is still running, whose result is then
+    discarded. The onResult and onPartial callbacks of a task and all
+    signals of the executor are invoked on the thread the executor lives
+    in, usually the GUI thread.
+
+    Args:
+        parent: parent QObject
+        pool: QThreadPool to run the tasks on, the global instance by
+            default
+        synchronous: run the tasks directly in the calling thread, e.g.
+            for rendering without an event loop
+    """
+    # name of the task and its progress in percent
+    progress = pyqtSignal(str, int)
+    finished = pyqtSignal(str)
+    # name of the task and the formatted traceback
+    failed = pyqtSignal(str, str)
+
+    def __init__(self, parent=None, pool=None, synchronous=False):
+        QObject.__init__(self, parent)
+        self._pool = pool or QThreadPool.globalInstance()
+        self.synchronous = synchronous
+        self._tasks = dict()
+
+    def submit(self, name, func, *args, onResult=None, onPartial=None, **kwargs):
+        self.cancel(name)
+        task = Task(name, func, args, kwargs, onResult, onPartial)
+        if self.synchronous:
+            if onPartial is not None:
+                task.signals.partial.connect(lambda task, value: onPartial(value))
+            result = func(*args, task=task, **kwargs)
+            if onResult is not None:
+                onResult(result)
+            self.finished.emit(name)
+            return task
+        task.signals.progress.connect(self._onProgress)
+        task.signals.partial.connect(self._onPartial)
+        task.signals.result.connect(self._onResult)
+        task.signals.failed.connect(self._onFailed)
+        # keeping the reference also keeps the python object alive while
+        # the pool runs it
+        self._tasks[name] = task
+        self._pool.start(task)
+        return task
+
+    def cancel(self, name):
+        task = self._tasks.pop(name, None)
+        if task is not None:
+            task.cancel()
+
+    def cancelAll(self):
+        for name in list(self._tasks.keys()):
+            self.cancel(name)
+
+    def isRunning(self, name):
+        return name in self._tasks
+
+    def waitForDone(self, msecs=-1):
+        return self._pool.waitForDone(msecs)
+
+    def _isCurrent(self, task):
+        return self._tasks.get(task.name) is task and not task.isCancelled()
+
+    def _onProgress(self, task, percent):
+        if self._isCurrent(task):
+            self.progress.emit(task.name, percent)
+
+    def _onPartial(self, task, value):
+        if self._isCurrent(task) and task.onPartial is not None:
+            task.onPartial(value)
+
+    def _onResult(self, task, result):
+        if not self._isCurrent(task):
+            return
+        del self._tasks[task.name]
+        if task.onResult is not None:
+            task.onResult(result)
+        self.finished.emit(task.name)
+
+    def _onFailed(self, task, message):
+        if not self._isCurrent(task):
+            return
+        del self._tasks[task.name]
+        self.failed.emit(task.name, message)
@@ -0,0 +1,88 @@
+import numpy as np
+import pytest
+
+from qcqtui.axisindex import AxisIndex
+
+
+def nearest(axis, values):
+    # the reference lookup, the first of equally near setpoints
+    with np.errstate(invalid='ignore'):
+        return np.nanargmin(np.abs(axis[None, :] - values[:, None]), axis=1)
+
+
+def queries(axis, n=1000, seed=0):
+    # values within and beyond the range of the axis and the setpoints
+    # themselves
+    finite = axis[np.isfinite(axis)]
+    lo, hi = finite.min(), finite.max()
+    margin = 0.1 * ((hi - lo) or 1)
+    values = np.random.default_rng(seed).uniform(lo - margin, hi + margin, n)
+    return np.concatenate([values, finite])
+
+
+@pytest.mark.parametrize('axis', [
+    np.linspace(-1, 1, 101),
+    np.linspace(3, -2, 50),
+    np.array([0.5]),
+])
+def test_uniform(axis):
+    index = AxisIndex(axis)
+    assert index.kind == 'uniform'
+    values = queries(axis)
+    np.testing.assert_array_equal(index.index(values), nearest(axis, values))
+
+
+@pytest.mark.parametrize('axis', [
+    np.logspace(-3, 0, 80),
+    -np.logspace(-3, 0, 80),
+])
+def test_monotonic(axis):
+    index = AxisIndex(axis)
+    assert index.kind == 'monotonic'
+    values = queries(axis)
+    np.testing.assert_array_equal(index.index(values), nearest(axis, values))
+
+
+@pytest.mark.parametrize('axis', [
+    # back and forth sweep, the setpoints occur twice
+    np.concatenate([np.linspace(0, 1, 30), np.linspace(1, 0, 30)]),
+    np.random.default_rng(1).permutation(np.linspace(-5, 5, 64)),
+    # interrupted sweep with a gap
+    np.array([0.0, 0.1, np.nan, 0.3, 0.4]),
+])
+def test_unsorted(axis):
+    index = AxisIndex(axis)
+    assert index.kind == 'unsorted'
+    values = queries(axis)
+    found = index.index(values)
+    assert np.isfinite(axis[found]).all()
+    # equally near setpoints may be found at other indices
+    np.testing.assert_array_equal(np.abs(axis[found] - values),
+                                  np.abs(axis[nearest(axis, values)] - values))
+
+
+def test_partialUniform():
+    # a running sweep, the setpoints not reached yet are extrapolated
+    axis = np.linspace(0, 1, 21)
+    axis[8:] = np.nan
+    index = AxisIndex(axis)
+    assert index.kind == 'uniform'
+    np.testing.assert_allclose(index.values, np.linspace(0, 1, 21))
+    values = queries(index.values)
+    np.testing.assert_array_equal(index.index(values), nearest(index.values, values))
+
+
+def test_partialNonUniform():
+    # only the setpoints reached so far are returned
+    axis = np.full(20, np.nan)
+    axis[:6] = np.logspace(0, 1, 6)
+    index = AxisIndex(axis)
+    assert index.kind == 'unsorted'
+    values = queries(axis)
+    np.testing.assert_array_equal(index.index(values), nearest(axis, values))
+
+
+def test_scalar():
+    index = AxisIndex(np.linspace(0, 1, 11))
+    assert index.index(0.52) == 5
+    assert isinstance(index.index(0.52), int)
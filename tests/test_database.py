@@ -0,0 +1,167 @@
+import json
+import sqlite3
+
+import numpy as np
+import pytest
+
+pytest.importorskip('qcodes')
+QtCore = pytest.importorskip('PyQt5.QtCore')
+
+from qcqtui.database import RunFollower, RunReader
+
+# a 2D sweep of y in the outer and x in the inner loop
+X = np.linspace(0, 1, 5)
+Y = np.linspace(0, 2, 6)
+
+
+def values(y, x):
+    return 10 * y + x
+
+
+def createRun(path, shape=None):
+    # the tables of a QCoDeS database used by the reader, for a run of z
+    # depending on y and x
+    conn = sqlite3.connect(str(path))
+    conn.execute('CREATE TABLE runs (run_id INTEGER PRIMARY KEY, '
+                 'result_table_name TEXT, is_completed BOOL, '
+                 'run_description TEXT)')
+    conn.execute('CREATE TABLE layouts (layout_id INTEGER PRIMARY KEY, '
+                 'run_id INTEGER, parameter TEXT, label TEXT, unit TEXT)')
+    conn.execute('CREATE TABLE dependencies (dependent INTEGER, '
+                 'independent INTEGER, axis_num INTEGER)')
+    conn.execute('CREATE TABLE "results-1" (id INTEGER PRIMARY KEY, '
+                 'y REAL, x REAL, z REAL)')
+    description = json.dumps({'shapes': {'z': list(shape)}} if shape else {})
+    conn.execute('INSERT INTO runs VALUES (1, "results-1", 0, ?)', (description, ))
+    conn.executemany('INSERT INTO layouts VALUES (?, 1, ?, ?, ?)',
+                     [(1, 'y', 'Y', 'V'), (2, 'x', 'X', 'V'), (3, 'z', 'Z', 'A')])
+    conn.executemany('INSERT INTO dependencies VALUES (3, ?, ?)',
+                     [(1, 0), (2, 1)])
+    conn.commit()
+    return conn
+
+
+def appendPoints(conn, start, stop):
+    # the points start to stop of the sweep in the order they are measured
+    k = np.arange(start, stop)
+    y, x = Y[k // len(X)], X[k % len(X)]
+    conn.executemany('INSERT INTO "results-1" (y, x, z) VALUES (?, ?, ?)',
+                     zip(y, x, values(y, x)))
+    conn.commit()
+
+
+def complete(conn):
+    conn.execute('UPDATE runs SET is_completed=1')
+    conn.commit()
+
+
+def expected(rows):
+    return values(Y[:rows, None], X[None, :])
+
+
+@pytest.fixture
+def app():
+    return QtCore.QCoreApplication.instance() or QtCore.QCoreApplication([])
+
+
+def test_pagedRead(tmp_path):
+    path = tmp_path / 'runs.db'
+    conn = createRun(path)
+    appendPoints(conn, 0, len(X) * len(Y))
+    complete(conn)
+    reader = RunReader(str(path), 1, pageSize=3)
+    assert reader.read() == (0, len(Y))
+    assert reader.read() is None
+    assert reader.isExhausted()
+    y, x, z = reader.arrays
+    np.testing.assert_array_equal(y.ndarray, Y)
+    np.testing.assert_array_equal(x.ndarray, np.tile(X, (len(Y), 1)))
+    np.testing.assert_array_equal(z.ndarray, expected(len(Y)))
+    assert [a.array_id for a in z.set_arrays] == ['y', 'x']
+    reader.close()
+
+
+def test_storedShape(tmp_path):
+    path = tmp_path / 'runs.db'
+    conn = createRun(path, shape=(len(Y), len(X)))
+    # less than a row, the shape is known anyway
+    appendPoints(conn, 0, 3)
+    reader = RunReader(str(path), 1, pageSize=2)
+    assert reader.shape == (len(Y), len(X))
+    assert reader.read() == (0, 1)
+    assert reader.arrays[2].ndarray.shape == (len(Y), len(X))
+    np.testing.assert_array_equal(reader.arrays[2].ndarray[0, :3], values(Y[0], X[:3]))
+    assert np.isnan(reader.arrays[2].ndarray[0, 3:]).all()
+    reader.close()
+
+
+def test_inferredShape(tmp_path):
+    path = tmp_path / 'runs.db'
+    conn = createRun(path)
+    appendPoints(conn, 0, 3)
+    reader = RunReader(str(path), 1, pageSize=2)
+    assert reader.shape is None
+    # the length of the inner loop is not known before the first row is
+    # complete
+    assert reader.read() is None
+    assert reader.arrays is None
+    appendPoints(conn, 3, 7)
+    assert reader.read() == (0, 2)
+    # room for twice the rows written so far
+    assert reader.shape == (4, len(X))
+    np.testing.assert_array_equal(reader.arrays[2].ndarray[0], expected(1)[0])
+    reader.close()
+
+
+def test_followGrowsAndTrims(app, tmp_path):
+    path = tmp_path / 'runs.db'
+    conn = createRun(path)
+    appendPoints(conn, 0, 7)
+    follower = RunFollower(str(path), 1)
+    follower.reader.pageSize = 4
+    started, updated, finished = [], [], []
+    follower.started.connect(started.append)
+    follower.updated.connect(lambda start, stop: updated.append((start, stop)))
+    follower.finished.connect(lambda: finished.append(True))
+
+    def poll():
+        # read the points written since the last poll, the timer is run
+        # by hand as long as it asks for the next page
+        follower.poll()
+        while follower.isActive() and follower._timer.interval() == 0:
+            follower._timer.stop()
+            follower.poll()
+
+    poll()
+    assert len(started) == 1
+    assert started[0].arrays['z'].ndarray.shape == (4, len(X))
+
+    appendPoints(conn, 7, 12)
+    poll()
+    assert len(started) == 1
+    assert updated[-1] == (1, 3)
+
+    # more rows than the arrays have room for
+    appendPoints(conn, 12, 26)
+    poll()
+    assert len(started) == 2
+    dataSet = started[-1]
+    assert dataSet.arrays['z'].ndarray.shape == (8, len(X))
+    np.testing.assert_array_equal(dataSet.arrays['z'].ndarray[:5], expected(5))
+    assert dataSet.arrays['z'].ndarray[5, 0] == values(Y[5], X[0])
+    assert dataSet.metadata['run_id'] == 1
+
+    appendPoints(conn, 26, 30)
+    complete(conn)
+    poll()
+    assert finished == [True]
+    # trimmed to the rows of the completed run
+    assert len(started) == 3
+    z = started[-1].arrays['z']
+    assert z.ndarray.shape == (len(Y), len(X))
+    np.testing.assert_array_equal(z.ndarray, expected(len(Y)))
+    # the arrays keep their ids in the data set
+    assert sorted(started[-1].arrays) == ['x', 'y', 'z']
+    assert [a.array_id for a in z.set_arrays] == ['y', 'x']
+    follower.stop()
+    conn.close()
@@ -0,0 +1,62 @@
+import os
+
+import numpy as np
+import pytest
+
+pytest.importorskip('qcodes')
+
+from qcodes.data.data_array import DataArray
+from qcodes.data.data_set import load_data, new_data
+
+from qcqtui.datacache import DataSetCache
+from qcqtui.loader import loadDataSet
+
+
+def writeDataSet(location, snapshot=True):
+    # a 2D sweep of two channels, written by qcodes with the GNUPlot format
+    x = np.linspace(0, 1, 5)
+    y = np.linspace(0, 2, 4)
+    Y = DataArray(name='y', label='Y', unit='V', array_id='gate_y',
+                  preset_data=y, is_setpoint=True)
+    X = DataArray(name='x', label='X', unit='V', array_id='gate_x',
+                  preset_data=np.tile(x, (len(y), 1)), set_arrays=(Y,),
+                  is_setpoint=True)
+    arrays = [Y, X]
+    for i in range(2):
+        arrays.append(DataArray(name='v{}'.format(i), label='V', unit='V',
+                                array_id='dmm_v{}'.format(i),
+                                preset_data=np.outer(y, x) + i,
+                                set_arrays=(Y, X)))
+    dataSet = new_data(arrays=arrays, location=location)
+    dataSet.finalize()
+    if not snapshot:
+        # without the snapshot the arrays read back have no names
+        os.remove(os.path.join(location, 'snapshot.json'))
+
+
+def checkRoundTrip(tmp_path, snapshot):
+    location = str(tmp_path / 'run')
+    writeDataSet(location, snapshot)
+    expected = load_data(location)
+    cache = DataSetCache(str(tmp_path / 'cache'))
+    for i in range(2):
+        # parsed and stored the first time, read from the cache the second,
+        # both times the arrays are memory maps of the cached copy
+        dataSet = loadDataSet(location, cache=cache)
+        assert list(dataSet.arrays) == list(expected.arrays)
+        for arrayId, array in expected.arrays.items():
+            cached = dataSet.arrays[arrayId]
+            assert cached.name == array.name
+            assert cached.is_setpoint == array.is_setpoint
+            assert [a.array_id for a in cached.set_arrays] == \
+                [a.array_id for a in array.set_arrays]
+            np.testing.assert_array_equal(cached.ndarray, array.ndarray)
+            assert isinstance(cached.ndarray, np.memmap)
+
+
+def test_roundTrip(tmp_path):
+    checkRoundTrip(tmp_path, snapshot=True)
+
+
+def test_roundTripWithoutNames(tmp_path):
+    checkRoundTrip(tmp_path, snapshot=False)
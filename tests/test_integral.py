@@ -0,0 +1,58 @@
+import numpy as np
+import pytest
+
+from qcqtui.integral import IntegralImage
+
+
+def data(missing):
+    # values with a large offset, as of a lock-in signal
+    z = 1e6 + np.random.default_rng(0).normal(size=(37, 53))
+    if missing:
+        z[30:, :] = np.nan
+        z[5, 10:20] = np.nan
+    return z
+
+
+def direct(z, section):
+    # the values of the section by slicing, section as [[x1, y1], [x2, y2]]
+    if section is None:
+        return z
+    (x1, y1), (x2, y2) = section
+    return z[y1:y2, x1:x2]
+
+
+sections = [None, [[0, 0], [53, 37]], [[3, 4], [20, 31]], [[25, 5], [26, 6]],
+            [[20, 31], [3, 4]], [[40, 0], [60, 50]]]
+
+
+@pytest.mark.parametrize('missing', [False, True])
+@pytest.mark.parametrize('section', sections)
+def test_stats(missing, section):
+    z = data(missing)
+    integral = IntegralImage(z)
+    values = direct(z, np.sort(section, axis=0) if section else None)
+    values = values[np.isfinite(values)]
+    stats = integral.stats(section)
+    assert stats['count'] == len(values)
+    np.testing.assert_allclose(stats['sum'], values.sum(), rtol=1e-12)
+    np.testing.assert_allclose(stats['mean'], values.mean(), rtol=1e-12)
+    np.testing.assert_allclose(stats['variance'], values.var(), rtol=1e-6, atol=1e-12)
+
+
+def test_empty():
+    z = data(missing=True)
+    stats = IntegralImage(z).stats([[0, 30], [53, 37]])
+    assert stats['count'] == 0
+    assert np.isnan(stats['mean'])
+
+
+@pytest.mark.parametrize('missing', [False, True])
+def test_projections(missing):
+    z = data(missing)
+    x1, y1, x2, y2 = 3, 4, 20, 33
+    columns, rows = IntegralImage(z).projections([[x1, y1], [x2, y2]])
+    section = z[y1:y2, x1:x2]
+    np.testing.assert_allclose(columns[x1:x2], np.nansum(section, axis=0), rtol=1e-12)
+    np.testing.assert_allclose(rows[y1:y2], np.nansum(section, axis=1), rtol=1e-12)
+    assert np.isnan(np.delete(columns, np.arange(x1, x2))).all()
+    assert np.isnan(np.delete(rows, np.arange(y1, y2))).all()
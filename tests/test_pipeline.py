@@ -0,0 +1,100 @@
+import numpy as np
+
+from qcqtui.pipeline import Pipeline, Stage
+
+# calls of the processing functions, as (name, parameter)
+calls = []
+
+
+def add(z, offset, task=None):
+    calls.append(('add', offset))
+    return z + offset
+
+
+def scale(z, factor, task=None):
+    calls.append(('scale', factor))
+    return z * factor
+
+
+def setup():
+    del calls[:]
+    # results of 800 bytes
+    return Pipeline(np.zeros(100), maxBytes=2000)
+
+
+def test_cacheHit():
+    pipeline = setup()
+    pipeline.stages = [Stage('add', add, offset=1), Stage('scale', scale, factor=2)]
+    np.testing.assert_array_equal(pipeline.output(), 2)
+    assert calls == [('add', 1), ('scale', 2)]
+    np.testing.assert_array_equal(pipeline.output(), 2)
+    assert calls == [('add', 1), ('scale', 2)]
+
+
+def test_changedStage():
+    # only the changed stage and the ones after it are computed again
+    pipeline = setup()
+    first = Stage('add', add, offset=1)
+    pipeline.stages = [first, Stage('scale', scale, factor=2)]
+    pipeline.output()
+    pipeline.stages = [first, pipeline.stages[1].replace(factor=3)]
+    np.testing.assert_array_equal(pipeline.output(), 3)
+    assert calls == [('add', 1), ('scale', 2), ('scale', 3)]
+    z, remaining = pipeline.recipe([first, Stage('scale', scale, factor=4)])
+    np.testing.assert_array_equal(z, 1)
+    assert [stage.params for stage in remaining] == [{'factor': 4}]
+
+
+def test_undo():
+    # returning to earlier stages finds their results in the cache
+    pipeline = setup()
+    stages = [Stage('add', add, offset=1), Stage('scale', scale, factor=2)]
+    pipeline.stages = stages
+    pipeline.output()
+    pipeline.stages = stages[:1]
+    np.testing.assert_array_equal(pipeline.output(), 1)
+    pipeline.stages = []
+    assert pipeline.output() is pipeline.original
+    assert len(calls) == 2
+
+
+def test_eviction():
+    # two results fit into the budget, the least recently used is evicted
+    pipeline = setup()
+    a, b, c = [[Stage('add', add, offset=i)] for i in range(3)]
+    for stages in (a, b):
+        pipeline.stages = stages
+        pipeline.output()
+    # a becomes the most recently used
+    assert pipeline.cached(a) is not None
+    pipeline.stages = c
+    pipeline.output()
+    assert pipeline.size() <= pipeline.maxBytes
+    assert pipeline.cached(a) is not None
+    assert pipeline.cached(b) is None
+    assert pipeline.cached(c) is not None
+    pipeline.stages = b
+    pipeline.output()
+    assert calls == [('add', 0), ('add', 1), ('add', 2), ('add', 1)]
+
+
+def test_tooLarge():
+    # results beyond the budget are not cached
+    pipeline = setup()
+    pipeline.maxBytes = 500
+    pipeline.stages = [Stage('add', add, offset=1)]
+    pipeline.output()
+    pipeline.output()
+    assert pipeline.size() == 0
+    assert len(calls) == 2
+
+
+def test_invalidate():
+    pipeline = setup()
+    pipeline.stages = [Stage('add', add, offset=1)]
+    pipeline.output()
+    pipeline.original[:] = 5
+    pipeline.invalidate()
+    assert pipeline.size() == 0
+    np.testing.assert_array_equal(pipeline.output(), 6)
+    assert len(calls) == 2
@@ -0,0 +1,73 @@
+import numpy as np
+import pytest
+
+from qcqtui.processing import lineFit, planeFit
+
+# non uniform setpoints with a large offset, as of a gate voltage
+X = 1e3 + np.cumsum(np.random.default_rng(0).uniform(0.5, 1.5, 40))
+Y = np.linspace(-2, 3, 30)
+
+
+def plane():
+    return 0.3 + 0.02 * X[None, :] - 1.5 * Y[:, None]
+
+
+@pytest.mark.parametrize('section', [
+    np.array([[0, 0], [40, 30]]),
+    np.array([[5, 10], [20, 25]]),
+])
+def test_planeFitRemovesPlane(section):
+    residual = planeFit(X, Y, plane(), section)
+    np.testing.assert_allclose(residual, 0, atol=1e-8)
+
+
+def test_planeFitSkipsMissingValues():
+    z = plane()
+    z[20:, :] = np.nan
+    z[3, 7] = np.inf
+    residual = planeFit(X, Y, z, np.array([[0, 0], [40, 30]]))
+    finite = np.isfinite(z)
+    np.testing.assert_allclose(residual[finite], 0, atol=1e-8)
+    assert not np.isfinite(residual[~finite]).any()
+
+
+def test_planeFitMatchesLeastSquares():
+    z = plane() + np.random.default_rng(1).normal(size=(len(Y), len(X)))
+    section = np.array([[5, 10], [20, 25]])
+    residual = planeFit(X, Y, z, section)
+    gx, gy = np.meshgrid(X, Y)
+    rows, columns = slice(10, 25), slice(5, 20)
+    design = np.column_stack([np.ones(gx[rows, columns].size),
+                              gx[rows, columns].ravel(), gy[rows, columns].ravel()])
+    coefficients = np.linalg.lstsq(design, z[rows, columns].ravel(), rcond=None)[0]
+    expected = z - (coefficients[0] + coefficients[1] * gx + coefficients[2] * gy)
+    np.testing.assert_allclose(residual, expected, atol=1e-8)
+
+
+@pytest.mark.parametrize('order', [1, 2])
+def test_lineFitRemovesLinesAlongX(order):
+    # every row has its own polynomial in x
+    rng = np.random.default_rng(2)
+    coefficients = rng.normal(size=(len(Y), order + 1))
+    t = X - X.mean()
+    z = coefficients @ (t[None, :] ** np.arange(order + 1)[:, None])
+    residual = lineFit(X, Y, z, order=order)
+    np.testing.assert_allclose(residual, 0, atol=1e-8)
+
+
+def test_lineFitRemovesLinesAlongY():
+    # every column has its own line in y
+    z = np.outer(Y, np.linspace(1, 2, len(X))) + X[None, :]
+    residual = lineFit(X, Y, z, axis='y')
+    np.testing.assert_allclose(residual, 0, atol=1e-8)
+
+
+def test_lineFitSection():
+    # only the columns of the section are fitted, with a missing value
+    z = plane()
+    z[:, 30:] += 5
+    z[4, 12] = np.nan
+    residual = lineFit(X, Y, z, np.array([[10, 0], [25, 30]]))
+    np.testing.assert_allclose(residual[:, :30], np.where(np.isnan(z[:, :30]), np.nan, 0),
+                               atol=1e-8)
+    np.testing.assert_allclose(residual[:, 30:], 5, atol=1e-8)